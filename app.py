@@ -1,27 +1,72 @@
-from flask import Flask, render_template, request
-import sqlite3
+import base64
+import json
+import time
+from datetime import date, timedelta
+from flask import Flask, Response, g, render_template, request, jsonify
+import metrics
+import storage
+from embedding_store import EmbeddingStore
+from inference import ISSUE_VERDICT
 
 app = Flask(__name__)
 
-def fetch_results(pr_id=None, author=None, sort_by="timestamp"):
-    """Fetch historical analysis results from the database with optional filters and sorting."""
-    conn = sqlite3.connect("code_analysis.db")  # Connect to the database
-    cursor = conn.cursor()
+RESULT_COLUMNS = ["id", "pull_request_id", "title", "author", "file_name", "pylint_score", "ai_analysis", "timestamp"]
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
 
-    # Build the base query
-    query = """
-        SELECT 
-            id, 
-            pull_request_id, 
-            title, 
-            author, 
-            file_name, 
-            pylint_score, 
-            ai_analysis, 
-            timestamp 
-        FROM pull_request_analysis
-        WHERE 1=1
+_embedding_store = None
+
+
+def encode_cursor(sort_value, row_id):
+    """Opaque `after` token pointing just past the given row."""
+    return base64.urlsafe_b64encode(json.dumps([sort_value, row_id]).encode()).decode()
+
+
+def decode_cursor(after):
+    """Inverse of encode_cursor; returns (sort_value, row_id) or None for a missing/invalid token."""
+    if not after:
+        return None
+    try:
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(after.encode()))
+        return sort_value, int(row_id)
+    except (ValueError, TypeError):
+        return None
+
+
+def escape_like(value):
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def record_request_timing(response):
+    """Time every request by route, so slow endpoints show up in /metrics."""
+    start = g.pop("request_start", None)
+    if start is not None:
+        endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+        metrics.observe("http_request_seconds", time.perf_counter() - start, method=request.method,
+                        endpoint=endpoint, status=response.status_code)
+    return response
+
+
+@metrics.timed("dashboard_query_seconds", query="fetch_results")
+def fetch_results(pr_id=None, author=None, sort_by="timestamp", limit=DEFAULT_PAGE_SIZE, after=None):
+    """
+    Fetch one page of historical analysis results with optional filters and sorting.
+    Pages are keyset-paginated on (sort column, id) so every page costs the same regardless of depth.
+    Returns (rows, next_cursor); next_cursor is None on the last page.
     """
+    cursor = storage.get_connection().cursor()  # Reused per thread; WAL lets reads run alongside the analyzer's writes
+    if sort_by not in ["pylint_score", "timestamp"]:
+        sort_by = "timestamp"
+    limit = max(1, min(int(limit or DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE))
+
+    # Build the base query
+    query = f"SELECT {', '.join(RESULT_COLUMNS)} FROM pull_request_analysis WHERE 1=1"
 
     # Add filters dynamically
     params = []
@@ -29,30 +74,230 @@ def fetch_results(pr_id=None, author=None, sort_by="timestamp"):
         query += " AND pull_request_id = ?"
         params.append(pr_id)
     if author:
-        query += " AND author LIKE ?"
-        params.append(f"%{author}%")
+        # Prefix match so the NOCASE author index can be used
+        query += " AND author LIKE ? ESCAPE '\\'"
+        params.append(f"{escape_like(author)}%")
+
+    position = decode_cursor(after)
+    rows = []
+    if position is None or position[0] is not None:
+        page_query = query
+        page_params = list(params)
+        if position is not None:
+            page_query += f" AND ({sort_by}, id) < (?, ?)"
+            page_params += list(position)
+        else:
+            page_query += f" AND {sort_by} IS NOT NULL"
+        page_query += f" ORDER BY {sort_by} DESC, id DESC LIMIT ?"
+        cursor.execute(page_query, page_params + [limit + 1])
+        rows = cursor.fetchall()
+        position = (None, None)
+
+    # Rows without a value for the sort column come last, ordered by id
+    if len(rows) <= limit:
+        null_query = query + f" AND {sort_by} IS NULL"
+        null_params = list(params)
+        if position[1] is not None:
+            null_query += " AND id < ?"
+            null_params.append(position[1])
+        null_query += " ORDER BY id DESC LIMIT ?"
+        cursor.execute(null_query, null_params + [limit + 1 - len(rows)])
+        rows += cursor.fetchall()
 
-    # Add sorting
-    if sort_by in ["pylint_score", "timestamp"]:
-        query += f" ORDER BY {sort_by} DESC"
-    else:
-        query += " ORDER BY timestamp DESC"
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(last[RESULT_COLUMNS.index(sort_by)], last[0])
+    return rows, next_cursor
 
-    cursor.execute(query, params)
-    rows = cursor.fetchall()
-    conn.close()
-    return rows
+
+def page_arguments():
+    """Read the filter, sort and pagination parameters shared by the HTML and JSON views."""
+    return {
+        "pr_id": request.args.get("pr_id"),  # Get the Pull Request ID from the URL parameters
+        "author": request.args.get("author"),  # Get the author filter from the URL parameters
+        "sort_by": request.args.get("sort_by", "timestamp"),  # Get the sorting option from the URL parameters
+        "limit": request.args.get("limit", DEFAULT_PAGE_SIZE, type=int),
+        "after": request.args.get("after")
+    }
 
 
 @app.route("/")
 def index():
-    """Homepage that displays historical results with optional filtering."""
-    pr_id = request.args.get("pr_id")  # Get the Pull Request ID from the URL parameters
-    author = request.args.get("author")  # Get the author filter from the URL parameters
-    sort_by = request.args.get("sort_by", "timestamp")  # Get the sorting option from the URL parameters
-    results = fetch_results(pr_id=pr_id, author=author, sort_by=sort_by)
-    return render_template("index.html", results=results, pr_id=pr_id, author=author, sort_by=sort_by)
+    """Homepage that displays historical results with optional filtering, one page at a time."""
+    args = page_arguments()
+    results, next_cursor = fetch_results(**args)
+    return render_template("index.html", results=results, next_cursor=next_cursor, **args)
+
+
+@app.route("/api/results")
+def api_results():
+    """JSON view of the same pages as the homepage."""
+    results, next_cursor = fetch_results(**page_arguments())
+    return jsonify({
+        "results": [dict(zip(RESULT_COLUMNS, row)) for row in results],
+        "next": next_cursor
+    })
+
+
+@metrics.timed("dashboard_query_seconds", query="fetch_trends")
+def fetch_trends(days=30):
+    """Daily file counts, average scores and score histograms for the last `days` days, from the rollup table."""
+    since = (date.today() - timedelta(days=max(int(days), 1) - 1)).isoformat()
+    cursor = storage.get_connection().execute("""
+        SELECT day, bucket, files, score_sum FROM daily_score_histogram
+        WHERE day >= ? ORDER BY day, bucket
+    """, (since,))
+    trends = {}
+    for day, bucket, files, score_sum in cursor:
+        entry = trends.setdefault(day, {"day": day, "files": 0, "score_sum": 0.0, "histogram": [0] * 11})
+        entry["files"] += files
+        entry["score_sum"] += score_sum
+        entry["histogram"][bucket] = files
+    for entry in trends.values():
+        entry["average_score"] = entry.pop("score_sum") / entry["files"] if entry["files"] else None
+    return list(trends.values())
+
+
+@metrics.timed("dashboard_query_seconds", query="fetch_leaderboard")
+def fetch_leaderboard(order_by="average_score", limit=20):
+    """Top authors by average or rolling Pylint score, read from the author_stats rollup."""
+    if order_by not in ["average_score", "rolling_score"]:
+        order_by = "average_score"
+    columns = ["author", "runs", "files", "average_score", "rolling_score", "issue_files", "last_analyzed"]
+    cursor = storage.get_connection().execute(f"""
+        SELECT {', '.join(columns)} FROM author_stats
+        WHERE {order_by} IS NOT NULL ORDER BY {order_by} DESC LIMIT ?
+    """, (max(1, min(int(limit), MAX_PAGE_SIZE)),))
+    return [dict(zip(columns, row)) for row in cursor]
+
+
+def fetch_pr_summary(pr_id):
+    """Latest per-PR rollup, or None if the PR has not been analyzed."""
+    columns = ["pull_request_id", "title", "author", "files", "scored_files", "overall_score", "issue_files",
+               "runs", "last_analyzed"]
+    row = storage.get_connection().execute(
+        f"SELECT {', '.join(columns)} FROM pr_summary WHERE pull_request_id = ?", (pr_id,)
+    ).fetchone()
+    return dict(zip(columns, row)) if row else None
+
+
+@app.route("/trends")
+def trends():
+    """Score trend chart and author leaderboard."""
+    days = request.args.get("days", 30, type=int)
+    order_by = request.args.get("order_by", "average_score")
+    return render_template("trends.html", trends=fetch_trends(days), leaderboard=fetch_leaderboard(order_by),
+                           days=days, order_by=order_by)
+
+
+@app.route("/api/trends")
+def api_trends():
+    return jsonify(fetch_trends(request.args.get("days", 30, type=int)))
+
+
+@app.route("/api/leaderboard")
+def api_leaderboard():
+    return jsonify(fetch_leaderboard(request.args.get("order_by", "average_score"),
+                                     request.args.get("limit", 20, type=int)))
+
+
+@app.route("/api/pull_requests/<int:pr_id>")
+def api_pr_summary(pr_id):
+    summary = fetch_pr_summary(pr_id)
+    if summary is None:
+        return jsonify({"error": f"PR #{pr_id} has not been analyzed"}), 404
+    return jsonify(summary)
+
+
+@app.route("/pull_requests/<int:pr_id>/report")
+def pr_report(pr_id):
+    """The untruncated analysis report the PR comment links to, as Markdown."""
+    row = storage.get_connection().execute(
+        "SELECT report FROM pr_reports WHERE pull_request_id = ?", (pr_id,)
+    ).fetchone()
+    if row is None:
+        return Response(f"PR #{pr_id} has not been analyzed\n", status=404, mimetype="text/plain")
+    return Response(row[0], mimetype="text/markdown; charset=utf-8")
+
+
+def embedding_store():
+    """The analyzer's snippet embedding store, opened once per process so its IVF index is loaded once."""
+    global _embedding_store
+    if _embedding_store is None:
+        _embedding_store = EmbeddingStore()
+    return _embedding_store
+
+
+@metrics.timed("dashboard_query_seconds", query="fetch_similar_findings")
+def fetch_similar_findings(pr_id, min_similarity=0.9, limit=5, issues_only=True):
+    """
+    For every file of a PR (as last analyzed), the most similar snippets of other pull requests found in
+    the embedding store; by default only those the model flagged as potential issues.
+    """
+    store = embedding_store()
+    latest = {}
+    for vector_row, file_name, ai_analysis, model in storage.get_connection().execute("""
+        SELECT vector_row, file_name, ai_analysis, model FROM snippet_embeddings
+        WHERE pull_request_id = ? ORDER BY vector_row
+    """, (pr_id,)):
+        latest[file_name] = (vector_row, ai_analysis, model)
+    if not latest:
+        return []
+    # Vectors of different models are not comparable
+    models = {model for _, _, model in latest.values()}
+
+    def accept(record):
+        return record["pull_request_id"] != pr_id and record["model"] in models and \
+            (not issues_only or record["ai_analysis"] == ISSUE_VERDICT)
+
+    limit = max(1, min(int(limit), 50))
+    queries = store.vectors()[[vector_row for vector_row, _, _ in latest.values()]]
+    findings = []
+    for (file_name, (_, ai_analysis, _)), matches in zip(latest.items(), store.neighbours(queries, limit, accept)):
+        similar = [match for match in matches if match["similarity"] >= min_similarity]
+        if similar:
+            findings.append({"file_name": file_name, "ai_analysis": ai_analysis, "similar": similar})
+    return findings
+
+
+@app.route("/pull_requests/<int:pr_id>/similar")
+def similar_findings(pr_id):
+    """Past findings in other pull requests that resemble this PR's files."""
+    min_similarity = request.args.get("min_similarity", 0.9, type=float)
+    issues_only = request.args.get("all") is None
+    findings = fetch_similar_findings(pr_id, min_similarity, request.args.get("limit", 5, type=int), issues_only)
+    return render_template("similar.html", pr_id=pr_id, findings=findings, min_similarity=min_similarity,
+                           issues_only=issues_only)
+
+
+@app.route("/api/pull_requests/<int:pr_id>/similar")
+def api_similar_findings(pr_id):
+    return jsonify(fetch_similar_findings(pr_id, request.args.get("min_similarity", 0.9, type=float),
+                                          request.args.get("limit", 5, type=int), request.args.get("all") is None))
+
+
+def fetch_pr_timings(pr_id, limit=20):
+    """The most recent per-run timing breakdowns recorded by the analyzer for a PR."""
+    cursor = storage.get_connection().execute("""
+        SELECT timestamp, total_seconds, breakdown FROM pr_timings
+        WHERE pull_request_id = ? ORDER BY timestamp DESC LIMIT ?
+    """, (pr_id, max(1, min(int(limit), MAX_PAGE_SIZE))))
+    return [{"timestamp": timestamp, "total_seconds": total_seconds, "breakdown": json.loads(breakdown)}
+            for timestamp, total_seconds, breakdown in cursor]
+
+
+@app.route("/api/pull_requests/<int:pr_id>/timings")
+def api_pr_timings(pr_id):
+    return jsonify(fetch_pr_timings(pr_id, request.args.get("limit", 20, type=int)))
+
+
+@app.route("/metrics")
+def prometheus_metrics():
+    """Request and query timings in the Prometheus text format."""
+    return Response(metrics.render_prometheus(), mimetype="text/plain; version=0.0.4")
 
 
 if __name__ == "__main__":
-    app.run(debug=True)
\ No newline at end of file
+    app.run(debug=True)
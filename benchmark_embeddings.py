@@ -0,0 +1,127 @@
+import argparse
+import json
+import os
+import resource
+import statistics
+import tempfile
+import time
+import numpy as np
+from benchmark_pipeline import environment
+from embedding_store import EmbeddingStore, calibrate, exact_search, normalize
+
+
+def synthetic_vectors(count, dim, clusters, rng, spread=0.35):
+    """Unit vectors scattered around `clusters` random directions, like embeddings of code in a few styles."""
+    centers = normalize(rng.standard_normal((clusters, dim)))
+    noise = rng.standard_normal((count, dim)) * spread / np.sqrt(dim)
+    return normalize(centers[rng.integers(0, clusters, count)] + noise)
+
+
+def latencies(search, queries):
+    """Milliseconds of one single-query search per query, as the analyzer issues them per file."""
+    times = []
+    for query in queries:
+        start = time.perf_counter()
+        search(query[None, :])
+        times.append((time.perf_counter() - start) * 1000)
+    return {"p50_ms": round(statistics.median(times), 2), "p95_ms": round(float(np.percentile(times, 95)), 2)}
+
+
+def run(count, dim, clusters, lists, nprobe, num_queries, exact_queries, seed=0, chunk_size=100000):
+    rng = np.random.default_rng(seed)
+    with tempfile.TemporaryDirectory() as directory:
+        store = EmbeddingStore(os.path.join(directory, "benchmark.db"), nprobe=nprobe, exact_below=count + 1)
+
+        start = time.perf_counter()
+        for offset in range(0, count, chunk_size):
+            vectors = synthetic_vectors(min(chunk_size, count - offset), dim, clusters, rng)
+            store.add(vectors, [(offset + i, f"file_{offset + i}.py", "benchmark", 0.5, "", None, None)
+                                for i in range(len(vectors))])
+        append_seconds = time.perf_counter() - start
+        vectors = store.vectors()
+
+        # Half the queries are lightly edited copies of stored snippets, half are new code
+        duplicates = rng.integers(0, count, num_queries // 2)
+        edited = normalize(np.asarray(vectors[duplicates], dtype=np.float32) +
+                           rng.standard_normal((len(duplicates), dim)) * 0.05 / np.sqrt(dim))
+        queries = np.concatenate([edited, synthetic_vectors(num_queries - len(edited), dim, clusters, rng)])
+
+        exact = latencies(lambda query: exact_search(vectors, query, 10), queries[:exact_queries])
+        true_rows, _ = exact_search(vectors, queries, 10)
+
+        start = time.perf_counter()
+        index = store.build_index(lists)
+        build_seconds = time.perf_counter() - start
+
+        ivf = latencies(lambda query: index.search(vectors, query, 10, nprobe), queries)
+        found_rows, _ = index.search(vectors, queries, 10, nprobe)
+        recall_at_1 = float(np.mean(found_rows[:, 0] == true_rows[:, 0]))
+        recall_at_10 = float(np.mean([len(set(found) & set(true)) / 10 for found, true in zip(found_rows, true_rows)]))
+        duplicates_found = float(np.mean(found_rows[:len(duplicates), 0] == duplicates))
+
+        return {
+            "vectors": count,
+            "dim": dim,
+            "lists": len(index.offsets) - 1,
+            "nprobe": nprobe,
+            "vector_file_mb": round(os.path.getsize(store.path) / 2 ** 20, 1),
+            "index_file_mb": round(os.path.getsize(store.index_path) / 2 ** 20, 1),
+            "append_seconds": round(append_seconds, 2),
+            "index_build_seconds": round(build_seconds, 2),
+            "exact_query": exact,
+            "ivf_query": ivf,
+            "ivf_recall_at_1": round(recall_at_1, 4),
+            "ivf_recall_at_10": round(recall_at_10, 4),
+            "edited_duplicates_found": round(duplicates_found, 4),
+            # ru_maxrss is in KiB on Linux
+            "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure embedding store index build and query times on synthetic vectors.")
+    parser.add_argument("--vectors", type=int, default=1000000)
+    parser.add_argument("--dim", type=int, default=768, help="Vector size (CodeBERT's hidden size).")
+    parser.add_argument("--clusters", type=int, default=4096, help="Directions the synthetic vectors gather around.")
+    parser.add_argument("--lists", type=int, default=None, help="IVF lists (default: square root of --vectors).")
+    parser.add_argument("--nprobe", type=int, default=16, help="IVF lists scanned per query.")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--exact-queries", type=int, default=10, help="Queries timed against the brute-force scan.")
+    parser.add_argument("--calibrate", action="store_true",
+                        help="Instead of timing, measure how similar one-token edits of this repository's "
+                             "functions stay under the embedding of --model, to choose --reuse-threshold.")
+    parser.add_argument("--model", default="microsoft/codebert-base", help="Checkpoint to calibrate (--calibrate).")
+    parser.add_argument("--files", default="*.py", help="Files whose functions are edited (--calibrate).")
+    parser.add_argument("--output", default="embeddings_report.json", help="Where to write the JSON report.")
+    args = parser.parse_args()
+
+    if args.calibrate:
+        from inference_backends import load_backend
+
+        result = calibrate(load_backend("torch", args.model), args.files)
+        result.pop("center")
+        print(f"{result['functions']} functions; unchanged copy: {result['unchanged']['min']} min similarity; "
+              f"nearest distinct function: {result['distinct_nearest']['p50']} median, "
+              f"{result['distinct_nearest']['max']} max")
+        for kind, stats in result["edits"].items():
+            print(f"{kind}: {stats['count']} edits, similarity {stats['min']} min / {stats['p50']} median / "
+                  f"{stats['max']} max")
+        if result["suggested_threshold"] is None:
+            print("Some edits are as similar as unchanged copies; leave verdict reuse off (--reuse-threshold off).")
+        else:
+            print(f"Suggested --reuse-threshold: {result['suggested_threshold']!r} (reuse above it)")
+        with open(args.output, "w") as f:
+            json.dump({"environment": environment(), "calibration": result}, f, indent=4)
+        print(f"Report written to {args.output}")
+        raise SystemExit
+
+    result = run(args.vectors, args.dim, args.clusters, args.lists, args.nprobe, args.queries, args.exact_queries)
+    print(f"{result['vectors']} x {result['dim']} float16 vectors ({result['vector_file_mb']} MB): "
+          f"IVF build {result['index_build_seconds']}s with {result['lists']} lists")
+    print(f"Exact query {result['exact_query']['p50_ms']}ms p50 / {result['exact_query']['p95_ms']}ms p95; "
+          f"IVF query {result['ivf_query']['p50_ms']}ms p50 / {result['ivf_query']['p95_ms']}ms p95 "
+          f"(nprobe {result['nprobe']}, recall@1 {result['ivf_recall_at_1']:.3f}, "
+          f"recall@10 {result['ivf_recall_at_10']:.3f})")
+    with open(args.output, "w") as f:
+        json.dump({"environment": environment(), "result": result}, f, indent=4)
+    print(f"Report written to {args.output}")
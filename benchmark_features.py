@@ -0,0 +1,49 @@
+import argparse
+import time
+from complexity_features import FEATURE_NAMES, extract_feature_columns
+from prepare_dataset import compute_complexity_tags
+
+
+def load_functions(data_path=None):
+    """The `func` column of every CodeXGLUE Defect Detection split, or the `code` of prepared shards."""
+    if data_path:
+        from dataset_shards import iter_samples
+
+        return [sample["code"] for sample in iter_samples(data_path)]
+    from datasets import load_dataset
+
+    dataset = load_dataset("code_x_glue_cc_defect_detection")
+    return [code or "" for name in ["train", "validation", "test"] for code in dataset[name]["func"]]
+
+
+def regex_tags(codes):
+    """The original path: one dict per sample from three scans of each function."""
+    return [compute_complexity_tags(code) for code in codes]
+
+
+def time_call(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the regex complexity tags with the single-pass extractor.")
+    parser.add_argument("--data", help="Prepared dataset shards; defaults to the full CodeXGLUE defect set.")
+    parser.add_argument("--num-proc", type=int, nargs="+", default=[1, 2, 4])
+    args = parser.parse_args()
+
+    codes = load_functions(args.data)
+    print(f"Benchmarking {len(codes)} functions ({sum(map(len, codes)) / 1e6:.1f}M characters)")
+
+    baseline, baseline_time = time_call(regex_tags, codes)
+    print(f"Regex tags: {baseline_time:.2f}s ({len(codes) / baseline_time:.0f} functions/sec)")
+
+    for num_proc in args.num_proc:
+        columns, extract_time = time_call(extract_feature_columns, codes, num_proc=num_proc)
+        lines_match = sum(int(a["num_lines"] == b) for a, b in zip(baseline, columns["num_lines"]))
+        ifs_match = sum(int(a["if_count"] == b) for a, b in zip(baseline, columns["if_count"]))
+        print(f"Single pass (num_proc={num_proc}): {extract_time:.2f}s "
+              f"({len(codes) / extract_time:.0f} functions/sec, {baseline_time / extract_time:.2f}x speedup, "
+              f"{len(FEATURE_NAMES)} features vs 3, "
+              f"num_lines agree on {lines_match}/{len(codes)}, if counts on {ifs_match}/{len(codes)})")
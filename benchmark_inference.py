@@ -0,0 +1,54 @@
+import argparse
+import glob
+import time
+import torch
+from fetch_pull_requests import load_model
+from inference import analyze_code_batch, verdict_from_probability, ISSUE_LABEL
+
+
+def load_snippets(pattern="*.py", repeat=4):
+    """Use the Python files of this repository as benchmark input."""
+    snippets = []
+    for path in sorted(glob.glob(pattern)):
+        with open(path, "r") as f:
+            snippets.append(f.read())
+    return snippets * repeat
+
+
+def analyze_one_by_one(snippets, tokenizer, model):
+    """The original per-file loop: batch size 1 and autograd left enabled."""
+    verdicts = []
+    for code_snippet in snippets:
+        inputs = tokenizer(code_snippet, return_tensors="pt", max_length=512, truncation=True)
+        outputs = model(**inputs)
+        predictions = torch.nn.functional.softmax(outputs.logits, dim=-1)
+        verdicts.append(verdict_from_probability(predictions[0][ISSUE_LABEL].item()))
+    return verdicts
+
+
+def time_call(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare per-file and batched CodeBERT inference on CPU.")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 16, 32])
+    parser.add_argument("--repeat", type=int, default=4, help="How many times to repeat the repository files.")
+    args = parser.parse_args()
+
+    tokenizer, model = load_model()
+    model.to("cpu")
+    snippets = load_snippets(repeat=args.repeat)
+    print(f"Benchmarking {len(snippets)} snippets on CPU")
+
+    baseline, baseline_time = time_call(analyze_one_by_one, snippets, tokenizer, model)
+    print(f"Per-file loop: {baseline_time:.2f}s ({len(snippets) / baseline_time:.2f} files/sec)")
+
+    for batch_size in args.batch_sizes:
+        verdicts, batch_time = time_call(analyze_code_batch, snippets, tokenizer, model, batch_size=batch_size)
+        matches = sum(a == b for a, b in zip(baseline, verdicts))
+        print(f"Batched (batch_size={batch_size}): {batch_time:.2f}s "
+              f"({len(snippets) / batch_time:.2f} files/sec, {baseline_time / batch_time:.2f}x speedup, "
+              f"{matches}/{len(snippets)} verdicts match)")
@@ -0,0 +1,205 @@
+import argparse
+import contextlib
+import glob
+import hashlib
+import io
+import itertools
+import json
+import os
+import platform
+import resource
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from multiprocessing import get_context
+
+STAGES = ["fetch", "pylint", "tokenize", "forward", "db_write", "render"]
+
+
+class FixtureFile:
+    """A changed file of the synthetic PR: a real file of this repository, added in full."""
+
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, "rb") as f:
+            content = f.read()
+        self.sha = hashlib.sha1(b"blob %d\0" % len(content) + content).hexdigest()
+        lines = content.decode(errors="replace").splitlines()
+        self.patch = f"@@ -0,0 +1,{len(lines)} @@\n" + "\n".join("+" + line for line in lines)
+
+
+class FixturePullRequest:
+    """Stand-in for a PyGithub pull request that records comments instead of posting them."""
+
+    def __init__(self, number, files):
+        self.number = number
+        self.title = f"Benchmark PR {number}"
+        self.user = type("User", (), {"login": "benchmark"})()
+        self.head = type("Head", (), {"sha": f"{number:040d}"})()
+        self.files = files
+        self.comments = []
+
+    def get_files(self):
+        return self.files
+
+    def create_issue_comment(self, body):
+        self.comments.append(body)
+
+
+def make_fixture(pattern="*.py", prs=1):
+    """Synthetic pull requests that each change every file matching `pattern`."""
+    files = [FixtureFile(path) for path in sorted(glob.glob(pattern)) if os.path.isfile(path)]
+    return [FixturePullRequest(number, files) for number in range(1, prs + 1)]
+
+
+def run_config(config):
+    """Run the analyzer stages over the fixture with one backend configuration; executed in a fresh process."""
+    import fetch_pull_requests as analyzer
+    from inference_backends import load_backend
+
+    seconds = dict.fromkeys(STAGES, 0.0)
+    start = time.perf_counter()
+    backend = load_backend(config["backend"], config["model"], batch_size=config["batch_size"])
+    backend.max_length = config["max_length"]
+    load_seconds = time.perf_counter() - start
+
+    # Time the forward passes inside run_ai_analysis; the rest of its time is tokenization and batching
+    forward = backend.forward
+
+    def timed_forward(*args):
+        begin = time.perf_counter()
+        result = forward(*args)
+        seconds["forward"] += time.perf_counter() - begin
+        return result
+
+    backend.score(["def warmup():\n    return 0\n"])
+    backend.forward = timed_forward
+
+    pulls = make_fixture(config["pattern"], config["prs"])
+    files = 0
+    with tempfile.TemporaryDirectory() as tmp, contextlib.redirect_stdout(io.StringIO()):
+        db_path = os.path.join(tmp, "benchmark.db")
+        for pr in pulls:
+            begin = time.perf_counter()
+            rows, pending = analyzer.fetch_pull_request_files(pr, config["mode"])
+            seconds["fetch"] += time.perf_counter() - begin
+
+            begin = time.perf_counter()
+            rows += analyzer.lint_and_prepare(pending, config["mode"], config["pylint_jobs"])
+            seconds["pylint"] += time.perf_counter() - begin
+
+            begin = time.perf_counter()
+            forward_before = seconds["forward"]
+            analyzer.run_ai_analysis(rows, backend, config["reducer"])
+            seconds["tokenize"] += time.perf_counter() - begin - (seconds["forward"] - forward_before)
+
+            begin = time.perf_counter()
+            analyzer.save_rows(pr, rows, db_path)
+            seconds["db_write"] += time.perf_counter() - begin
+
+            begin = time.perf_counter()
+            comment, _ = analyzer.render_comment(rows)
+            pr.create_issue_comment(comment)
+            seconds["render"] += time.perf_counter() - begin
+            files += len(rows)
+
+    total = sum(seconds.values())
+    inference = seconds["tokenize"] + seconds["forward"]
+    return {
+        **config,
+        "files": files,
+        "load_seconds": round(load_seconds, 4),
+        "stage_seconds": {name: round(value, 4) for name, value in seconds.items()},
+        "total_seconds": round(total, 4),
+        "files_per_second": round(files / total, 3) if total else None,
+        "inference_files_per_second": round(files / inference, 3) if inference else None,
+        # ru_maxrss is in KiB on Linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    }
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    try:
+        import torch
+        torch_version = torch.__version__
+    except ImportError:
+        torch_version = None
+    return {
+        "commit": commit or None,
+        "timestamp": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "torch": torch_version,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count()
+    }
+
+
+def config_key(result):
+    # Runs over a different synthetic workload are not comparable
+    return (result["backend"], result["batch_size"], result["max_length"], result["mode"], result["reducer"],
+            result.get("pattern"), result.get("prs"))
+
+
+def compare(results, baseline_path):
+    """Print the throughput change of every configuration also present in an earlier report."""
+    with open(baseline_path, "r") as f:
+        baseline = {config_key(result): result for result in json.load(f)["results"]}
+    for result in results:
+        previous = baseline.get(config_key(result))
+        if previous and previous["files_per_second"]:
+            change = result["files_per_second"] / previous["files_per_second"] - 1
+            print(f"{config_key(result)}: {previous['files_per_second']:.2f} -> "
+                  f"{result['files_per_second']:.2f} files/sec ({change * 100:+.1f}%)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the review pipeline offline on a synthetic PR.")
+    parser.add_argument("--model", default="microsoft/codebert-base",
+                        help="Model name or checkpoint directory (the ONNX export directory for --backends onnx).")
+    parser.add_argument("--backends", nargs="+", default=["torch"], choices=["torch", "int8", "onnx"])
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 16])
+    parser.add_argument("--max-lengths", type=int, nargs="+", default=[512])
+    parser.add_argument("--mode", choices=["full", "hunks"], default="full")
+    parser.add_argument("--reducer", choices=["max", "mean", "weighted"], default=None)
+    parser.add_argument("--files", default="*.py", help="Files of this repository that make up the synthetic PR.")
+    parser.add_argument("--prs", type=int, default=1, help="How many copies of the synthetic PR to analyze.")
+    parser.add_argument("--pylint-jobs", type=int, default=1)
+    parser.add_argument("--output", default="benchmark_report.json", help="Where to write the JSON report.")
+    parser.add_argument("--compare", help="An earlier report to compare throughput against.")
+    args = parser.parse_args()
+    if not any(os.path.isfile(path) for path in glob.glob(args.files)):
+        parser.error(f"--files {args.files!r} matches no file of this repository")
+    if args.prs < 1:
+        parser.error("--prs must be at least 1")
+
+    configs = [
+        {"backend": backend, "model": args.model, "batch_size": batch_size, "max_length": max_length,
+         "mode": args.mode, "reducer": args.reducer, "pattern": args.files, "prs": args.prs,
+         "pylint_jobs": args.pylint_jobs}
+        for backend, batch_size, max_length in itertools.product(args.backends, args.batch_sizes, args.max_lengths)
+    ]
+
+    # Every configuration runs in a new process so model loads and peak RSS do not leak between them
+    results = []
+    for config in configs:
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+            result = executor.submit(run_config, config).result()
+        results.append(result)
+        stages = ", ".join(f"{name} {value * 1000:.0f}ms" for name, value in result["stage_seconds"].items())
+        print(f"{result['backend']} batch_size={result['batch_size']} max_length={result['max_length']}: "
+              f"{result['files']} files, {result['files_per_second']} files/sec "
+              f"(inference {result['inference_files_per_second']} files/sec), "
+              f"peak RSS {result['peak_rss_mb']} MB; {stages}")
+
+    with open(args.output, "w") as f:
+        json.dump({"environment": environment(), "results": results}, f, indent=4)
+    print(f"Report written to {args.output}")
+
+    if args.compare:
+        compare(results, args.compare)
@@ -0,0 +1,64 @@
+import argparse
+import json
+import shlex
+import statistics
+import subprocess
+import sys
+import time
+from benchmark_pipeline import environment
+
+DEFAULT_COMMANDS = ["db migrate", "analyze --help", "evaluate --help", "export --help"]
+
+
+def parse_importtime(stderr):
+    """Top-level imports of a `python -X importtime` run with their cumulative time in ms, slowest first."""
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line.split("|")
+        # Nested imports are indented by two spaces per level under the module that triggered them
+        if cumulative.strip().isdigit() and not name[1:].startswith(" "):
+            imports.append((name.strip(), int(cumulative) / 1000))
+    return sorted(imports, key=lambda item: item[1], reverse=True)
+
+
+def measure(command, repeat=5, top=8):
+    """Wall time of `python cli.py <command>` over `repeat` fresh interpreters, plus its slowest imports."""
+    argv = [sys.executable, "-X", "importtime", "cli.py"] + shlex.split(command)
+    seconds = []
+    imports = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = subprocess.run(argv, capture_output=True, text=True)
+        seconds.append(time.perf_counter() - start)
+        imports = parse_importtime(result.stderr)
+    return {
+        "command": command,
+        "returncode": result.returncode,
+        "median_seconds": round(statistics.median(seconds), 4),
+        "min_seconds": round(min(seconds), 4),
+        "import_ms": round(sum(ms for _, ms in imports), 1),
+        "slowest_imports": [{"module": name, "cumulative_ms": round(ms, 1)} for name, ms in imports[:top]]
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure the startup time and import cost of each cli.py subcommand.")
+    parser.add_argument("--commands", nargs="+", default=DEFAULT_COMMANDS,
+                        help="Subcommands to time, each quoted with its arguments.")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", default="startup_report.json", help="Where to write the JSON report.")
+    args = parser.parse_args()
+
+    results = []
+    for command in args.commands:
+        result = measure(command, args.repeat)
+        results.append(result)
+        slowest = ", ".join(f"{item['module']} {item['cumulative_ms']:.0f}ms" for item in result["slowest_imports"][:4])
+        print(f"{command}: {result['median_seconds'] * 1000:.0f}ms median "
+              f"(imports {result['import_ms']:.0f}ms; {slowest})")
+
+    with open(args.output, "w") as f:
+        json.dump({"environment": environment(), "results": results}, f, indent=4)
+    print(f"Report written to {args.output}")
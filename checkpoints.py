@@ -0,0 +1,68 @@
+import json
+import os
+import struct
+import torch
+
+# safetensors dtype codes
+DTYPES = {
+    "F64": torch.float64, "F32": torch.float32, "F16": torch.float16, "BF16": torch.bfloat16,
+    "I64": torch.int64, "I32": torch.int32, "I16": torch.int16, "I8": torch.int8, "U8": torch.uint8,
+    "BOOL": torch.bool
+}
+
+
+def load_safetensors(path):
+    """
+    State dict of a .safetensors file whose tensors are views of one private memory map of the file:
+    nothing is read until a tensor is used, and pages are shared with the page cache instead of copied.
+    """
+    with open(path, "rb") as f:
+        header_size = struct.unpack("<Q", f.read(8))[0]
+        header = json.loads(f.read(header_size))
+    storage = torch.UntypedStorage.from_file(path, shared=False, nbytes=os.path.getsize(path))
+    data_start = 8 + header_size
+
+    state_dict = {}
+    for name, info in header.items():
+        if name == "__metadata__":
+            continue
+        dtype = DTYPES[info["dtype"]]
+        start, end = info["data_offsets"]
+        tensor = torch.empty(0, dtype=dtype)
+        if (data_start + start) % tensor.element_size():
+            # Misaligned for its dtype, so it cannot be a view; copy this one tensor
+            raw = storage[data_start + start:data_start + end]
+            state_dict[name] = torch.empty(0, dtype=torch.uint8).set_(raw).view(dtype).reshape(info["shape"]).clone()
+        else:
+            state_dict[name] = tensor.set_(storage, (data_start + start) // tensor.element_size(), info["shape"])
+    return state_dict
+
+
+def load_pretrained(model_class, checkpoint):
+    """
+    Load a local checkpoint directory with memory-mapped weights: the model is built without random
+    initialization and its parameters are pointed at the mapped tensors instead of being copied.
+    Falls back to `from_pretrained` for hub names, non-safetensors checkpoints and partial state dicts.
+    """
+    weights = os.path.join(checkpoint, "model.safetensors")
+    if not os.path.isfile(weights):
+        return model_class.from_pretrained(checkpoint)
+
+    from transformers import AutoConfig
+    from transformers.modeling_utils import no_init_weights
+
+    config = AutoConfig.from_pretrained(checkpoint)
+    with no_init_weights():
+        # Auto classes build the architecture named in the config
+        model = model_class.from_config(config) if hasattr(model_class, "from_config") else model_class(config)
+    state_dict = load_safetensors(weights)
+    expected = set(model.state_dict())
+    if not expected <= set(state_dict) | set(model._tied_weights_keys or []):
+        # e.g. a base model without the classification head: let transformers initialize what is missing
+        return model_class.from_pretrained(checkpoint)
+    model.load_state_dict({key: value for key, value in state_dict.items() if key in expected},
+                          strict=False, assign=True)
+    model.tie_weights()
+    model.name_or_path = checkpoint
+    model.eval()
+    return model
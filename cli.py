@@ -0,0 +1,88 @@
+"""
+Single entry point for the project: `python cli.py analyze|evaluate|export|db ...`.
+Only the standard library is imported up front; each subcommand imports what it needs, so
+database commands never pay for torch or transformers.
+"""
+import argparse
+import time
+
+COMMANDS = {
+    "analyze": "Analyze open pull requests with Pylint and CodeBERT (options of fetch_pull_requests.py).",
+    "evaluate": "Evaluate a fine-tuned checkpoint on the test set (options of test_codebert.py).",
+    "export": "Export a checkpoint to ONNX for the onnx backend.",
+    "db": "Inspect or migrate code_analysis.db."
+}
+
+
+def analyze(argv):
+    import fetch_pull_requests
+
+    fetch_pull_requests.main(argv)
+
+
+def evaluate(argv):
+    import test_codebert
+
+    test_codebert.main(argv)
+
+
+def export(argv):
+    import inference_backends
+
+    inference_backends.main(["export"] + argv)
+
+
+def db(argv):
+    import storage
+
+    parser = argparse.ArgumentParser(prog="cli.py db", description=COMMANDS["db"])
+    subparsers = parser.add_subparsers(dest="action", required=True)
+    subparsers.add_parser("migrate", help="Apply pending schema migrations.")
+    subparsers.add_parser("results", help="Print every stored analysis result.")
+    timings_parser = subparsers.add_parser("timings", help="List the slowest analyzed pull requests.")
+    timings_parser.add_argument("--limit", type=int, default=10)
+    subparsers.add_parser("outbox", help="Count notification outbox messages by status.")
+    embeddings_parser = subparsers.add_parser("embeddings", help="Size of the snippet embedding store.")
+    embeddings_parser.add_argument("--build-index", action="store_true", help="(Re)build its IVF index now.")
+    args = parser.parse_args(argv)
+
+    conn = storage.get_connection()
+    if args.action == "migrate":
+        print(f"code_analysis.db is at schema version {storage.schema_version(conn)} of {len(storage.MIGRATIONS)}")
+    elif args.action == "results":
+        from view_results import fetch_results, display_results
+
+        display_results(fetch_results())
+    elif args.action == "timings":
+        for pr_id, timestamp, total_seconds in conn.execute("""
+            SELECT pull_request_id, timestamp, total_seconds FROM pr_timings ORDER BY total_seconds DESC LIMIT ?
+        """, (args.limit,)):
+            print(f"PR #{pr_id} at {timestamp}: {total_seconds:.2f}s")
+    elif args.action == "outbox":
+        for status, count in conn.execute(
+            "SELECT status, COUNT(*) FROM notification_outbox GROUP BY status ORDER BY status"
+        ):
+            print(f"{status}: {count}")
+    elif args.action == "embeddings":
+        from embedding_store import EmbeddingStore
+
+        store = EmbeddingStore()
+        count = len(store.vectors())
+        print(f"{count} snippet embeddings in {store.path}")
+        if args.build_index and count:
+            start = time.perf_counter()
+            index = store.build_index()
+            print(f"Built an IVF index with {len(index.offsets) - 1} lists in {time.perf_counter() - start:.1f}s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="cli.py", description="AI code review tools.")
+    parser.add_argument("command", choices=COMMANDS, help=" ".join(f"{name}: {text}" for name, text in COMMANDS.items()))
+    parser.add_argument("args", nargs=argparse.REMAINDER, help="Options of the subcommand (see `<command> --help`).")
+    args = parser.parse_args(argv)
+    handlers = {"analyze": analyze, "evaluate": evaluate, "export": export, "db": db}
+    handlers[args.command](args.args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import argparse
+import time
+from itertools import islice
+from dataset_shards import iter_samples
+from inference_backends import load_backend
+
+
+def evaluate_backend(backend, test_data, batch_size=16):
+    """Run the test_codebert.py evaluation loop on one backend and time every batch."""
+    correct = 0
+    total = 0
+    batch_times = []
+    probabilities = []
+    for start in range(0, len(test_data), batch_size):
+        batch = test_data[start:start + batch_size]
+        begin = time.perf_counter()
+        scores = backend.score([item["code"] for item in batch])
+        batch_times.append(time.perf_counter() - begin)
+        probabilities.extend(scores)
+        for item, score in zip(batch, scores):
+            correct += int((score >= 0.5) == bool(item["label"]))
+            total += 1
+
+    ordered = sorted(batch_times)
+    return {
+        "accuracy": correct / total if total else 0.0,
+        "samples_per_second": total / sum(batch_times) if batch_times else 0.0,
+        "p50_batch_ms": ordered[len(ordered) // 2] * 1000 if ordered else 0.0,
+        "p90_batch_ms": ordered[min(int(len(ordered) * 0.9), len(ordered) - 1)] * 1000 if ordered else 0.0,
+        "probabilities": probabilities
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare accuracy and CPU latency of the inference backends.")
+    # Same evaluation data and subset as test_codebert.py
+    parser.add_argument("--data", default="test_dataset_augmented_filtered.json",
+                        help="A legacy JSON file or a directory of shards written by prepare_dataset.py / filter_outliers.py.")
+    parser.add_argument("--samples", type=int, default=500)
+    parser.add_argument("--checkpoint", default="./fine_tuned_codebert/checkpoint-2504")
+    parser.add_argument("--onnx-dir", default="./fine_tuned_codebert/onnx")
+    parser.add_argument("--backends", nargs="+", default=["torch", "int8", "onnx"])
+    parser.add_argument("--batch-size", type=int, default=16)
+    args = parser.parse_args()
+
+    test_data = list(islice(iter_samples(args.data), args.samples))
+
+    results = {}
+    for name in args.backends:
+        model_path = args.onnx_dir if name == "onnx" else args.checkpoint
+        backend = load_backend(name, model_path, batch_size=args.batch_size)
+        results[name] = evaluate_backend(backend, test_data, args.batch_size)
+
+    reference = results.get("torch")
+    for name, result in results.items():
+        line = (f"{name:>6}: accuracy {result['accuracy'] * 100:.2f}%, "
+                f"{result['samples_per_second']:.1f} samples/sec, "
+                f"batch p50 {result['p50_batch_ms']:.1f}ms / p90 {result['p90_batch_ms']:.1f}ms")
+        if reference is not None and name != "torch":
+            pairs = list(zip(reference["probabilities"], result["probabilities"]))
+            agreement = sum((a >= 0.5) == (b >= 0.5) for a, b in pairs)
+            max_delta = max((abs(a - b) for a, b in pairs), default=0.0)
+            speedup = result["samples_per_second"] / reference["samples_per_second"]
+            line += (f", {agreement}/{len(pairs)} predictions agree with fp32, "
+                     f"max probability delta {max_delta:.4f}, {speedup:.2f}x fp32 speed")
+        print(line)
@@ -0,0 +1,131 @@
+import re
+from multiprocessing import Pool
+import numpy as np
+
+# Columns produced for every snippet, in order
+FEATURE_NAMES = [
+    "num_lines",
+    "if_count",
+    "nested_if_count",  # deepest nesting of if statements
+    "loop_count",
+    "loop_depth",  # deepest nesting of for/while/do loops
+    "max_depth",  # deepest nesting of any block
+    "cyclomatic_complexity"
+]
+
+# One scanner over the C functions of CodeXGLUE: comments and literals are consumed whole so
+# keywords inside them are ignored, a `for (...)` header is one token so its semicolons never
+# reach the loop below, and identifiers are skipped by the regex engine
+_TOKEN_PATTERN = re.compile(r"""
+    (?=[/"'fiewdsc{};?&|])  # cheap first-character check before trying the alternatives
+    (?:
+    //[^\n]*
+    | /\*.*?(?:\*/|\Z)
+    | "(?:\\.|[^"\\\n])*"?
+    | '(?:\\.|[^'\\\n])*'?
+    | \bfor\b(?:\s*\((?:[^()]|\((?:[^()]|\([^()]*\))*\))*\))?
+    | \b(?:if|else|while|do|switch|case)\b
+    | &&|\|\||[{};?]
+    )
+""", re.VERBOSE | re.DOTALL)
+
+
+def extract_features(code):
+    """
+    All complexity features of one snippet in a single tokenizing pass, as a tuple ordered like FEATURE_NAMES.
+    Nesting follows braces as well as brace-less bodies such as `for (...) if (x) y;`.
+    """
+    code = code or ""
+    ifs = loops = branches = 0
+    max_if_depth = max_loop_depth = max_depth = 0
+    if_depth = loop_depth = depth = 0
+    # Each open block records the (ifs, loops, blocks, is_do) it adds to the nesting
+    stack = []
+    # Statements opened by keywords whose body has not started yet
+    pending_ifs = pending_loops = pending_blocks = 0
+    pending_do = closed_do = False
+
+    for token in _TOKEN_PATTERN.findall(code):
+        if token == ";":
+            if pending_blocks:
+                pending_ifs = pending_loops = pending_blocks = 0
+                # A brace-less do body ends here; its while follows
+                closed_do = pending_do
+                pending_do = False
+            else:
+                closed_do = False
+            continue
+        first = token[0]
+        if first == "/" or first == '"' or first == "'":
+            continue
+
+        if token == "if":
+            ifs += 1
+            pending_ifs += 1
+            pending_blocks += 1
+            max_if_depth = max(max_if_depth, if_depth + pending_ifs)
+            max_depth = max(max_depth, depth + pending_blocks)
+        elif first == "f" or first == "w" or token == "do":
+            if closed_do and first == "w":
+                # The condition of a do ... while, not a new loop
+                closed_do = False
+                continue
+            loops += 1
+            pending_loops += 1
+            pending_blocks += 1
+            pending_do = token == "do"
+            max_loop_depth = max(max_loop_depth, loop_depth + pending_loops)
+            max_depth = max(max_depth, depth + pending_blocks)
+        elif token == "{":
+            added_blocks = pending_blocks or 1
+            stack.append((pending_ifs, pending_loops, added_blocks, pending_do))
+            if_depth += pending_ifs
+            loop_depth += pending_loops
+            depth += added_blocks
+            if depth > max_depth:
+                max_depth = depth
+            pending_ifs = pending_loops = pending_blocks = 0
+            pending_do = False
+        elif token == "}":
+            if stack:
+                added_ifs, added_loops, added_blocks, was_do = stack.pop()
+                if_depth -= added_ifs
+                loop_depth -= added_loops
+                depth -= added_blocks
+                pending_ifs = pending_loops = pending_blocks = 0
+                closed_do = was_do
+                continue
+        elif token == "else" or token == "switch":
+            pending_blocks += 1
+            max_depth = max(max_depth, depth + pending_blocks)
+        else:
+            # case, &&, || and ?
+            branches += 1
+        closed_do = False
+
+    return (code.count("\n") + 1, ifs, max_if_depth, loops, max_loop_depth, max_depth, 1 + ifs + loops + branches)
+
+
+def _extract_chunk(codes):
+    return [extract_features(code) for code in codes]
+
+
+def extract_feature_columns(codes, num_proc=None, chunk_size=2000):
+    """
+    Features of many snippets as columnar int32 NumPy arrays keyed by FEATURE_NAMES.
+    With `num_proc` > 1 the snippets are split into chunks scored across a process pool.
+    """
+    codes = list(codes)
+    if num_proc and num_proc > 1 and len(codes) > chunk_size:
+        chunks = [codes[start:start + chunk_size] for start in range(0, len(codes), chunk_size)]
+        with Pool(num_proc) as pool:
+            rows = [row for chunk in pool.map(_extract_chunk, chunks) for row in chunk]
+    else:
+        rows = _extract_chunk(codes)
+    matrix = np.array(rows, dtype=np.int32).reshape(len(rows), len(FEATURE_NAMES))
+    return {name: matrix[:, column] for column, name in enumerate(FEATURE_NAMES)}
+
+
+def features_batch(batch, code_column="code"):
+    """Batched `datasets.map` function adding every feature column, e.g. `map(features_batch, batched=True, num_proc=N)`."""
+    return extract_feature_columns(batch[code_column])
@@ -0,0 +1,113 @@
+import glob
+import json
+import os
+
+SHARD_FORMATS = ["jsonl", "parquet"]
+
+
+def shard_paths(path):
+    """
+    Resolve `path` to the ordered list of data files it names: a directory of shards,
+    a glob pattern, or a single .json/.jsonl/.parquet file.
+    """
+    if os.path.isdir(path):
+        files = []
+        for extension in SHARD_FORMATS:
+            files.extend(glob.glob(os.path.join(path, f"*.{extension}")))
+        paths = sorted(files)
+    elif any(char in path for char in "*?["):
+        paths = sorted(glob.glob(path))
+    else:
+        paths = [path]
+    if not paths or not all(os.path.exists(p) for p in paths):
+        raise FileNotFoundError(f"No dataset files found at {path}")
+    return paths
+
+
+def iter_samples(path):
+    """
+    Yield samples one at a time from shards written by `ShardWriter` (or a legacy JSON list),
+    so callers never hold the whole dataset in memory.
+    """
+    for file_path in shard_paths(path):
+        if file_path.endswith(".parquet"):
+            import pyarrow.parquet as pq
+
+            for batch in pq.ParquetFile(file_path).iter_batches(batch_size=1000):
+                yield from batch.to_pylist()
+        elif file_path.endswith(".jsonl"):
+            with open(file_path, "r") as f:
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
+        else:
+            # Legacy single-file output of prepare_dataset.py
+            with open(file_path, "r") as f:
+                yield from json.load(f)
+
+
+def load_shards(path):
+    """
+    Open shards as a memory-mapped Hugging Face `Dataset`, for random access during training
+    without materializing the samples as Python objects.
+    """
+    from datasets import load_dataset
+
+    paths = shard_paths(path)
+    builder = "parquet" if paths[0].endswith(".parquet") else "json"
+    return load_dataset(builder, data_files=paths, split="train")
+
+
+class ShardWriter:
+    """
+    Writes samples incrementally into numbered shards of at most `shard_size` samples:
+    `<output_dir>/part-00000.jsonl`, `part-00001.jsonl`, ... (or `.parquet`).
+    """
+
+    def __init__(self, output_dir, shard_size=10000, format="jsonl"):
+        if format not in SHARD_FORMATS:
+            raise ValueError(f"Unknown shard format '{format}', expected one of {SHARD_FORMATS}")
+        self.output_dir = output_dir
+        self.shard_size = shard_size
+        self.format = format
+        self.buffer = []
+        self.shards = 0
+        self.samples = 0
+        os.makedirs(output_dir, exist_ok=True)
+        # Drop shards left over from a previous, larger run
+        for stale in glob.glob(os.path.join(output_dir, f"part-*.{format}")):
+            os.remove(stale)
+
+    def write(self, sample):
+        self.buffer.append(sample)
+        if len(self.buffer) >= self.shard_size:
+            self.flush()
+
+    def write_many(self, samples):
+        for sample in samples:
+            self.write(sample)
+
+    def flush(self):
+        if not self.buffer:
+            return
+        file_path = os.path.join(self.output_dir, f"part-{self.shards:05d}.{self.format}")
+        if self.format == "parquet":
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            pq.write_table(pa.Table.from_pylist(self.buffer), file_path)
+        else:
+            with open(file_path, "w") as f:
+                for sample in self.buffer:
+                    f.write(json.dumps(sample) + "\n")
+        self.shards += 1
+        self.samples += len(self.buffer)
+        self.buffer = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            self.flush()
+        return False
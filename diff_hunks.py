@@ -0,0 +1,107 @@
+import ast
+import re
+
+# "@@ -old_start,old_count +new_start,new_count @@" header of a unified diff hunk
+HUNK_HEADER = re.compile(r"^@@ -\d+(?:,\d+)? \+(\d+)(?:,(\d+))? @@")
+
+# "path:line:column: C0114: message (symbol)" lines of Pylint's default text output
+PYLINT_MESSAGE = re.compile(r"^[^:\s][^:]*:(\d+):\d+: [A-Z]\d{4}: ")
+
+
+def parse_changed_lines(patch):
+    """
+    Return the set of line numbers (in the new version of the file) touched by a unified diff patch.
+    A hunk that only deletes lines marks the line the deletion happened at.
+    """
+    changed = set()
+    if not patch:
+        return changed
+
+    new_line = 0
+    for line in patch.splitlines():
+        header = HUNK_HEADER.match(line)
+        if header:
+            new_line = int(header.group(1))
+            continue
+        if line.startswith("+"):
+            changed.add(new_line)
+            new_line += 1
+        elif line.startswith("-"):
+            changed.add(max(new_line, 1))
+        elif not line.startswith("\\"):
+            new_line += 1
+    return changed
+
+
+def merge_ranges(ranges):
+    """Merge overlapping or adjacent (start, end) line ranges."""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def enclosing_definitions(code):
+    """List the (start, end) line spans of every function and class in a Python module."""
+    try:
+        tree = ast.parse(code)
+    except (SyntaxError, ValueError):
+        return []
+
+    spans = []
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            start = min([node.lineno] + [decorator.lineno for decorator in node.decorator_list])
+            spans.append((start, node.end_lineno))
+    return spans
+
+
+def changed_regions(code, changed_lines, context=3):
+    """
+    Map changed lines to the regions of the file the model should see: the innermost function or
+    class enclosing each change, or the changed lines themselves when they sit at module level,
+    padded with `context` lines on both sides.
+    """
+    spans = enclosing_definitions(code)
+    num_lines = len(code.splitlines())
+    regions = []
+    for line in changed_lines:
+        enclosing = [span for span in spans if span[0] <= line <= span[1]]
+        if enclosing:
+            start, end = min(enclosing, key=lambda span: span[1] - span[0])
+        else:
+            start, end = line, line
+        regions.append((max(start - context, 1), min(end + context, max(num_lines, 1))))
+    return merge_ranges(regions)
+
+
+def extract_hunk_code(code, patch, context=3):
+    """Return only the parts of `code` that enclose the changes in `patch`, or None if nothing changed."""
+    changed_lines = parse_changed_lines(patch)
+    if not changed_lines:
+        return None
+    lines = code.splitlines()
+    snippets = [
+        "\n".join(lines[start - 1:end])
+        for start, end in changed_regions(code, changed_lines, context)
+    ]
+    return "\n\n".join(snippet for snippet in snippets if snippet) or None
+
+
+def filter_pylint_output(output, changed_lines):
+    """Keep only the Pylint messages reported on changed lines; headers and the rating line are kept."""
+    kept = []
+    skipping = False
+    for line in output.splitlines():
+        message = PYLINT_MESSAGE.match(line)
+        if message:
+            skipping = int(message.group(1)) not in changed_lines
+        elif not line.strip():
+            skipping = False
+        # Continuation lines of a multi-line message (e.g. duplicate-code) follow their message
+        if not skipping:
+            kept.append(line)
+    return "\n".join(kept)
@@ -0,0 +1,59 @@
+import torch
+
+SEQUENCE_KEYS = ["input_ids", "attention_mask"]
+
+
+def dataset_lengths(dataset):
+    """Unpadded token length of every sample: read from a token cache, or from each item's attention mask."""
+    lengths = getattr(dataset, "lengths", None)
+    if lengths is not None:
+        return [int(length) for length in lengths]
+    return [int(dataset[i]["attention_mask"].sum()) for i in range(len(dataset))]
+
+
+class DynamicPaddingCollator:
+    """
+    Stacks samples that were padded to a fixed max_length, then trims the batch to its longest
+    sample (rounded up to `pad_to_multiple_of` for tensor-core friendly shapes), so short batches
+    no longer pay attention FLOPs for hundreds of pad tokens.
+    """
+
+    def __init__(self, pad_to_multiple_of=8):
+        self.pad_to_multiple_of = pad_to_multiple_of
+
+    def __call__(self, items):
+        batch = {key: torch.stack([item[key] for item in items]) for key in items[0]}
+        full_length = batch["attention_mask"].shape[1]
+        longest = int(batch["attention_mask"].sum(dim=1).max())
+        if self.pad_to_multiple_of:
+            longest = -(-longest // self.pad_to_multiple_of) * self.pad_to_multiple_of
+        length = max(1, min(longest, full_length))
+        for key in SEQUENCE_KEYS:
+            batch[key] = batch[key][:, :length]
+        return batch
+
+
+class PaddingStats:
+    """Counts real and padded tokens of the batches fed to the model, for tokens/sec and pad ratio."""
+
+    def __init__(self):
+        self.real_tokens = 0
+        self.padded_tokens = 0
+        self.seconds = 0.0
+
+    def update(self, attention_mask, seconds=0.0):
+        self.real_tokens += int(attention_mask.sum())
+        self.padded_tokens += attention_mask.numel()
+        self.seconds += seconds
+
+    @property
+    def pad_ratio(self):
+        return 1 - self.real_tokens / self.padded_tokens if self.padded_tokens else 0.0
+
+    @property
+    def tokens_per_second(self):
+        return self.real_tokens / self.seconds if self.seconds else 0.0
+
+    def summary(self):
+        return (f"{self.real_tokens} tokens in {self.seconds:.2f}s ({self.tokens_per_second:.0f} tokens/sec), "
+                f"pad ratio {self.pad_ratio * 100:.1f}%")
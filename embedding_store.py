@@ -0,0 +1,491 @@
+import ast
+import glob
+import os
+import re
+import struct
+import textwrap
+import threading
+from datetime import datetime
+import numpy as np
+from storage import DB_PATH, get_connection
+
+# The vector file starts with a 16-byte header: magic, uint32 dimension, padding
+MAGIC = b"F16V"
+HEADER_SIZE = 16
+RECORD_COLUMNS = ["vector_row", "pull_request_id", "file_name", "model", "issue_probability", "ai_analysis",
+                  "reused_from", "similarity", "created"]
+
+
+def embeddings_path(db_path=DB_PATH):
+    """The float16 vector file kept next to the database, e.g. code_analysis.embeddings.f16."""
+    return os.path.splitext(db_path)[0] + ".embeddings.f16"
+
+
+def normalize(vectors):
+    """Scale float32 rows to unit length so a dot product is their cosine similarity."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def merge_top_k(rows, scores, k):
+    """Keep the `k` highest scores of each query row (best first) with their vector rows."""
+    if scores.shape[1] > k:
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        rows = np.take_along_axis(rows, top, axis=1)
+        scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-scores, axis=1, kind="stable")
+    return np.take_along_axis(rows, order, axis=1), np.take_along_axis(scores, order, axis=1)
+
+
+def exact_search(vectors, queries, k, offset=0, block_size=65536):
+    """
+    Brute-force cosine search over `vectors` in blocks, so the float16 file is never converted whole.
+    Rows are rescaled to unit length as they are read: float16 rounding alone moves a dot product
+    by more than a one-token edit does, while the angle it changes is far smaller.
+    """
+    best_rows = np.full((len(queries), 0), -1, dtype=np.int64)
+    best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+    for start in range(0, len(vectors), block_size):
+        block = normalize(vectors[start:start + block_size])
+        scores = queries @ block.T
+        rows = np.broadcast_to(np.arange(offset + start, offset + start + len(block)), scores.shape)
+        best_rows, best_scores = merge_top_k(np.concatenate([best_rows, rows], axis=1),
+                                             np.concatenate([best_scores, scores], axis=1), k)
+    return best_rows, best_scores
+
+
+def delete_not(code):
+    return re.sub(r"\bnot ", "", code, count=1)
+
+
+def flip_comparison(code):
+    return re.sub(r" (==|!=|<=|>=|<|>) ", lambda m: f" {FLIPPED[m.group(1)]} ", code, count=1)
+
+
+def swap_lines(code):
+    """Swap the first two adjacent one-line statements of a block, reversing their order."""
+    lines = code.split("\n")
+    for node in ast.walk(ast.parse(code)):
+        body = getattr(node, "body", None)
+        if not isinstance(body, list):
+            continue
+        for a, b in zip(body, body[1:]):
+            docstring = isinstance(a, ast.Expr) and isinstance(a.value, ast.Constant)
+            if not docstring and a.lineno == a.end_lineno and b.lineno == b.end_lineno == a.lineno + 1 and \
+                    lines[a.lineno - 1] != lines[b.lineno - 1]:
+                lines[a.lineno - 1], lines[b.lineno - 1] = lines[b.lineno - 1], lines[a.lineno - 1]
+                return "\n".join(lines)
+    return code
+
+
+FLIPPED = {"==": "!=", "!=": "==", "<=": ">", ">=": "<", "<": ">=", ">": "<="}
+# Single-token or single-line edits that can change what a snippet does, and so its verdict
+EDITS = {"delete_not": delete_not, "flip_comparison": flip_comparison, "swap_lines": swap_lines}
+# The analyzer calibrates on its own source, wherever it is run from
+CALIBRATION_FILES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "*.py")
+
+
+def functions(pattern, min_lines=5, max_lines=80):
+    """Source of every function of `min_lines` to `max_lines` lines in the Python files matching `pattern`."""
+    snippets = []
+    for path in sorted(glob.glob(pattern)):
+        with open(path, "r") as f:
+            source = f.read()
+        for node in ast.walk(ast.parse(source)):
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                snippet = ast.get_source_segment(source, node)
+                if snippet and min_lines <= snippet.count("\n") + 1 <= max_lines:
+                    # Methods keep their indentation after the first line
+                    snippets.append(textwrap.dedent(" " * node.col_offset + snippet))
+    return list(dict.fromkeys(snippets))
+
+
+def percentiles(values):
+    values = np.asarray(values, dtype=np.float64)
+    return {"count": len(values), "min": round(float(values.min()), 8),
+            "p50": round(float(np.median(values)), 8), "max": round(float(values.max()), 8)}
+
+
+def center_vectors(vectors, center):
+    """
+    Unit vectors relative to a model's mean embedding. Mean token states of code share one dominant
+    direction, which puts any two functions above 0.99 similarity; without it they spread out.
+    """
+    return normalize(normalize(vectors) - center)
+
+
+def calibrate(backend, pattern=CALIBRATION_FILES, max_functions=200):
+    """
+    Center `backend.embed` on up to `max_functions` functions of the files matching `pattern`, then measure
+    the cosine similarity between each function and copies of it changed by one of `EDITS`, next to its
+    similarity to its unchanged copy and to its nearest distinct function. Originals are compared as the
+    store keeps them, in float16. A reuse threshold is only safe above every edit's similarity.
+    """
+    snippets = functions(pattern)
+    if len(snippets) < 2:
+        raise ValueError(f"Fewer than two functions found in {pattern}")
+    if len(snippets) > max_functions:
+        snippets = [snippets[i] for i in np.linspace(0, len(snippets) - 1, max_functions).astype(int)]
+    embedded = backend.embed(snippets)
+    center = normalize(embedded).mean(axis=0)
+    vectors = center_vectors(embedded, center)
+    stored = normalize(vectors.astype(np.float16))
+    unchanged = (vectors * stored).sum(axis=1)
+    _, scores = exact_search(stored, vectors, 2)
+    result = {"model": backend.fingerprint(), "functions": len(snippets), "unchanged": percentiles(unchanged),
+              "distinct_nearest": percentiles(scores[:, 1]), "edits": {}}
+    highest = -1.0
+    for kind, edit in EDITS.items():
+        pairs = [(i, edit(snippet)) for i, snippet in enumerate(snippets)]
+        pairs = [(i, edited) for i, edited in pairs if edited != snippets[i]]
+        if not pairs:
+            continue
+        edited = center_vectors(backend.embed([code for _, code in pairs]), center)
+        similarity = (edited * stored[[i for i, _ in pairs]]).sum(axis=1)
+        result["edits"][kind] = percentiles(similarity)
+        highest = max(highest, float(similarity.max()))
+    # Anything at or below the closest edited copy could take the verdict of code that behaves differently;
+    # a threshold most unchanged copies do not clear would never reuse anything
+    result["suggested_threshold"] = highest if highest < float(np.median(unchanged)) else None
+    result["center"] = center
+    return result
+
+
+def model_calibration(backend, model, db_path=DB_PATH, pattern=CALIBRATION_FILES):
+    """
+    (center, threshold) of `model` from the embedding_calibration table, running `calibrate` with its
+    backend the first time the model is seen. A threshold of None means no threshold separates edited code.
+    """
+    conn = get_connection(db_path)
+    row = conn.execute("SELECT center, threshold FROM embedding_calibration WHERE model = ?", (model,)).fetchone()
+    if row is not None:
+        return np.frombuffer(row[0], dtype=np.float32), row[1]
+    result = calibrate(backend, pattern)
+    center = result["center"].astype(np.float32)
+    with conn:
+        conn.execute("""
+            INSERT OR REPLACE INTO embedding_calibration (model, center, threshold, functions, created)
+            VALUES (?, ?, ?, ?, ?)
+        """, (model, center.tobytes(), result["suggested_threshold"], result["functions"], datetime.now().isoformat()))
+    return center, result["suggested_threshold"]
+
+
+class IvfIndex:
+    """
+    Inverted-file index over unit vectors: rows are partitioned by their nearest spherical k-means centroid,
+    and a query only scans the lists of its `nprobe` closest centroids.
+    """
+
+    def __init__(self, centroids, order, offsets):
+        self.centroids = centroids
+        self.order = order
+        self.offsets = offsets
+        self.count = len(order)
+
+    @classmethod
+    def build(cls, vectors, lists=None, sample_size=65536, iterations=10, seed=0, block_size=65536):
+        """Train centroids on a sample of `vectors`, then assign every row to its nearest one."""
+        rng = np.random.default_rng(seed)
+        count = len(vectors)
+        lists = min(lists or max(1, int(np.sqrt(count))), count)
+        sample_rows = np.sort(rng.choice(count, min(max(sample_size, lists), count), replace=False))
+        sample = np.asarray(vectors[sample_rows], dtype=np.float32)
+        centroids = sample[rng.choice(len(sample), lists, replace=False)]
+        for _ in range(iterations):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            # Lists that attracted no sample restart from a random sample row
+            empty = np.bincount(assignment, minlength=lists) == 0
+            sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+            centroids = normalize(sums)
+
+        assignment = np.empty(count, dtype=np.int64)
+        for start in range(0, count, block_size):
+            block = np.asarray(vectors[start:start + block_size], dtype=np.float32)
+            assignment[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+        order = np.argsort(assignment, kind="stable")
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(assignment, minlength=lists))])
+        return cls(centroids, order, offsets)
+
+    def search(self, vectors, queries, k, nprobe=16):
+        """Approximate top `k` of each query among the indexed rows of `vectors`."""
+        probes = np.argsort(-(queries @ self.centroids.T), axis=1)[:, :nprobe]
+        result_rows = np.full((len(queries), k), -1, dtype=np.int64)
+        result_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        for i, (query, lists) in enumerate(zip(queries, probes)):
+            candidates = np.concatenate([self.order[self.offsets[l]:self.offsets[l + 1]] for l in lists])
+            if not len(candidates):
+                continue
+            candidates.sort()  # read the memory map front to back
+            scores = normalize(vectors[candidates]) @ query
+            rows, scores = merge_top_k(candidates[None, :], scores[None, :], k)
+            result_rows[i, :rows.shape[1]] = rows[0]
+            result_scores[i, :scores.shape[1]] = scores[0]
+        return result_rows, result_scores
+
+    def save(self, path):
+        # Written aside and renamed, so a reader never loads a half-written index
+        with open(path + ".partial", "wb") as f:
+            np.savez(f, centroids=self.centroids, order=self.order, offsets=self.offsets)
+        os.replace(path + ".partial", path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data["centroids"], data["order"], data["offsets"])
+
+
+class EmbeddingStore:
+    """
+    Store of snippet embeddings: float16 vectors in one file next to code_analysis.db, with their pull
+    request, file, model and verdict in the snippet_embeddings table. Vectors are appended before their
+    records, so the record count is always the number of complete vectors; `prune` drops the oldest.
+    Searches scan every vector below `exact_below` rows and use an IVF index above it; rows appended
+    since the index was built are scanned exactly until they warrant a rebuild. One writer process at a time.
+    """
+
+    def __init__(self, db_path=DB_PATH, path=None, nprobe=16, exact_below=50000):
+        self.db_path = db_path
+        self.path = path or embeddings_path(db_path)
+        self.index_path = os.path.splitext(self.path)[0] + ".ivf.npz"
+        self.nprobe = nprobe
+        self.exact_below = exact_below
+        self.dim = self._read_dim()
+        self._vectors = None
+        self._file_id = None
+        self._index = None
+        self._lock = threading.Lock()
+
+    def _read_dim(self):
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, "rb") as f:
+            header = f.read(HEADER_SIZE)
+        if header[:4] != MAGIC:
+            raise ValueError(f"{self.path} is not an embedding file")
+        return struct.unpack("<I", header[4:8])[0]
+
+    def __len__(self):
+        return get_connection(self.db_path).execute(
+            "SELECT COALESCE(MAX(vector_row) + 1, 0) FROM snippet_embeddings"
+        ).fetchone()[0]
+
+    def vectors(self):
+        """Read-only memory map of every recorded vector."""
+        if self.dim is None:
+            # Another process may have created the file since
+            self.dim = self._read_dim()
+        count = len(self) if self.dim else 0
+        # A pruned file is a new file, possibly with as many rows as the old one
+        file_id = os.stat(self.path).st_ino if count else None
+        if file_id != self._file_id:
+            self._vectors = self._index = None
+            self._file_id = file_id
+        if self._vectors is None or len(self._vectors) != count:
+            if count:
+                self._vectors = np.memmap(self.path, dtype=np.float16, mode="r", offset=HEADER_SIZE,
+                                          shape=(count, self.dim))
+            else:
+                self._vectors = np.empty((0, self.dim or 0), dtype=np.float16)
+        return self._vectors
+
+    def add(self, vectors, records):
+        """
+        Append unit vectors with their (pull_request_id, file_name, model, issue_probability, ai_analysis,
+        reused_from, similarity) records; returns the rows they were stored at.
+        """
+        vectors = np.asarray(vectors, dtype=np.float16)
+        if not len(vectors):
+            return []
+        with self._lock:
+            conn = get_connection(self.db_path)
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                with open(self.path, "wb") as f:
+                    f.write(MAGIC + struct.pack("<I", self.dim) + bytes(HEADER_SIZE - 8))
+                # Records of a vector file that no longer exists point at nothing
+                with conn:
+                    conn.execute("DELETE FROM snippet_embeddings")
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Expected {self.dim}-dimensional vectors, got {vectors.shape[1]}")
+
+            start = len(self)
+            with open(self.path, "r+b") as f:
+                # Vectors past the last record are left over from an interrupted append
+                f.truncate(HEADER_SIZE + start * self.dim * 2)
+                f.seek(0, os.SEEK_END)
+                f.write(vectors.tobytes())
+            now = datetime.now().isoformat()
+            with conn:
+                conn.executemany(f"""
+                    INSERT INTO snippet_embeddings ({', '.join(RECORD_COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """, [(start + i,) + tuple(record) + (now,) for i, record in enumerate(records)])
+        return list(range(start, start + len(vectors)))
+
+    def prune(self, max_rows, block_size=65536):
+        """
+        Keep only the newest `max_rows` vectors and their records, renumbered from 0; returns how many were
+        dropped. The vector file is rewritten aside and swapped in just before the renumbering commits.
+        """
+        with self._lock:
+            count = len(self)
+            cut = count - max_rows
+            if cut <= 0 or self.dim is None:
+                return 0
+            vectors = self.vectors()
+            with open(self.path + ".partial", "wb") as f:
+                f.write(MAGIC + struct.pack("<I", self.dim) + bytes(HEADER_SIZE - 8))
+                for start in range(cut, count, block_size):
+                    f.write(np.asarray(vectors[start:min(start + block_size, count)]).tobytes())
+            self._vectors = None
+            conn = get_connection(self.db_path)
+            with conn:
+                conn.execute("DELETE FROM snippet_embeddings WHERE vector_row < ?", (cut,))
+                # A verdict reused from a dropped snippet keeps a source (-1), so it is still never reused itself
+                conn.execute("""
+                    UPDATE snippet_embeddings SET reused_from = CASE WHEN reused_from >= ? THEN reused_from - ? ELSE -1 END
+                    WHERE reused_from IS NOT NULL
+                """, (cut, cut))
+                # Through negative rows, so no renumbered row collides with one not yet moved
+                conn.execute("UPDATE snippet_embeddings SET vector_row = -vector_row - 1")
+                conn.execute("UPDATE snippet_embeddings SET vector_row = -vector_row - 1 - ?", (cut,))
+                os.replace(self.path + ".partial", self.path)
+            self._file_id = self._index = None
+            if os.path.exists(self.index_path):
+                os.remove(self.index_path)
+        return cut
+
+    def build_index(self, lists=None):
+        """(Re)build the IVF index over every stored vector and save it next to the vector file."""
+        self._index = IvfIndex.build(self.vectors(), lists)
+        self._index.save(self.index_path)
+        return self._index
+
+    def index(self):
+        """The IVF index, rebuilt once a quarter of the rows are newer than it; None while exact search is used."""
+        count = len(self.vectors())
+        if count < self.exact_below:
+            return None
+        if self._index is None and os.path.exists(self.index_path):
+            self._index = IvfIndex.load(self.index_path)
+        stale = self._index is None or self._index.count > count or \
+            self._index.centroids.shape[1] != self.dim or \
+            count - self._index.count > max(self.exact_below, self._index.count // 4)
+        if stale:
+            self.build_index()
+        return self._index
+
+    def search(self, queries, k=5):
+        """
+        Nearest stored vectors of each query by cosine similarity: (rows, similarities) arrays of shape
+        (len(queries), k), best first; rows are -1 where fewer than `k` vectors exist.
+        """
+        queries = normalize(np.atleast_2d(queries))
+        vectors = self.vectors()
+        index = self.index()
+        if index is None:
+            rows, scores = exact_search(vectors, queries, k)
+        else:
+            indexed = index.search(vectors, queries, k, self.nprobe)
+            tail = exact_search(vectors[index.count:], queries, k, offset=index.count)
+            rows, scores = merge_top_k(np.concatenate([indexed[0], tail[0]], axis=1),
+                                       np.concatenate([indexed[1], tail[1]], axis=1), k)
+        if rows.shape[1] < k:
+            missing = k - rows.shape[1]
+            rows = np.pad(rows, ((0, 0), (0, missing)), constant_values=-1)
+            scores = np.pad(scores, ((0, 0), (0, missing)), constant_values=-np.inf)
+        return rows, scores
+
+    def records(self, rows):
+        """Stored records of the given vector rows, as dicts keyed by row."""
+        rows = sorted({int(row) for row in rows if row >= 0})
+        records = {}
+        conn = get_connection(self.db_path)
+        for start in range(0, len(rows), 500):
+            chunk = rows[start:start + 500]
+            for record in conn.execute(f"""
+                SELECT {', '.join(RECORD_COLUMNS)} FROM snippet_embeddings
+                WHERE vector_row IN ({', '.join('?' * len(chunk))})
+            """, chunk):
+                records[record[0]] = dict(zip(RECORD_COLUMNS, record))
+        return records
+
+    def neighbours(self, queries, k=5, accept=None):
+        """
+        The stored records nearest to each query, best first, each with its "similarity".
+        `accept(record)` filters them; more candidates are fetched so up to `k` survive the filter.
+        """
+        rows, scores = self.search(queries, k * 4 if accept else k)
+        records = self.records(rows.ravel())
+        results = []
+        for query_rows, query_scores in zip(rows, scores):
+            matches = []
+            for row, score in zip(query_rows, query_scores):
+                record = records.get(int(row))
+                if record is None or (accept is not None and not accept(record)):
+                    continue
+                # float16 rounding can put an identical vector slightly above 1
+                matches.append(dict(record, similarity=min(float(score), 1.0)))
+                if len(matches) == k:
+                    break
+            results.append(matches)
+        return results
+
+
+class SimilarVerdicts:
+    """
+    Records the embedding and verdict of every analyzed snippet so later runs and the dashboard can find it,
+    and gives a snippet the verdict of a near-identical one scored earlier by the same model instead of
+    scoring it. Vectors are taken relative to the model's `center`. A `threshold` of None only records;
+    `model_calibration` picks one above the similarity one-token edits keep, since such an edit can flip
+    a verdict while barely moving the vector.
+    """
+
+    def __init__(self, store, backend, model, center, threshold=None):
+        self.store = store
+        self.backend = backend
+        self.model = model
+        self.center = center
+        self.threshold = threshold
+        self.reused = 0
+
+    def reuse(self, rows):
+        """
+        Embed the code of `rows` with the backend's first layers and give each row whose nearest past snippet
+        scored by the model is more than `threshold` similar that snippet's verdict and issue probability.
+        Returns the rows that still have to be scored.
+        """
+        vectors = center_vectors(self.backend.embed([row["code"] for row in rows]), self.center)
+        if self.threshold is not None and len(self.store.vectors()):
+            # Only verdicts the model produced itself are copied; a reused verdict is never reused again,
+            # so an answer cannot drift along a chain of snippets each similar to the last
+            matches = self.store.neighbours(vectors, k=1, accept=lambda record: (
+                record["model"] == self.model and record["reused_from"] is None))
+        else:
+            matches = [[] for _ in rows]
+        remaining = []
+        for row, vector, match in zip(rows, vectors, matches):
+            row["embedding"] = vector
+            if match and match[0]["similarity"] > self.threshold:
+                row["ai_analysis"] = match[0]["ai_analysis"]
+                row["issue_probability"] = match[0]["issue_probability"]
+                row["similar_to"] = match[0]
+            else:
+                remaining.append(row)
+        self.reused += len(rows) - len(remaining)
+        return remaining
+
+    def record(self, pr_number, rows):
+        """Store the embedding and verdict of every row of a pull request that went through `reuse`."""
+        rows = [row for row in rows if "embedding" in row and row.get("ai_analysis") != "AI analysis failed."]
+        self.store.add([row["embedding"] for row in rows], [(
+            pr_number,
+            row["file_name"],
+            self.model,
+            row.get("issue_probability"),
+            row["ai_analysis"],
+            row["similar_to"]["vector_row"] if "similar_to" in row else None,
+            row["similar_to"]["similarity"] if "similar_to" in row else None
+        ) for row in rows])
@@ -1,104 +1,68 @@
+import atexit
 import os
-import sqlite3
-from github import Github
-import subprocess
-from transformers import AutoTokenizer, AutoModelForSequenceClassification
-import torch
-import re
-from datetime import datetime
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-
-
-def load_model():
+import sys
+import time
+import argparse
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+from inference import analyze_code_batch, verdict_from_probability
+from inference_backends import CascadeBackend, load_backend
+from diff_hunks import parse_changed_lines, extract_hunk_code, filter_pylint_output
+from pylint_runner import lint_files
+from pipeline import Pipeline, Stage
+import storage
+import metrics
+import pr_comment
+from scoring_server import ScoringClient, DEFAULT_URL
+from result_cache import ResultCache, pylint_fingerprint
+from notifications import Outbox, NotificationDispatcher, SmtpSession
+from github_client import GitHubClient
+from workspace import Workspace, ApiBlobSource, GitObjectStore
+
+
+@metrics.timed("analyzer_stage_seconds", stage="load_model")
+def load_model(model_path="microsoft/codebert-base"):
     """Load CodeBERT tokenizer and model."""
-    tokenizer = AutoTokenizer.from_pretrained("microsoft/codebert-base")
-    model = AutoModelForSequenceClassification.from_pretrained("microsoft/codebert-base")
-    return tokenizer, model
-
+    from transformers import AutoTokenizer, AutoModelForSequenceClassification
+    from checkpoints import load_pretrained
 
-def analyze_code_with_ai(code_snippet, tokenizer, model):
-    """Analyze code snippet for inefficiencies or issues using CodeBERT."""
-    inputs = tokenizer(code_snippet, return_tensors="pt", max_length=512, truncation=True)
-    outputs = model(**inputs)
-    predictions = torch.nn.functional.softmax(outputs.logits, dim=-1)
-    efficiency_score = predictions[0][0].item()  # Example: First class score
-    issue_score = predictions[0][1].item()  # Example: Second class score
-
-    # Interpret the results
-    if efficiency_score > issue_score:
-        return "Code seems efficient. No major issues detected."
-    else:
-        return "Code may have inefficiencies or potential issues to address."
+    tokenizer = AutoTokenizer.from_pretrained(model_path)
+    model = load_pretrained(AutoModelForSequenceClassification, model_path)
+    return tokenizer, model
 
 
-def extract_pylint_score(output):
-    """Extract the overall Pylint score from the output."""
-    for line in output.splitlines():
-        if "Your code has been rated at" in line:
-            match = re.search(r"rated at ([0-9\.]+)/10", line)
-            if match:
-                try:
-                    score = float(match.group(1))  # Extract and convert the score
-                    return score
-                except ValueError:
-                    return None
-    return None
+@metrics.timed("analyzer_stage_seconds", stage="ai_analysis")
+def analyze_code_with_ai(code_snippet, tokenizer, model, client=None):
+    """Analyze code snippet for inefficiencies or issues using CodeBERT, through the scoring server if given."""
+    if client is not None:
+        return client.analyze([code_snippet])[0]
+    return analyze_code_batch([code_snippet], tokenizer, model)[0]
 
 
 def setup_database():
-    """Set up SQLite database and table."""
-    conn = sqlite3.connect("code_analysis.db")  # Connect to the database file
-    cursor = conn.cursor()
-
-    # Create the pull_request_analysis table if it doesn't exist
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS pull_request_analysis (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            pull_request_id INTEGER,
-            title TEXT,
-            author TEXT,
-            file_name TEXT,
-            pylint_score REAL,
-            ai_analysis TEXT,
-            timestamp TEXT
-        )
-    """)
-    conn.commit()
-    conn.close()
+    """Open the database and bring its schema up to date."""
+    storage.get_connection()
 
 
-def save_results_to_database(pr_id, title, author, file_name, pylint_score, ai_analysis):
+@metrics.timed("analyzer_stage_seconds", stage="db_write")
+def save_results_to_database(pr_id, title, author, file_name, pylint_score, ai_analysis, analysis_mode="full"):
     """Save analysis results to the SQLite database."""
-    conn = sqlite3.connect("code_analysis.db")  # Connect to the database file
-    cursor = conn.cursor()
-
-    # Insert analysis results into the pull_request_analysis table
-    cursor.execute("""
-        INSERT INTO pull_request_analysis (
-            pull_request_id, title, author, file_name, pylint_score, ai_analysis, timestamp
-        ) VALUES (?, ?, ?, ?, ?, ?, ?)
-    """, (pr_id, title, author, file_name, pylint_score, ai_analysis, datetime.now().isoformat()))
-
-    conn.commit()
-    conn.close()
+    with storage.AnalysisWriter() as writer:
+        writer.add(pr_id, title, author, file_name, pylint_score, ai_analysis, analysis_mode)
 
 
 def create_status(repo, sha, state, description, context="Code Quality Check"):
     """Create a GitHub status check."""
-    repo.get_commit(sha).create_status(
-        state=state,  # "success" or "failure"
-        description=description,
-        context=context
-    )
-
+    with metrics.timer("github_api_seconds", call="create_status"):
+        repo.get_commit(sha).create_status(
+            state=state,  # "success" or "failure"
+            description=description,
+            context=context
+        )
 
-def send_email_notification(recipient_email, pr_id, status, overall_score):
-    """Send email notification to the contributor."""
-    sender_email = "your_email@example.com"  # Replace with your email
-    sender_password = "your_password"  # Replace with your email password or app-specific password
 
+def send_email_notification(recipient_email, pr_id, status, overall_score, outbox=None):
+    """Send email notification to the contributor, or queue it in the notification outbox."""
     subject = f"PR #{pr_id}: Code Quality Check {'Passed' if status == 'success' else 'Failed'}"
     body = f"""
     Hello,
@@ -113,27 +77,427 @@ def send_email_notification(recipient_email, pr_id, status, overall_score):
     Best,
     The Code Review Team
     """
-    msg = MIMEMultipart()
-    msg["From"] = sender_email
-    msg["To"] = recipient_email
-    msg["Subject"] = subject
-    msg.attach(MIMEText(body, "plain"))
+    if outbox is not None:
+        outbox.enqueue_email(recipient_email, subject, body)
+        return
 
+    session = SmtpSession.from_env()
     try:
-        with smtplib.SMTP("smtp.gmail.com", 587) as server:
-            server.starttls()
-            server.login(sender_email, sender_password)
-            server.sendmail(sender_email, recipient_email, msg.as_string())
+        session.send(recipient_email, subject, body)
     except Exception as e:
         print(f"Error sending email: {e}")
+    finally:
+        session.close()
+
+
+def parse_args(argv=None):
+    """Parse command line options for the analysis run."""
+    parser = argparse.ArgumentParser(description="Analyze open pull requests with Pylint and CodeBERT.")
+    parser.add_argument("--backend", choices=["torch", "int8", "onnx"], default="torch",
+                        help="Inference backend: PyTorch fp32, PyTorch dynamic int8, or an exported ONNX graph.")
+    parser.add_argument("--model", default="microsoft/codebert-base",
+                        help="Model name or checkpoint directory (the ONNX export directory for --backend onnx).")
+    parser.add_argument("--batch-size", type=int, default=16,
+                        help="Number of files scored per CodeBERT forward pass.")
+    parser.add_argument("--cascade-teacher", default=None,
+                        help="Full checkpoint that rescores the files a distilled --model is unsure about "
+                             "(see fine_tune_codebert.py --distill).")
+    parser.add_argument("--cascade-confidence", type=float, default=0.9,
+                        help="Student confidence (probability of its predicted class) below which a file goes "
+                             "to the --cascade-teacher.")
+    parser.add_argument("--batch-scope", choices=["pr", "all"], default="pr",
+                        help="Batch the model over the files of each PR, or over all open PRs at once.")
+    parser.add_argument("--reducer", choices=["max", "mean", "weighted"], default=None,
+                        help="Score long files over overlapping 512-token windows and combine them with this "
+                             "reducer instead of truncating at 512 tokens.")
+    parser.add_argument("--mode", choices=["full", "hunks"], default="full",
+                        help="Analyze whole files, or only the code enclosing each diff hunk.")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Bypass the result cache and re-lint and re-score every file.")
+    parser.add_argument("--cache-max-mb", type=float, default=64,
+                        help="Size limit of the result cache before least recently used entries are evicted.")
+    parser.add_argument("--no-embedding-store", action="store_true",
+                        help="Neither record snippet embeddings nor reuse the verdicts of similar past snippets.")
+    parser.add_argument("--reuse-threshold", default="auto",
+                        help="Cosine similarity above which a file takes the verdict of its nearest past snippet "
+                             "instead of being scored: 'auto' calibrates one per model against one-token edits "
+                             "of this repository (see benchmark_embeddings.py --calibrate), 'off' only records.")
+    parser.add_argument("--embedding-max-rows", type=int, default=100000,
+                        help="Snippet embeddings kept after a run; the oldest are pruned beyond it.")
+    parser.add_argument("--pylint-jobs", type=int, default=0,
+                        help="Worker processes for the per-PR Pylint run (0 uses every CPU).")
+    parser.add_argument("--scoring-server", default=os.getenv("SCORING_SERVER_URL", DEFAULT_URL),
+                        help="URL of a running scoring_server.py; the model is loaded in-process if it is not reachable.")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="Process pull requests concurrently through fetch, lint, inference and report stages.")
+    parser.add_argument("--fetch-workers", type=int, default=4,
+                        help="Threads fetching PR files from the GitHub API (pipeline mode).")
+    parser.add_argument("--lint-workers", type=int, default=2,
+                        help="Processes linting pull requests in parallel (pipeline mode).")
+    parser.add_argument("--report-workers", type=int, default=4,
+                        help="Threads saving results and posting comments and statuses (pipeline mode).")
+    parser.add_argument("--coalesce-prs", type=int, default=4,
+                        help="Waiting pull requests the inference worker scores in one batch (pipeline mode).")
+    parser.add_argument("--queue-size", type=int, default=8,
+                        help="Capacity of the queue in front of each pipeline stage.")
+    parser.add_argument("--json-logs", action="store_true",
+                        help="Write a JSON log line to stderr for every timed stage and API call.")
+    parser.add_argument("--all-prs", action="store_true",
+                        help="Analyze every open pull request, not only those whose head commit changed since the last run.")
+    parser.add_argument("--github-workers", type=int, default=8,
+                        help="Concurrent GitHub API requests when listing the files of several pull requests.")
+    parser.add_argument("--github-cache-max-mb", type=float, default=32,
+                        help="Size limit of the GitHub responses kept for conditional requests (LRU eviction).")
+    parser.add_argument("--content-source", choices=["api", "git", "worktree"], default="api",
+                        help="Read changed files at each PR's head commit through the GitHub API or a local bare "
+                             "git store, or from the working tree as before.")
+    parser.add_argument("--git-store", default="pr_objects.git",
+                        help="Bare repository that caches fetched PR heads (--content-source git).")
+    parser.add_argument("--dashboard-url", default=os.getenv("DASHBOARD_URL"),
+                        help="Base URL of the dashboard (app.py), used to link each PR comment to its full report.")
+    parser.add_argument("--sync-notifications", action="store_true",
+                        help="Post comments and statuses inline instead of through the background notification outbox.")
+    parser.add_argument("--email-notifications", action="store_true",
+                        help="Also email each PR author their result (SMTP settings from $SMTP_HOST, $SMTP_PORT, "
+                             "$SMTP_USERNAME, $SMTP_PASSWORD, $SMTP_SENDER).")
+    args = parser.parse_args(argv)
+    # Fail before any analysis rather than on the first queued email
+    if args.email_notifications and not (os.getenv("SMTP_SENDER") or os.getenv("SMTP_USERNAME")):
+        parser.error("--email-notifications needs a sender address: set $SMTP_SENDER or $SMTP_USERNAME")
+    if args.reuse_threshold not in ("auto", "off"):
+        try:
+            args.reuse_threshold = float(args.reuse_threshold)
+        except ValueError:
+            parser.error(f"--reuse-threshold must be 'auto', 'off' or a number, not '{args.reuse_threshold}'")
+    if args.embedding_max_rows < 1:
+        parser.error("--embedding-max-rows must be at least 1")
+    return args
+
+
+def fetch_pull_request_files(pr, mode="full", cache=None, cache_context=(), workspace=None):
+    """
+    List the files changed in a pull request and look each one up in the result cache.
+    Returns (rows, pending): finished rows for cache hits, and plain dicts describing the files
+    that still need Pylint and the model. With a `workspace` the pending files are staged there at
+    the PR's head commit; otherwise they are read from the working tree.
+    """
+    rows = []
+    pending = []
+    pending_files = []
+    with metrics.timer("github_api_seconds", call="get_files"):
+        files = list(pr.get_files())
+    for file in files:
+        print(f"- {file.filename}")
+        if workspace is not None and getattr(file, "status", None) == "removed":
+            # Nothing to analyze at the head commit
+            continue
+
+        cache_key = None
+        if cache is not None and cache.enabled and file.sha:
+            # Hunk results also depend on which lines the patch touches
+            patch_digest = hashlib.sha256((file.patch or "").encode()).hexdigest() if mode == "hunks" else ""
+            cache_key = cache.make_key(file.sha, *cache_context, mode, patch_digest)
+            cached = cache.get(cache_key)
+            if cached:
+                print(f"Using cached results for {file.filename}")
+                rows.append({
+                    "file_name": file.filename,
+                    "pylint_output": cached[0],
+                    "pylint_score": cached[1],
+                    "ai_analysis": cached[2],
+                    "code": None,
+                    "analysis_mode": mode if file.patch else "full",
+                    "cache_key": cache_key,
+                    "cached": True
+                })
+                continue
+        pending.append({"file_name": file.filename, "path": file.filename, "patch": file.patch, "cache_key": cache_key})
+        pending_files.append(file)
+
+    if workspace is not None and pending:
+        staged = workspace.stage(pr, pending_files)
+        for item in pending:
+            item["path"] = staged.get(item["file_name"])
+    return rows, pending
+
+
+def lint_and_prepare(pending, mode="full", pylint_jobs=0):
+    """
+    Lint the pending files of a pull request in one in-process Pylint run and read their code for the model.
+    In "hunks" mode only Pylint messages on changed lines are kept and the model only sees the
+    functions/classes enclosing the changes; files without a patch fall back to "full".
+    Only takes and returns plain data so it can run in a worker process.
+    """
+    print(f"Running Pylint on {len(pending)} files...")
+    paths = [item["path"] for item in pending if item["path"] is not None]
+    with metrics.timer("analyzer_stage_seconds", stage="pylint"):
+        lint_results = lint_files(paths, jobs=pylint_jobs,
+                                  display_names={item["path"]: item["file_name"] for item in pending})
+
+    rows = []
+    for item in pending:
+        pylint_output, pylint_score = lint_results.get(item["path"], ("File could not be fetched.", None))
+
+        try:
+            with open(item["path"], "r") as f:
+                code_content = f.read()
+        except Exception as e:
+            print(f"Error reading {item['file_name']} for AI analysis: {e}")
+            code_content = None
+
+        file_mode = "full"
+        if mode == "hunks" and item["patch"] and code_content is not None:
+            changed_lines = parse_changed_lines(item["patch"])
+            pylint_output = filter_pylint_output(pylint_output, changed_lines)
+            code_content = extract_hunk_code(code_content, item["patch"])
+            file_mode = "hunks"
+
+        rows.append({
+            "file_name": item["file_name"],
+            "pylint_output": pylint_output,
+            "pylint_score": pylint_score,
+            "code": code_content,
+            "analysis_mode": file_mode,
+            "cache_key": item["cache_key"],
+            "cached": False
+        })
+    return rows
+
+
+def collect_pull_request_files(pr, mode="full", cache=None, cache_context=(), pylint_jobs=0, workspace=None):
+    """
+    Lint every file changed in a pull request and read its code for the model.
+    Files whose blob is found in `cache` skip both Pylint and the model.
+    """
+    rows, pending = fetch_pull_request_files(pr, mode, cache, cache_context, workspace)
+    return rows + lint_and_prepare(pending, mode, pylint_jobs)
+
+
+def store_cached_results(cache, rows):
+    """Remember freshly computed results so unchanged files are skipped on the next run."""
+    if cache is None:
+        return
+    cache.put_many([
+        (row["cache_key"], row["pylint_output"], row["pylint_score"], row["ai_analysis"])
+        for row in rows
+        if row["cache_key"] and not row["cached"] and row["ai_analysis"] != "AI analysis failed."
+    ])
+
+
+def run_ai_analysis(rows, scorer, reducer=None, similar=None):
+    """
+    Score the code of all collected rows in one batched pass and attach each verdict to its row.
+    `scorer` is an inference backend or a scoring server client; both expose `score(snippets, reducer)`.
+    With `similar` (an embedding_store.SimilarVerdicts) every row is embedded for the store first, and rows
+    nearly identical to a past snippet take its verdict instead of being scored.
+    """
+    scorable = [row for row in rows if row["code"] is not None]
+    try:
+        if similar is not None and scorable:
+            with metrics.timer("analyzer_stage_seconds", stage="embedding"):
+                scorable = similar.reuse(scorable)
+        with metrics.timer("analyzer_stage_seconds", stage="inference"):
+            probabilities = scorer.score([row["code"] for row in scorable], reducer=reducer)
+        for row, probability in zip(scorable, probabilities):
+            row["issue_probability"] = probability
+        verdicts = [verdict_from_probability(probability) for probability in probabilities]
+    except Exception as e:
+        print(f"Error running AI analysis: {e}")
+        metrics.increment("ai_analysis_failures_total")
+        for row in scorable:
+            row["issue_probability"] = None
+        verdicts = ["AI analysis failed."] * len(scorable)
+    metrics.increment("files_scored_total", len(scorable))
+
+    for row, verdict in zip(scorable, verdicts):
+        row["ai_analysis"] = verdict
+    for row in rows:
+        row.setdefault("ai_analysis", "AI analysis failed.")
+
+
+@metrics.timed("analyzer_stage_seconds", stage="db_write")
+def store_embeddings(similar, pr, rows):
+    """Record the embedding and verdict of every freshly analyzed file of a pull request."""
+    if similar is not None:
+        similar.record(pr.number, rows)
+
 
+@metrics.timed("analyzer_stage_seconds", stage="render")
+def render_comment(rows, cache=None, report_url=None):
+    """Build the size-bounded PR summary comment from the analyzed rows; returns (comment, overall_score)."""
+    return pr_comment.render_comment(rows, cache, report_url)
 
-def main():
+
+@metrics.timed("analyzer_stage_seconds", stage="db_write")
+def save_rows(pr, rows, db_path=storage.DB_PATH):
+    """Save the per-file results of a pull request together in one transaction."""
+    with storage.AnalysisWriter(db_path) as writer:
+        for row in rows:
+            writer.add(pr.number, pr.title, pr.user.login, row["file_name"],
+                       row["pylint_score"], row["ai_analysis"], row["analysis_mode"])
+    storage.record_analyzed_head(pr.number, pr.head.sha, db_path)
+
+
+def report_pull_request(repo, pr, rows, cache=None, outbox=None, email=False, dashboard_url=None):
+    """
+    Save per-file results, then update the summary comment and post the status check for a pull request.
+    With an `outbox` the comment, status and email are queued for the background dispatcher instead.
+    """
+    save_rows(pr, rows)
+    report_url = f"{dashboard_url.rstrip('/')}/pull_requests/{pr.number}/report" if dashboard_url else None
+    notification_message, overall_score = render_comment(rows, cache, report_url)
+    storage.save_pr_report(pr.number, pr.head.sha, pr_comment.render_full_report(rows, cache))
+    print(f"Overall Pylint Score for PR #{pr.number}: {overall_score}")
+
+    # Determine success or failure
+    status_state = "success" if overall_score >= 5.0 else "failure"
+    status_description = f"Overall Pylint Score: {overall_score:.2f}/10"
+    recipient = pr.user.email if email else None
+    comment_unchanged = pr_comment.comment_unchanged(pr.number, notification_message)
+    if comment_unchanged:
+        print("The PR comment is already up to date.")
+
+    if outbox is not None:
+        if not comment_unchanged:
+            outbox.enqueue_comment(pr.number, notification_message)
+        outbox.enqueue_status(pr.head.sha, status_state, status_description)
+        if recipient:
+            send_email_notification(recipient, pr.number, status_state, overall_score, outbox)
+        print("Queued notifications for the pull request.")
+        return
+
+    if not comment_unchanged:
+        pr_comment.publish_comment(pr, notification_message)
+        print("Posted notification to the pull request.")
+
+    # Create a GitHub status check
+    create_status(repo, pr.head.sha, status_state, status_description)
+    if recipient:
+        send_email_notification(recipient, pr.number, status_state, overall_score)
+
+
+def record_pr_timings(pr, total_seconds, breakdown):
+    """Persist and log where the time of one pull request went, so slow PRs can be diagnosed later."""
+    storage.save_pr_timings(pr.number, total_seconds, breakdown)
+    metrics.observe("pull_request_seconds", total_seconds)
+    metrics.log_event("pr_timings", pull_request=pr.number, total_seconds=round(total_seconds, 6),
+                      breakdown={key: round(value, 6) for key, value in breakdown.items()})
+
+
+def share_timings(shared, jobs, breakdowns):
+    """Charge the time of work done for several PRs at once to each PR in proportion to its files."""
+    total_files = max(sum(len(rows) for _, rows in jobs), 1)
+    for pr, rows in jobs:
+        breakdown = breakdowns[pr.number]
+        for key, seconds in shared.items():
+            breakdown[key] = breakdown.get(key, 0.0) + seconds * len(rows) / total_files
+
+
+def run_pipeline(repo, pulls, scorer, cache, cache_context, args, outbox=None, workspace=None, similar=None):
+    """
+    Analyze pull requests concurrently: GitHub fetches and reports run on thread pools, linting on a
+    process pool and model inference on one dedicated worker that batches the files of several PRs.
+    """
+    # Per-PR timing breakdowns, filled in by whichever worker thread handles each stage
+    breakdowns = {}
+    started = {}
+
+    def fetch(pr):
+        started[pr.number] = time.perf_counter()
+        print(f"- PR #{pr.number}: {pr.title} by {pr.user.login}")
+        with metrics.collect(breakdowns.setdefault(pr.number, {})):
+            rows, pending = fetch_pull_request_files(pr, args.mode, cache, cache_context, workspace)
+        return pr, rows, pending
+
+    def lint(job):
+        pr, rows, pending = job
+        if pending:
+            # Timed here because timers inside the lint worker process are not visible to this one
+            with metrics.collect(breakdowns[pr.number]), metrics.timer("analyzer_stage_seconds", stage="pylint"):
+                rows = rows + lint_pool.submit(lint_and_prepare, pending, args.mode, args.pylint_jobs).result()
+        return pr, rows
+
+    def infer(jobs):
+        all_rows = [row for _, rows in jobs for row in rows]
+        with metrics.collect() as shared:
+            run_ai_analysis(all_rows, scorer, args.reducer, similar)
+        share_timings(shared, jobs, breakdowns)
+        return jobs
+
+    def report(job):
+        pr, rows = job
+        with metrics.collect(breakdowns[pr.number]):
+            store_cached_results(cache, rows)
+            store_embeddings(similar, pr, rows)
+            report_pull_request(repo, pr, rows, cache, outbox, args.email_notifications, args.dashboard_url)
+        record_pr_timings(pr, time.perf_counter() - started.pop(pr.number), breakdowns.pop(pr.number))
+
+    with ProcessPoolExecutor(max_workers=args.lint_workers) as lint_pool:
+        pipeline = Pipeline([
+            Stage("fetch", fetch, workers=args.fetch_workers, queue_size=args.queue_size),
+            Stage("lint", lint, workers=args.lint_workers, queue_size=args.queue_size),
+            Stage("inference", infer, workers=1, queue_size=args.queue_size, batch_size=args.coalesce_prs),
+            Stage("report", report, workers=args.report_workers, queue_size=args.queue_size)
+        ])
+        pipeline.run(pulls)
+    pipeline.report()
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        run(args)
+    finally:
+        # CI caches only code_analysis.db, so nothing may be left in the -wal file
+        storage.close_connections(checkpoint=True)
+
+
+def run(args):
+    """One analysis run over the open pull requests."""
     # Step 1: Set up the database
     setup_database()
 
-    # Load the model
-    tokenizer, model = load_model()
+    if args.json_logs:
+        metrics.enable_json_logs(sys.stderr)
+
+    # Use the long-lived scoring server if one is running, otherwise load the configured backend here
+    client = ScoringClient(args.scoring_server) if args.scoring_server else None
+    if client is not None and client.available():
+        print(f"Scoring with the server at {args.scoring_server}")
+        scorer = client
+    else:
+        client = None
+        with metrics.timer("analyzer_stage_seconds", stage="load_model"):
+            scorer = load_backend(args.backend, args.model, batch_size=args.batch_size,
+                                  cascade_teacher=args.cascade_teacher, cascade_confidence=args.cascade_confidence)
+
+    # Results are reused across runs for files whose content, linter and model are unchanged
+    cache = ResultCache(max_bytes=int(args.cache_max_mb * 1024 * 1024), enabled=not args.no_cache)
+    cache_context = (pylint_fingerprint(), scorer.fingerprint(), args.reducer)
+
+    # Every analyzed file is recorded by an embedding from the model's first layers; near-identical code
+    # analyzed in earlier PRs takes its past verdict instead of being scored
+    similar = None
+    if not args.no_embedding_store and getattr(scorer, "embedding_forward", None) is None:
+        print("The embedding store needs to run the model's first layers; it is off for this backend.")
+    elif not args.no_embedding_store:
+        from embedding_store import EmbeddingStore, SimilarVerdicts, model_calibration
+
+        model = "|".join(str(part) for part in cache_context[1:])
+        try:
+            # Measured once per model and kept in code_analysis.db
+            with metrics.timer("analyzer_stage_seconds", stage="calibration"):
+                center, threshold = model_calibration(scorer, model)
+        except ValueError as e:
+            print(f"Could not calibrate the embedding store, so it is off: {e}")
+        else:
+            if args.reuse_threshold == "off":
+                threshold = None
+            elif args.reuse_threshold != "auto":
+                threshold = args.reuse_threshold
+            elif threshold is None:
+                print("One-token edits stay as similar as unchanged code under this model; verdict reuse is off.")
+            similar = SimilarVerdicts(EmbeddingStore(), scorer, model, center, threshold)
 
     # Fetch the GitHub token from environment variables
     GITHUB_TOKEN = os.getenv("GITHUB_TOKEN")
@@ -142,79 +506,109 @@ def main():
     if not GITHUB_TOKEN:
         raise ValueError("GITHUB_TOKEN environment variable is not set!")
 
-    # Authenticate with GitHub
-    g = Github(GITHUB_TOKEN)
+    # Conditional requests against the GitHub API, answered from code_analysis.db when nothing changed
+    github = GitHubClient(GITHUB_TOKEN, max_workers=args.github_workers,
+                          cache_max_bytes=int(args.github_cache_max_mb * 1024 * 1024))
 
     # Specify the repository
     REPO_NAME = "ReetikaNEU/AI_Code_Review"
-    repo = g.get_repo(REPO_NAME)
+    repo = github.get_repo(REPO_NAME)
 
     # Fetch open pull requests
-    pulls = repo.get_pulls(state='open', sort='created', base='main')
+    with metrics.timer("github_api_seconds", call="get_pulls"):
+        pulls = repo.get_pulls(state='open', sort='created', base='main')
+
+    # Skip pull requests whose head commit was already analyzed
+    if not args.all_prs:
+        heads = storage.analyzed_heads()
+        unchanged = [pr.number for pr in pulls if heads.get(pr.number) == pr.head.sha]
+        pulls = [pr for pr in pulls if heads.get(pr.number) != pr.head.sha]
+        if unchanged:
+            print(f"Skipping {len(unchanged)} unchanged pull requests: {', '.join(f'#{n}' for n in unchanged)}")
+    if not args.pipeline:
+        # The pipeline's fetch stage is already concurrent
+        with metrics.timer("github_api_seconds", call="prefetch_files"):
+            repo.prefetch_files(pulls)
+
+    # Changed files are analyzed as they are at each PR's head commit, not as in the local checkout
+    workspace = None
+    if args.content_source == "api":
+        workspace = Workspace(ApiBlobSource(repo))
+    elif args.content_source == "git":
+        remote_url = f"{os.getenv('GITHUB_SERVER_URL', 'https://github.com')}/{REPO_NAME}.git"
+        workspace = Workspace(GitObjectStore(args.git_store, remote_url, GITHUB_TOKEN))
+    if workspace is not None:
+        # Staged files may live in RAM (/dev/shm), so remove them even if the run fails
+        atexit.register(workspace.close)
+
+    # Comments, statuses and emails are delivered in the background so GitHub and SMTP latency never
+    # holds up the next pull request; undelivered messages stay in the outbox for the next run
+    outbox = dispatcher = None
+    if not args.sync_notifications:
+        outbox = Outbox()
+        smtp = SmtpSession.from_env() if args.email_notifications else None
+        dispatcher = NotificationDispatcher(outbox, repo, smtp).start()
 
     print(f"Open Pull Requests in {REPO_NAME}:")
-    for pr in pulls:
-        print(f"- PR #{pr.number}: {pr.title} by {pr.user.login}")
-
-        # Fetch files changed in the pull request
-        pylint_summary = ""
-        pylint_scores = []
-        for file in pr.get_files():
-            print(f"- {file.filename}")
-
-            # Run Pylint on the changed file
-            print(f"Running Pylint on {file.filename}...")
-            result = subprocess.run(
-                ["pylint", file.filename],
-                capture_output=True,
-                text=True
-            )
-
-            # Extract Pylint score from the output
-            pylint_output = result.stdout
-            pylint_summary += f"\n### Pylint Report for {file.filename}:\n```\n{pylint_output}\n```\n"
-            score = extract_pylint_score(pylint_output)
-            if score is not None:
-                pylint_scores.append(score)
-
-            # AI Analysis
-            try:
-                with open(file.filename, "r") as f:
-                    code_content = f.read()
-                ai_results = analyze_code_with_ai(code_content, tokenizer, model)
-                pylint_summary += f"\n### AI Analysis for {file.filename}:\n{ai_results}\n"
-            except Exception as e:
-                print(f"Error analyzing {file.filename} with AI: {e}")
-                ai_results = "AI analysis failed."
-
-            # Save results to the database
-            save_results_to_database(pr.number, pr.title, pr.user.login, file.filename, score, ai_results)
-
-        # Compute overall Pylint score
-        overall_score = sum(pylint_scores) / len(pylint_scores) if pylint_scores else 0
-        print(f"Overall Pylint Score for PR #{pr.number}: {overall_score}")
-
-        # Determine success or failure
-        status_state = "success" if overall_score >= 5.0 else "failure"
-        status_description = f"Overall Pylint Score: {overall_score:.2f}/10"
-
-        # Create a comment notifying the contributor
-        notification_message = f"""
-### Static Code Analysis Results
-- **Overall Pylint Score**: {overall_score:.2f}/10
-- **Status**: {"✅ Passed" if status_state == "success" else "❌ Failed"}
-
-### Detailed Results:
-{pylint_summary}
-
-If you have questions or need help resolving the issues, please reach out!
-        """
-        pr.create_issue_comment(notification_message)
-        print("Posted notification to the pull request.")
-
-        # Create a GitHub status check
-        create_status(repo, pr.head.sha, status_state, status_description)
+    if args.pipeline:
+        run_pipeline(repo, pulls, scorer, cache, cache_context, args, outbox, workspace, similar)
+    elif args.batch_scope == "all":
+        # Lint everything first, then score the files of every open PR in shared batches
+        jobs = []
+        breakdowns = {}
+        elapsed = {}
+        for pr in pulls:
+            print(f"- PR #{pr.number}: {pr.title} by {pr.user.login}")
+            start = time.perf_counter()
+            with metrics.collect(breakdowns.setdefault(pr.number, {})):
+                jobs.append((pr, collect_pull_request_files(pr, args.mode, cache, cache_context, args.pylint_jobs, workspace)))
+            elapsed[pr.number] = time.perf_counter() - start
+        all_rows = [row for _, rows in jobs for row in rows]
+        start = time.perf_counter()
+        with metrics.collect() as shared:
+            run_ai_analysis(all_rows, scorer, args.reducer, similar)
+            store_cached_results(cache, all_rows)
+        share_timings(shared, jobs, breakdowns)
+        shared_seconds = time.perf_counter() - start
+        for pr, rows in jobs:
+            start = time.perf_counter()
+            with metrics.collect(breakdowns[pr.number]):
+                store_embeddings(similar, pr, rows)
+                report_pull_request(repo, pr, rows, cache, outbox, args.email_notifications, args.dashboard_url)
+            shared_share = shared_seconds * len(rows) / max(len(all_rows), 1)
+            record_pr_timings(pr, elapsed[pr.number] + shared_share + time.perf_counter() - start,
+                              breakdowns[pr.number])
+    else:
+        for pr in pulls:
+            print(f"- PR #{pr.number}: {pr.title} by {pr.user.login}")
+            start = time.perf_counter()
+            with metrics.collect() as breakdown:
+                rows = collect_pull_request_files(pr, args.mode, cache, cache_context, args.pylint_jobs, workspace)
+                run_ai_analysis(rows, scorer, args.reducer, similar)
+                store_cached_results(cache, rows)
+                store_embeddings(similar, pr, rows)
+                report_pull_request(repo, pr, rows, cache, outbox, args.email_notifications, args.dashboard_url)
+            record_pr_timings(pr, time.perf_counter() - start, breakdown)
+
+    if dispatcher is not None:
+        dispatcher.stop(drain=True)
+        print(f"Delivered {dispatcher.sent} notifications.")
+    if workspace is not None:
+        print(f"Read {workspace.blobs_read} distinct blobs at the PR heads.")
+    print(f"GitHub API: {github.summary()}")
+    if cache.enabled:
+        print(f"Result cache: {cache.summary()}")
+    if similar is not None:
+        print(f"Reused the verdicts of similar past snippets for {similar.reused} files.")
+        pruned = similar.store.prune(args.embedding_max_rows)
+        if pruned:
+            print(f"Pruned the {pruned} oldest snippet embeddings.")
+    if isinstance(scorer, CascadeBackend):
+        print(f"Cascade: {scorer.summary()}")
+    if client is not None:
+        print(f"Scoring server latency: {client.stats()['latency_ms']}")
+    metrics.log_event("run_summary", **metrics.snapshot())
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,22 +1,37 @@
+import argparse
 import json
+from dataset_shards import ShardWriter, iter_samples
 
 # Define capping thresholds
 NUM_LINES_THRESHOLD = 500
-NESTED_IF_THRESHOLD = 50
+IF_COUNT_THRESHOLD = 50
 LOOP_COUNT_THRESHOLD = 10
 
-# Load the dataset
-with open("test_dataset_augmented.json", "r") as f:
-    test_data = json.load(f)
 
-# Apply capping
-for item in test_data:
+def cap_sample(item):
     item["num_lines"] = min(item.get("num_lines", 0), NUM_LINES_THRESHOLD)
-    item["nested_if_count"] = min(item.get("nested_if_count", 0), NESTED_IF_THRESHOLD)
+    item["if_count"] = min(item.get("if_count", 0), IF_COUNT_THRESHOLD)
     item["loop_count"] = min(item.get("loop_count", 0), LOOP_COUNT_THRESHOLD)
+    return item
 
-# Save the updated dataset
-with open("test_dataset_augmented_filtered.json", "w") as f:
-    json.dump(test_data, f, indent=4)
 
-print("Filtered dataset saved as test_dataset_augmented_filtered.json")
\ No newline at end of file
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cap outlying complexity tags in a prepared dataset.")
+    parser.add_argument("--input", default="test_dataset_augmented.json",
+                        help="A JSON file or a directory of shards written by prepare_dataset.py.")
+    parser.add_argument("--output", default="test_dataset_augmented_filtered.json")
+    parser.add_argument("--format", choices=["json", "jsonl", "parquet"], default="json",
+                        help="jsonl and parquet stream the capped samples into shards in the --output directory.")
+    parser.add_argument("--shard-size", type=int, default=10000)
+    args = parser.parse_args()
+
+    # Apply capping and save the updated dataset
+    if args.format == "json":
+        with open(args.output, "w") as f:
+            json.dump([cap_sample(item) for item in iter_samples(args.input)], f, indent=4)
+    else:
+        with ShardWriter(args.output, shard_size=args.shard_size, format=args.format) as writer:
+            for item in iter_samples(args.input):
+                writer.write(cap_sample(item))
+
+    print(f"Filtered dataset saved as {args.output}")
@@ -1,12 +1,25 @@
+import argparse
+import copy
+import time
 from transformers import RobertaTokenizer, TrainingArguments, Trainer, RobertaModel, RobertaPreTrainedModel
 import torch
 import torch.nn as nn
-from torch.utils.data import Dataset
+import torch.nn.functional as F
+from torch.utils.data import DataLoader, Dataset
 from prepare_dataset import load_defect_detection_dataset
-from transformers import RobertaForSequenceClassification
+from dataset_shards import load_shards
+from token_cache import CACHE_ROOT, TokenizedDataset, get_token_cache
+from models import RobertaWithoutAuxiliaryFeatures
+from transformers.trainer_pt_utils import LengthGroupedSampler
+from dynamic_batching import DynamicPaddingCollator, PaddingStats, dataset_lengths
+from inference import bucket_by_length
+from checkpoints import load_pretrained
 
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
+# The fine-tuned checkpoint the student learns from (see test_codebert.py)
+TEACHER_PATH = "./fine_tuned_codebert/checkpoint-2504"
+
 
 class CodeDataset(Dataset):
     def __init__(self, data, tokenizer, max_length=256):  # Reduced max length
@@ -31,7 +44,7 @@ class CodeDataset(Dataset):
         inputs["auxiliary_features"] = torch.tensor(
             [
                 item.get("num_lines", 0),
-                item.get("nested_if_count", 0),
+                item.get("if_count", 0),
                 item.get("loop_count", 0)
             ],
             dtype=torch.float32
@@ -39,25 +52,156 @@ class CodeDataset(Dataset):
         return inputs
 
 
-class RobertaWithoutAuxiliaryFeatures(RobertaForSequenceClassification):
-    def __init__(self, config):
-        super().__init__(config)
+class LengthGroupedTrainer(Trainer):
+    """
+    Trainer that draws batches of similar-length samples (when `train_lengths` is given) and logs
+    the real tokens per second and the share of pad tokens in the batches it trains on.
+    """
+
+    def __init__(self, *args, train_lengths=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.train_lengths = train_lengths
+        self.padding_stats = PaddingStats()
+        self.stats_start = None
+
+    def _get_train_sampler(self, *args, **kwargs):
+        if self.train_lengths is None:
+            return super()._get_train_sampler(*args, **kwargs)
+        return LengthGroupedSampler(self.args.train_batch_size * self.args.gradient_accumulation_steps,
+                                    lengths=self.train_lengths)
+
+    def training_step(self, model, inputs, *args, **kwargs):
+        if self.stats_start is None:
+            self.stats_start = time.perf_counter()
+        self.padding_stats.update(inputs["attention_mask"])
+        return super().training_step(model, inputs, *args, **kwargs)
+
+    def log(self, logs, *args, **kwargs):
+        if self.stats_start is not None:
+            self.padding_stats.seconds = time.perf_counter() - self.stats_start
+            logs["tokens_per_second"] = round(self.padding_stats.tokens_per_second, 1)
+            logs["pad_ratio"] = round(self.padding_stats.pad_ratio, 4)
+        super().log(logs, *args, **kwargs)
+
+
+class SoftTargetDataset(Dataset):
+    """Adds the teacher's logits for each sample to the items of a tokenized dataset."""
+
+    def __init__(self, dataset, teacher_logits):
+        self.dataset = dataset
+        self.teacher_logits = teacher_logits
+        self.lengths = getattr(dataset, "lengths", None)
+
+    def __len__(self):
+        return len(self.dataset)
+
+    def __getitem__(self, idx):
+        item = dict(self.dataset[idx])
+        item["teacher_logits"] = self.teacher_logits[idx]
+        return item
+
+
+class DistillationTrainer(LengthGroupedTrainer):
+    """
+    Trains a student on a blend of the teacher's temperature-softened probabilities and the true labels:
+    `alpha` * T^2 * KL(teacher || student) + (1 - `alpha`) * cross-entropy. Items without teacher
+    logits (the validation set) are scored on the labels alone.
+    """
+
+    def __init__(self, *args, temperature=2.0, alpha=0.5, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.temperature = temperature
+        self.alpha = alpha
+        self.last_soft_loss = None
+
+    def compute_loss(self, model, inputs, return_outputs=False, **kwargs):
+        outputs = model(input_ids=inputs["input_ids"], attention_mask=inputs["attention_mask"])
+        loss = F.cross_entropy(outputs.logits, inputs["labels"])
+        teacher_logits = inputs.get("teacher_logits")
+        if teacher_logits is not None:
+            soft_loss = F.kl_div(
+                F.log_softmax(outputs.logits / self.temperature, dim=-1),
+                F.softmax(teacher_logits / self.temperature, dim=-1),
+                reduction="batchmean"
+            ) * self.temperature ** 2  # keeps the soft-target gradients on the scale of the hard ones
+            self.last_soft_loss = soft_loss.item()
+            loss = self.alpha * soft_loss + (1 - self.alpha) * loss
+        return (loss, outputs) if return_outputs else loss
+
+
+def make_student(teacher, num_layers=6):
+    """
+    A shallower copy of the teacher: same embeddings, hidden size and classifier, keeping `num_layers`
+    encoder layers picked at even intervals (the top one included) so training starts from the teacher's weights.
+    """
+    if not 1 <= num_layers <= teacher.config.num_hidden_layers:
+        raise ValueError(f"The student needs 1 to {teacher.config.num_hidden_layers} layers, got {num_layers}")
+    config = copy.deepcopy(teacher.config)
+    config.num_hidden_layers = num_layers
+    student = type(teacher)(config)
+    kept = [round((i + 1) * teacher.config.num_hidden_layers / num_layers) - 1 for i in range(num_layers)]
+
+    state_dict = {}
+    for key, value in teacher.state_dict().items():
+        if ".encoder.layer." in key:
+            prefix, rest = key.split(".encoder.layer.", 1)
+            layer, rest = rest.split(".", 1)
+            if int(layer) not in kept:
+                continue
+            key = f"{prefix}.encoder.layer.{kept.index(int(layer))}.{rest}"
+        state_dict[key] = value.clone()
+    student.load_state_dict(state_dict)
+    print(f"Student keeps teacher layers {kept} of {teacher.config.num_hidden_layers}")
+    return student
+
 
+def teacher_logits(teacher, dataset, batch_size=32):
+    """
+    The teacher's logits for every sample, computed once in length-bucketed batches so each epoch of the
+    student reuses them instead of running the teacher again.
+    """
+    teacher.eval()
+    logits = torch.zeros((len(dataset), teacher.config.num_labels))
+    batches = bucket_by_length(dataset_lengths(dataset), batch_size)
+    loader = DataLoader(dataset, batch_sampler=batches, collate_fn=DynamicPaddingCollator())
+    with torch.inference_mode():
+        for batch_indices, batch in zip(batches, loader):
+            outputs = teacher(input_ids=batch["input_ids"].to(teacher.device),
+                              attention_mask=batch["attention_mask"].to(teacher.device))
+            logits[batch_indices] = outputs.logits.float().cpu()
+    return logits
 
-def fine_tune_codebert():
-    # Load datasets
-    train_dataset, valid_dataset, _ = load_defect_detection_dataset()
+
+def take(dataset, count):
+    """First `count` samples of a list or a memory-mapped `datasets.Dataset`."""
+    if isinstance(dataset, list):
+        return dataset[:count]
+    return dataset.select(range(min(count, len(dataset))))
+
+
+def fine_tune_codebert(train_path=None, valid_path=None, token_cache_root=CACHE_ROOT, dynamic_padding=True,
+                       group_by_length=True):
+    # Load datasets: prepared shards are memory-mapped, otherwise the splits are prepared as Arrow datasets
+    if train_path and valid_path:
+        train_dataset, valid_dataset = load_shards(train_path), load_shards(valid_path)
+    else:
+        train_dataset, valid_dataset, _ = load_defect_detection_dataset()
 
     # Reduce dataset size for faster training
-    train_dataset = train_dataset[:2000]  # Using 2000 samples for training
-    valid_dataset = valid_dataset[:500]  # Using 500 samples for validation
+    train_dataset = take(train_dataset, 2000)  # Using 2000 samples for training
+    valid_dataset = take(valid_dataset, 500)  # Using 500 samples for validation
 
     tokenizer = RobertaTokenizer.from_pretrained("microsoft/codebert-base")
     model = RobertaWithoutAuxiliaryFeatures.from_pretrained("microsoft/codebert-base", num_labels=2)
     model.to(device)
 
-    train_data = CodeDataset(train_dataset, tokenizer)
-    valid_data = CodeDataset(valid_dataset, tokenizer)
+    # Tokenize once into memory-mapped arrays that every epoch and dataloader worker reuses
+    if token_cache_root:
+        train_data = TokenizedDataset(get_token_cache(train_dataset, tokenizer, 256, token_cache_root))
+        valid_data = TokenizedDataset(get_token_cache(valid_dataset, tokenizer, 256, token_cache_root))
+    else:
+        train_data = CodeDataset(train_dataset, tokenizer)
+        valid_data = CodeDataset(valid_dataset, tokenizer)
 
     # Training arguments with corrected evaluation and save strategy
     training_args = TrainingArguments(
@@ -77,17 +221,21 @@ def fine_tune_codebert():
     report_to="none"  # Disable W&B integration
 )
 
-    trainer = Trainer(
+    # Trim each batch to its longest sample and batch similar lengths together
+    trainer = LengthGroupedTrainer(
         model=model,
         args=training_args,
         train_dataset=train_data,
         eval_dataset=valid_data,
-        tokenizer=tokenizer
+        tokenizer=tokenizer,
+        data_collator=DynamicPaddingCollator() if dynamic_padding else None,
+        train_lengths=dataset_lengths(train_data) if group_by_length else None
     )
 
     # Start training
     print("Starting training...")
     trainer.train()
+    print(f"Trained on {trainer.padding_stats.summary()}")
 
     # Save the fine-tuned model
     model.save_pretrained("./fine_tuned_codebert_with_aux")
@@ -95,5 +243,111 @@ def fine_tune_codebert():
     print("Fine-tuned model saved successfully!")
 
 
+def distillation_arguments(output_dir, **overrides):
+    """TrainingArguments of `distill_codebert`; `overrides` replace individual settings."""
+    settings = dict(
+        output_dir=output_dir,
+        evaluation_strategy="epoch",
+        save_strategy="epoch",
+        learning_rate=5e-5,  # the student starts from teacher weights but has more to relearn
+        per_device_train_batch_size=8,
+        num_train_epochs=3,
+        weight_decay=0.01,
+        load_best_model_at_end=True,
+        logging_dir="./logs",
+        logging_steps=10,
+        fp16=torch.cuda.is_available(),
+        dataloader_num_workers=2,
+        report_to="none",
+        # The Trainer otherwise drops every input the model's forward() does not take, teacher_logits included
+        remove_unused_columns=False
+    )
+    settings.update(overrides)
+    return TrainingArguments(**settings)
+
+
+def distill_codebert(teacher_path=TEACHER_PATH, output_dir="./distilled_codebert", num_layers=6, temperature=2.0,
+                     alpha=0.5, train_path=None, valid_path=None, token_cache_root=CACHE_ROOT, group_by_length=True,
+                     train_samples=2000, valid_samples=500):
+    """
+    Distill the fine-tuned teacher into a `num_layers`-layer student on the teacher's soft targets.
+    The student is saved as a regular RoBERTa classifier checkpoint, so `load_model()` and every
+    inference backend load it in place of the teacher.
+    """
+    if train_path and valid_path:
+        train_dataset, valid_dataset = load_shards(train_path), load_shards(valid_path)
+    else:
+        train_dataset, valid_dataset, _ = load_defect_detection_dataset()
+    train_dataset = take(train_dataset, train_samples)
+    valid_dataset = take(valid_dataset, valid_samples)
+
+    tokenizer = RobertaTokenizer.from_pretrained(teacher_path)
+    teacher = load_pretrained(RobertaWithoutAuxiliaryFeatures, teacher_path)
+    teacher.to(device)
+    student = make_student(teacher, num_layers)
+    student.to(device)
+
+    if token_cache_root:
+        train_data = TokenizedDataset(get_token_cache(train_dataset, tokenizer, 256, token_cache_root),
+                                      auxiliary_features=False)
+        valid_data = TokenizedDataset(get_token_cache(valid_dataset, tokenizer, 256, token_cache_root),
+                                      auxiliary_features=False)
+    else:
+        train_data = CodeDataset(train_dataset, tokenizer)
+        valid_data = CodeDataset(valid_dataset, tokenizer)
+
+    print(f"Scoring {len(train_data)} training samples with the teacher...")
+    train_data = SoftTargetDataset(train_data, teacher_logits(teacher, train_data))
+    teacher.to("cpu")  # only its logits are needed from here on
+    del teacher
+
+    training_args = distillation_arguments(output_dir)
+
+    trainer = DistillationTrainer(
+        model=student,
+        args=training_args,
+        train_dataset=train_data,
+        eval_dataset=valid_data,
+        tokenizer=tokenizer,
+        data_collator=DynamicPaddingCollator(),
+        train_lengths=dataset_lengths(train_data) if group_by_length else None,
+        temperature=temperature,
+        alpha=alpha
+    )
+
+    print(f"Distilling into a {num_layers}-layer student...")
+    trainer.train()
+    print(f"Trained on {trainer.padding_stats.summary()}")
+
+    student.save_pretrained(output_dir)
+    tokenizer.save_pretrained(output_dir)
+    print(f"Student model saved to {output_dir}")
+
+
 if __name__ == "__main__":
-    fine_tune_codebert()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Fine-tune CodeBERT on the Defect Detection dataset.")
+    parser.add_argument("--train-data", help="Training shards written by prepare_dataset.py --format jsonl|parquet.")
+    parser.add_argument("--valid-data", help="Validation shards written by prepare_dataset.py --format jsonl|parquet.")
+    parser.add_argument("--token-cache", default=CACHE_ROOT, help="Root directory of the pre-tokenized caches.")
+    parser.add_argument("--no-token-cache", action="store_true", help="Tokenize every sample on every access.")
+    parser.add_argument("--padding", choices=["dynamic", "max_length"], default="dynamic",
+                        help="Trim each batch to its longest sample, or pad every sample to the full 256 tokens.")
+    parser.add_argument("--no-group-by-length", action="store_true", help="Draw batches in plain random order.")
+    parser.add_argument("--distill", action="store_true",
+                        help="Train a small student on the soft targets of a fine-tuned teacher instead.")
+    parser.add_argument("--teacher", default=TEACHER_PATH, help="Fine-tuned checkpoint to distill (--distill).")
+    parser.add_argument("--student-layers", type=int, default=6, help="Encoder layers of the student, at most the teacher's (--distill).")
+    parser.add_argument("--temperature", type=float, default=2.0, help="Softmax temperature of the soft targets.")
+    parser.add_argument("--alpha", type=float, default=0.5,
+                        help="Weight of the soft-target loss against the cross-entropy on the labels.")
+    parser.add_argument("--output-dir", default="./distilled_codebert", help="Where the student is saved (--distill).")
+    args = parser.parse_args()
+    if args.student_layers < 1:
+        parser.error("--student-layers must be at least 1")
+    if args.distill:
+        distill_codebert(args.teacher, args.output_dir, args.student_layers, args.temperature, args.alpha,
+                         args.train_data, args.valid_data, None if args.no_token_cache else args.token_cache,
+                         not args.no_group_by_length)
+    else:
+        fine_tune_codebert(args.train_data, args.valid_data, None if args.no_token_cache else args.token_cache,
+                           args.padding == "dynamic", not args.no_group_by_length)
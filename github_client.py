@@ -0,0 +1,310 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+import requests
+import metrics
+import storage
+
+API_URL = os.getenv("GITHUB_API_URL", "https://api.github.com")
+
+
+class GitHubClient:
+    """
+    Minimal GitHub REST client for the analyzer. Every GET is a conditional request: the ETag of the
+    last response for the URL is sent as If-None-Match, and a 304 (which costs no rate limit quota) is
+    answered from the copy in code_analysis.db. Stored responses are evicted least-recently-used first
+    once their total size exceeds `cache_max_bytes`. The remaining quota is tracked from the response headers,
+    requests are paced when it runs low, and secondary rate limits are retried after Retry-After.
+    """
+
+    def __init__(self, token, base_url=API_URL, db_path=storage.DB_PATH, max_workers=8, min_remaining=50,
+                 pace_below=500, write_interval=1.0, max_retries=5, timeout=30, cache_max_bytes=32 * 1024 * 1024):
+        self.token = token
+        self.base_url = base_url.rstrip("/")
+        self.db_path = db_path
+        self.max_workers = max_workers
+        self.min_remaining = min_remaining
+        self.pace_below = pace_below
+        self.write_interval = write_interval
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.cache_max_bytes = cache_max_bytes
+        self.remaining = None
+        self.reset_at = None
+        self.requests = 0
+        self.not_modified = 0
+        self._lock = threading.Lock()
+        self._last_write = 0.0
+        self._local = threading.local()
+
+    def _session(self):
+        # requests.Session is not documented as thread-safe, so each worker thread keeps its own
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+            session.headers.update({
+                "Accept": "application/vnd.github+json",
+                "X-GitHub-Api-Version": "2022-11-28"
+            })
+            if self.token:
+                session.headers["Authorization"] = f"Bearer {self.token}"
+        return session
+
+    def _pace(self):
+        """Wait before a request when the quota is nearly spent, spreading what is left until the reset."""
+        with self._lock:
+            remaining, reset_at = self.remaining, self.reset_at
+        if remaining is None or reset_at is None or remaining >= self.pace_below:
+            return
+        wait = reset_at - time.time()
+        if wait <= 0:
+            return
+        if remaining > self.min_remaining:
+            wait /= remaining - self.min_remaining
+        print(f"GitHub rate limit: {remaining} requests left, waiting {wait:.1f}s")
+        metrics.observe("github_rate_limit_wait_seconds", wait)
+        time.sleep(wait)
+
+    def _record_quota(self, response):
+        remaining = response.headers.get("X-RateLimit-Remaining")
+        reset_at = response.headers.get("X-RateLimit-Reset")
+        with self._lock:
+            self.requests += 1
+            if remaining is not None:
+                self.remaining = int(remaining)
+            if reset_at is not None:
+                self.reset_at = int(reset_at)
+
+    def _send(self, method, url, **kwargs):
+        """Send one request, retrying secondary rate limits and exhausted quota after the advertised wait."""
+        for attempt in range(self.max_retries + 1):
+            self._pace()
+            if method != "GET":
+                # GitHub asks for at least a second between content-creating requests
+                with self._lock:
+                    wait = self._last_write + self.write_interval - time.monotonic()
+                    self._last_write = max(time.monotonic(), self._last_write + self.write_interval)
+                if wait > 0:
+                    time.sleep(wait)
+            response = self._session().request(method, url, timeout=self.timeout, **kwargs)
+            self._record_quota(response)
+            metrics.increment("github_requests_total", method=method, status=response.status_code)
+
+            limited = response.status_code == 429 or (
+                response.status_code == 403 and (
+                    "Retry-After" in response.headers or response.headers.get("X-RateLimit-Remaining") == "0"
+                    or "secondary rate limit" in response.text.lower()
+                )
+            )
+            if not limited or attempt == self.max_retries:
+                return response
+            if "Retry-After" in response.headers:
+                wait = float(response.headers["Retry-After"])
+            elif response.headers.get("X-RateLimit-Remaining") == "0":
+                wait = int(response.headers.get("X-RateLimit-Reset", time.time() + 60)) - time.time()
+            else:
+                wait = 60 * 2 ** attempt
+            wait = max(wait, 1)
+            print(f"GitHub rate limited ({response.status_code}), retrying in {wait:.0f}s")
+            metrics.observe("github_rate_limit_wait_seconds", wait)
+            time.sleep(wait)
+        return response
+
+    def _url(self, path, params=None):
+        url = path if path.startswith("http") else self.base_url + path
+        return f"{url}?{urlencode(params)}" if params else url
+
+    def get(self, path, params=None):
+        """GET a JSON resource; returns (data, next page URL or None)."""
+        url = self._url(path, params)
+        conn = storage.get_connection(self.db_path)
+        cached = conn.execute("SELECT etag, link, body FROM github_responses WHERE url = ?", (url,)).fetchone()
+        headers = {"If-None-Match": cached[0]} if cached and cached[0] else {}
+
+        response = self._send("GET", url, headers=headers)
+        if response.status_code == 304 and cached:
+            with self._lock:
+                self.not_modified += 1
+            metrics.increment("github_not_modified_total")
+            link, body = cached[1], cached[2]
+            with conn:
+                conn.execute("UPDATE github_responses SET last_used = ? WHERE url = ?", (time.time(), url))
+        else:
+            response.raise_for_status()
+            link, body = response.headers.get("Link"), response.text
+            if response.headers.get("ETag"):
+                now = time.time()
+                with conn:
+                    conn.execute("""
+                        INSERT INTO github_responses (url, etag, link, body, fetched, size, last_used)
+                        VALUES (?, ?, ?, ?, ?, ?, ?)
+                        ON CONFLICT (url) DO UPDATE SET
+                            etag = excluded.etag, link = excluded.link, body = excluded.body,
+                            fetched = excluded.fetched, size = excluded.size, last_used = excluded.last_used
+                    """, (url, response.headers["ETag"], link, body, now, len(url) + len(link or "") + len(body), now))
+                    self._evict(conn)
+        return json.loads(body), _next_page(link)
+
+    def _evict(self, conn):
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM github_responses").fetchone()[0]
+        if total <= self.cache_max_bytes:
+            return
+        stale = []
+        for url, size in conn.execute("SELECT url, size FROM github_responses ORDER BY last_used ASC"):
+            if total <= self.cache_max_bytes:
+                break
+            stale.append((url,))
+            total -= size or 0
+        conn.executemany("DELETE FROM github_responses WHERE url = ?", stale)
+
+    def get_all(self, path, params=None):
+        """Every item of a paginated list, following the Link headers page by page."""
+        items, url = self.get(path, {**(params or {}), "per_page": 100})
+        while url:
+            page, url = self.get(url)
+            items.extend(page)
+        return items
+
+    def get_raw(self, path, accept="application/vnd.github.raw+json"):
+        """GET a resource as bytes, without the response cache (for immutable content such as blobs)."""
+        response = self._send("GET", self._url(path), headers={"Accept": accept})
+        response.raise_for_status()
+        return response.content
+
+    def post(self, path, payload, method="POST"):
+        response = self._send(method, self._url(path), json=payload)
+        response.raise_for_status()
+        return response.json()
+
+    def map(self, func, items):
+        """Apply `func` to every item on the client's thread pool, keeping the input order."""
+        items = list(items)
+        if len(items) <= 1:
+            return [func(item) for item in items]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return list(executor.map(func, items))
+
+    def summary(self):
+        return (f"{self.requests} GitHub requests, {self.not_modified} not modified, "
+                f"{self.remaining if self.remaining is not None else 'unknown'} remaining")
+
+    def get_repo(self, full_name):
+        return Repository(self, full_name)
+
+
+def _next_page(link):
+    """The rel="next" URL of a Link header."""
+    for part in (link or "").split(","):
+        if 'rel="next"' in part:
+            return part[part.index("<") + 1:part.index(">")]
+    return None
+
+
+class User:
+    def __init__(self, client, data):
+        self.client = client
+        self.login = data["login"]
+        self._email = data.get("email", ...)
+
+    @property
+    def email(self):
+        """Public email of the user; list endpoints omit it, so it is fetched on first use."""
+        if self._email is ...:
+            self._email = self.client.get(f"/users/{self.login}")[0].get("email")
+        return self._email
+
+
+class Head:
+    def __init__(self, data):
+        self.sha = data["sha"]
+        self.ref = data.get("ref")
+
+
+class ChangedFile:
+    def __init__(self, data):
+        self.filename = data["filename"]
+        self.sha = data.get("sha")
+        self.status = data.get("status")
+        self.patch = data.get("patch")
+
+
+class IssueComment:
+    def __init__(self, repo, data):
+        self.repo = repo
+        self.id = data["id"]
+        self.body = data.get("body")
+
+    def edit(self, body):
+        self.repo.client.post(f"/repos/{self.repo.full_name}/issues/comments/{self.id}", {"body": body}, method="PATCH")
+        self.body = body
+
+
+class PullRequest:
+    """The parts of a PyGithub PullRequest the analyzer uses, backed by `GitHubClient`."""
+
+    def __init__(self, repo, data):
+        self.repo = repo
+        self.number = data["number"]
+        self.title = data["title"]
+        self.user = User(repo.client, data["user"])
+        self.head = Head(data["head"])
+        self._files = None
+
+    def get_files(self):
+        if self._files is None:
+            self._files = [ChangedFile(item) for item in
+                           self.repo.client.get_all(f"/repos/{self.repo.full_name}/pulls/{self.number}/files")]
+        return self._files
+
+    def create_issue_comment(self, body):
+        return IssueComment(self.repo, self.repo.client.post(
+            f"/repos/{self.repo.full_name}/issues/{self.number}/comments", {"body": body}))
+
+    def get_issue_comments(self):
+        return [IssueComment(self.repo, item) for item in
+                self.repo.client.get_all(f"/repos/{self.repo.full_name}/issues/{self.number}/comments")]
+
+    def get_issue_comment(self, comment_id):
+        # Editing only needs the ID, so no request is made until `edit`
+        return IssueComment(self.repo, {"id": comment_id})
+
+
+class Commit:
+    def __init__(self, repo, sha):
+        self.repo = repo
+        self.sha = sha
+
+    def create_status(self, state, description, context):
+        return self.repo.client.post(f"/repos/{self.repo.full_name}/statuses/{self.sha}",
+                                     {"state": state, "description": description, "context": context})
+
+
+class Repository:
+    def __init__(self, client, full_name):
+        self.client = client
+        self.full_name = full_name
+
+    def get_pulls(self, state="open", sort="created", base=None):
+        params = {"state": state, "sort": sort}
+        if base:
+            params["base"] = base
+        return [PullRequest(self, item) for item in self.client.get_all(f"/repos/{self.full_name}/pulls", params)]
+
+    def get_pull(self, number):
+        return PullRequest(self, self.client.get(f"/repos/{self.full_name}/pulls/{number}")[0])
+
+    def get_commit(self, sha):
+        return Commit(self, sha)
+
+    def prefetch_files(self, pulls):
+        """List the changed files of several pull requests concurrently."""
+        self.client.map(lambda pr: pr.get_files(), pulls)
+
+    def get_blobs(self, shas):
+        """Raw content of git blobs, fetched concurrently; blobs are immutable, so each SHA is read once."""
+        unique = list(dict.fromkeys(shas))
+        contents = self.client.map(lambda sha: self.client.get_raw(f"/repos/{self.full_name}/git/blobs/{sha}"), unique)
+        return dict(zip(unique, contents))
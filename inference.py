@@ -0,0 +1,226 @@
+# torch is imported inside the scoring functions so the verdict helpers stay cheap to import
+# for callers that only talk to the scoring server.
+
+# Index of the "potential issue" class in the classifier head
+ISSUE_LABEL = 1
+
+EFFICIENT_VERDICT = "Code seems efficient. No major issues detected."
+ISSUE_VERDICT = "Code may have inefficiencies or potential issues to address."
+
+# Encoder layers run to embed a snippet for the similarity search; the rest of the model only runs to score it
+EMBEDDING_LAYERS = 2
+
+
+def verdict_from_probability(issue_probability):
+    """Turn the model's issue probability into the verdict shown to contributors."""
+    if issue_probability < 0.5:
+        return EFFICIENT_VERDICT
+    return ISSUE_VERDICT
+
+
+def bucket_by_length(lengths, batch_size):
+    """Group sample indices of similar token length into batches, longest first."""
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True)
+    return [order[start:start + batch_size] for start in range(0, len(order), batch_size)]
+
+
+def torch_forward(model):
+    """Build a forward function that returns the issue probabilities of a padded batch from a PyTorch model."""
+    import torch
+
+    model.eval()
+    device = next(model.parameters()).device
+
+    def forward(input_ids, attention_mask):
+        with torch.inference_mode():
+            logits = model(input_ids=input_ids.to(device), attention_mask=attention_mask.to(device)).logits
+            return torch.softmax(logits, dim=-1)[:, ISSUE_LABEL].tolist()
+
+    return forward
+
+
+def torch_embedding_forward(model, layers=EMBEDDING_LAYERS):
+    """
+    Build a forward function that runs a padded batch through only the token embeddings and the first
+    `layers` encoder layers of a PyTorch model, a fraction of the cost of scoring it. Each sequence's
+    result is a (sum of its token states, token count) pair, so windows of one file can be pooled together.
+    """
+    import torch
+
+    model.eval()
+    device = next(model.parameters()).device
+    encoder = model.base_model
+
+    def forward(input_ids, attention_mask):
+        with torch.inference_mode():
+            input_ids, attention_mask = input_ids.to(device), attention_mask.to(device)
+            hidden = encoder.embeddings(input_ids=input_ids)
+            extended_mask = encoder.get_extended_attention_mask(attention_mask, input_ids.shape)
+            for layer in encoder.encoder.layer[:layers]:
+                hidden = layer(hidden, attention_mask=extended_mask)[0]
+            mask = attention_mask.unsqueeze(-1).to(hidden.dtype)
+            sums = (hidden * mask).sum(dim=1).float().cpu().numpy()
+            return list(zip(sums, attention_mask.sum(dim=1).tolist()))
+
+    return forward
+
+
+def score_sequences(sequences, model, pad_token_id, batch_size=16, special_tokens=None, forward=None):
+    """
+    Score token id sequences in length-bucketed batches padded only to the longest member.
+    If `special_tokens` is a (cls_id, sep_id) pair, each sequence is wrapped with them while the batch is filled.
+    `forward` replaces the PyTorch forward pass of `model` (see inference_backends).
+    Returns one issue probability per sequence, in input order.
+    """
+    import torch
+
+    extra = 2 if special_tokens else 0
+    lengths = [len(sequence) + extra for sequence in sequences]
+    probabilities = [0.0] * len(lengths)
+    if not lengths:
+        return probabilities
+
+    forward = forward or torch_forward(model)
+    for batch in bucket_by_length(lengths, batch_size):
+        width = max(lengths[i] for i in batch)
+        input_ids = torch.full((len(batch), width), pad_token_id, dtype=torch.long)
+        attention_mask = torch.zeros((len(batch), width), dtype=torch.long)
+        for row, i in enumerate(batch):
+            sequence = torch.as_tensor(sequences[i], dtype=torch.long)
+            if special_tokens:
+                input_ids[row, 0] = special_tokens[0]
+                input_ids[row, 1:lengths[i] - 1] = sequence
+                input_ids[row, lengths[i] - 1] = special_tokens[1]
+            else:
+                input_ids[row, :lengths[i]] = sequence
+            attention_mask[row, :lengths[i]] = 1
+
+        for index, score in zip(batch, forward(input_ids, attention_mask)):
+            probabilities[index] = score
+    return probabilities
+
+
+def score_snippets(snippets, tokenizer, model, batch_size=16, max_length=512, forward=None):
+    """Return the issue probability of every snippet, in input order."""
+    if not snippets:
+        return []
+    encoded = tokenizer(list(snippets), max_length=max_length, truncation=True)
+    return score_sequences(encoded["input_ids"], model, tokenizer.pad_token_id, batch_size=batch_size,
+                           forward=forward)
+
+
+def embed_snippets(snippets, tokenizer, forward, batch_size=16, max_length=512):
+    """
+    Vector of every snippet: the mean token state of a `torch_embedding_forward` pass over consecutive
+    `max_length` windows that together cover the whole snippet. Returns a (snippets, hidden size) array.
+    """
+    import numpy as np
+
+    if not snippets:
+        return np.zeros((0, 0), dtype=np.float32)
+    body_length = max_length - 2  # room for <s> and </s>
+    windows = []
+    owners = []
+    for snippet_index, token_ids in enumerate(tokenizer(list(snippets), add_special_tokens=False,
+                                                        truncation=False)["input_ids"]):
+        for start in range(0, max(len(token_ids), 1), body_length):
+            windows.append(token_ids[start:start + body_length])
+            owners.append(snippet_index)
+    results = score_sequences(windows, None, tokenizer.pad_token_id, batch_size=batch_size,
+                              special_tokens=(tokenizer.cls_token_id, tokenizer.sep_token_id), forward=forward)
+    sums = np.zeros((len(snippets), len(results[0][0])), dtype=np.float32)
+    counts = np.zeros(len(snippets), dtype=np.float32)
+    for owner, (window_sum, count) in zip(owners, results):
+        sums[owner] += window_sum
+        counts[owner] += count
+    return sums / counts[:, None]
+
+
+def window_starts(num_tokens, body_length, stride):
+    """Start offsets of overlapping windows that together cover every token."""
+    if num_tokens <= body_length:
+        return [0]
+    starts = list(range(0, num_tokens - body_length, stride))
+    starts.append(num_tokens - body_length)
+    return starts
+
+
+def reduce_max(probabilities, lengths):
+    """Flag the file if any of its windows looks problematic."""
+    return max(probabilities)
+
+
+def reduce_mean(probabilities, lengths):
+    """Average the window scores, each window counting the same."""
+    return sum(probabilities) / len(probabilities)
+
+
+def reduce_length_weighted(probabilities, lengths):
+    """Average the window scores weighted by the number of tokens each window covers."""
+    return sum(p * n for p, n in zip(probabilities, lengths)) / sum(lengths)
+
+
+# Ways of combining the window scores of one file into a single issue probability
+REDUCERS = {
+    "max": reduce_max,
+    "mean": reduce_mean,
+    "weighted": reduce_length_weighted
+}
+
+
+def score_snippets_chunked(snippets, tokenizer, model, batch_size=16, max_length=512, overlap=128, reducer="max",
+                           forward=None):
+    """
+    Score snippets of any length by splitting them into overlapping `max_length` windows.
+    Each snippet is tokenized once; its windows are views into that token buffer and all windows
+    of all snippets are scored in one batched pass before being reduced per snippet.
+    """
+    import torch
+
+    if reducer not in REDUCERS:
+        raise ValueError(f"Unknown reducer '{reducer}', expected one of {sorted(REDUCERS)}")
+    if not snippets:
+        return []
+
+    body_length = max_length - 2  # room for <s> and </s>
+    stride = max(body_length - overlap, 1)
+    encoded = tokenizer(list(snippets), add_special_tokens=False, truncation=False)
+
+    windows = []
+    owners = []
+    weights = []
+    for snippet_index, token_ids in enumerate(encoded["input_ids"]):
+        buffer = torch.as_tensor(token_ids, dtype=torch.long)
+        covered = 0
+        for start in window_starts(len(buffer), body_length, stride):
+            window = buffer[start:start + body_length]
+            windows.append(window)
+            owners.append(snippet_index)
+            # Weight each window by the tokens it adds beyond the previous window's overlap
+            weights.append(max(start + len(window) - max(start, covered), 1))
+            covered = start + len(window)
+
+    window_scores = score_sequences(
+        windows, model, tokenizer.pad_token_id, batch_size=batch_size,
+        special_tokens=(tokenizer.cls_token_id, tokenizer.sep_token_id), forward=forward
+    )
+
+    per_snippet = [([], []) for _ in snippets]
+    for owner, weight, score in zip(owners, weights, window_scores):
+        per_snippet[owner][0].append(score)
+        per_snippet[owner][1].append(weight)
+    return [REDUCERS[reducer](scores, lengths) for scores, lengths in per_snippet]
+
+
+def analyze_code_batch(snippets, tokenizer, model, batch_size=16, max_length=512, reducer=None):
+    """
+    Analyze a list of code snippets with CodeBERT and return one verdict per snippet.
+    With a `reducer` ("max", "mean" or "weighted") long snippets are scored over sliding windows
+    instead of being truncated to `max_length` tokens.
+    """
+    if reducer:
+        probabilities = score_snippets_chunked(snippets, tokenizer, model, batch_size=batch_size,
+                                               max_length=max_length, reducer=reducer)
+    else:
+        probabilities = score_snippets(snippets, tokenizer, model, batch_size=batch_size, max_length=max_length)
+    return [verdict_from_probability(probability) for probability in probabilities]
@@ -0,0 +1,225 @@
+import argparse
+import hashlib
+import os
+from inference import ISSUE_LABEL, embed_snippets, score_snippets, score_snippets_chunked, torch_forward, \
+    torch_embedding_forward
+
+ONNX_FILE_NAME = "model.onnx"
+
+
+class Backend:
+    """
+    Common scoring interface of every inference backend: `score(snippets)` returns one issue
+    probability per snippet. Subclasses provide `tokenizer`, `forward` and `fingerprint()`, and
+    `embedding_forward` if they can run the model's first layers alone for `embed`.
+    """
+
+    name = None
+
+    def __init__(self, batch_size=16, max_length=512):
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.tokenizer = None
+        self.model = None
+        self.forward = None
+        self.embedding_forward = None
+
+    def score(self, snippets, reducer=None):
+        """Issue probability of every snippet; with a `reducer` long snippets are scored over sliding windows."""
+        if reducer:
+            return score_snippets_chunked(snippets, self.tokenizer, self.model, batch_size=self.batch_size,
+                                          max_length=self.max_length, reducer=reducer, forward=self.forward)
+        return score_snippets(snippets, self.tokenizer, self.model, batch_size=self.batch_size,
+                              max_length=self.max_length, forward=self.forward)
+
+    def fingerprint(self):
+        raise NotImplementedError
+
+    def embed(self, snippets):
+        """Vector of every snippet from the model's first layers (see `inference.embed_snippets`), without scoring it."""
+        return embed_snippets(snippets, self.tokenizer, self.embedding_forward, batch_size=self.batch_size,
+                              max_length=self.max_length)
+
+
+class TorchBackend(Backend):
+    """The PyTorch model in full fp32 precision."""
+
+    name = "torch"
+
+    def __init__(self, model_path="microsoft/codebert-base", batch_size=16):
+        super().__init__(batch_size)
+        from transformers import AutoTokenizer, AutoModelForSequenceClassification
+        from checkpoints import load_pretrained
+
+        self.model_path = model_path
+        self.tokenizer = AutoTokenizer.from_pretrained(model_path)
+        self.model = load_pretrained(AutoModelForSequenceClassification, model_path)
+        self.model.eval()
+        self.forward = torch_forward(self.model)
+        self.embedding_forward = torch_embedding_forward(self.model)
+
+    def fingerprint(self):
+        from result_cache import model_fingerprint
+
+        return f"{self.name}:{model_fingerprint(self.model)}"
+
+
+class Int8Backend(TorchBackend):
+    """The PyTorch model with its linear layers dynamically quantized to int8 for CPU inference."""
+
+    name = "int8"
+
+    def __init__(self, model_path="microsoft/codebert-base", batch_size=16):
+        import torch
+
+        super().__init__(model_path, batch_size)
+        self.model = torch.ao.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+        self.forward = torch_forward(self.model)
+        self.embedding_forward = torch_embedding_forward(self.model)
+
+
+class OnnxBackend(Backend):
+    """An exported ONNX graph (see `export_onnx`) run on the onnxruntime CPU provider."""
+
+    name = "onnx"
+
+    def __init__(self, model_path="fine_tuned_codebert/onnx", batch_size=16, num_threads=0):
+        super().__init__(batch_size)
+        import numpy as np
+        import onnxruntime
+        from transformers import AutoTokenizer
+
+        self.model_path = model_path
+        self.onnx_file = os.path.join(model_path, ONNX_FILE_NAME)
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = onnxruntime.InferenceSession(self.onnx_file, options, providers=["CPUExecutionProvider"])
+        self.tokenizer = AutoTokenizer.from_pretrained(model_path)
+
+        def forward(input_ids, attention_mask):
+            logits = self.session.run(["logits"], {
+                "input_ids": input_ids.numpy(),
+                "attention_mask": attention_mask.numpy()
+            })[0]
+            logits = logits - logits.max(axis=-1, keepdims=True)
+            probabilities = np.exp(logits)
+            probabilities /= probabilities.sum(axis=-1, keepdims=True)
+            return probabilities[:, ISSUE_LABEL].tolist()
+
+        self.forward = forward
+
+    def fingerprint(self):
+        stat = os.stat(self.onnx_file)
+        return f"{self.name}:{hashlib.sha256(f'{self.onnx_file}:{stat.st_size}:{stat.st_mtime_ns}'.encode()).hexdigest()}"
+
+
+class CascadeBackend(Backend):
+    """
+    A distilled student scores every snippet first; only snippets it is unsure about, with an issue
+    probability less than `confidence` away from certainty either way, are scored again by the full teacher.
+    """
+
+    name = "cascade"
+
+    def __init__(self, student, teacher, confidence=0.9):
+        super().__init__(student.batch_size, student.max_length)
+        self.student = student
+        self.teacher = teacher
+        self.confidence = confidence
+        self.tokenizer = student.tokenizer
+        self.embedding_forward = student.embedding_forward
+        self.scored = 0
+        self.escalated = 0
+
+    def score(self, snippets, reducer=None):
+        probabilities = self.student.score(snippets, reducer=reducer)
+        unsure = [i for i, probability in enumerate(probabilities)
+                  if max(probability, 1 - probability) < self.confidence]
+        if unsure:
+            for i, probability in zip(unsure, self.teacher.score([snippets[i] for i in unsure], reducer=reducer)):
+                probabilities[i] = probability
+        self.scored += len(snippets)
+        self.escalated += len(unsure)
+        return probabilities
+
+    def fingerprint(self):
+        return f"{self.name}:{self.confidence}:{self.student.fingerprint()}:{self.teacher.fingerprint()}"
+
+    def summary(self):
+        share = self.escalated / self.scored if self.scored else 0.0
+        return f"{self.escalated} of {self.scored} snippets escalated to the full model ({share:.1%})"
+
+
+BACKENDS = {
+    "torch": TorchBackend,
+    "int8": Int8Backend,
+    "onnx": OnnxBackend
+}
+
+
+def load_backend(name="torch", model_path="microsoft/codebert-base", batch_size=16, cascade_teacher=None,
+                 cascade_confidence=0.9):
+    """
+    Create the inference backend selected by configuration. With `cascade_teacher`, `model_path` is a
+    distilled student and snippets it is unsure about are rescored by the teacher checkpoint on the same backend.
+    """
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown backend '{name}', expected one of {sorted(BACKENDS)}")
+    backend = BACKENDS[name](model_path, batch_size=batch_size)
+    if cascade_teacher:
+        backend = CascadeBackend(backend, BACKENDS[name](cascade_teacher, batch_size=batch_size), cascade_confidence)
+    return backend
+
+
+def export_onnx(checkpoint="fine_tuned_codebert/checkpoint-2504", output_dir="fine_tuned_codebert/onnx", opset=17):
+    """Export a sequence classification checkpoint and its tokenizer to an ONNX graph with dynamic batch/length."""
+    import torch
+    from transformers import AutoTokenizer, AutoModelForSequenceClassification
+    from checkpoints import load_pretrained
+
+    tokenizer = AutoTokenizer.from_pretrained(checkpoint)
+    model = load_pretrained(AutoModelForSequenceClassification, checkpoint)
+    model.eval()
+    model.config.return_dict = False
+
+    os.makedirs(output_dir, exist_ok=True)
+    sample = tokenizer(["def f(x):\n    return x"], return_tensors="pt")
+    with torch.inference_mode():
+        torch.onnx.export(
+            model,
+            (sample["input_ids"], sample["attention_mask"]),
+            os.path.join(output_dir, ONNX_FILE_NAME),
+            input_names=["input_ids", "attention_mask"],
+            output_names=["logits"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+                "logits": {0: "batch"}
+            },
+            opset_version=opset
+        )
+    tokenizer.save_pretrained(output_dir)
+    model.config.save_pretrained(output_dir)
+    print(f"Exported {checkpoint} to {os.path.join(output_dir, ONNX_FILE_NAME)}")
+
+
+def add_export_arguments(parser):
+    parser.add_argument("--checkpoint", default="fine_tuned_codebert/checkpoint-2504")
+    parser.add_argument("--output", default="fine_tuned_codebert/onnx")
+    parser.add_argument("--opset", type=int, default=17)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inference backend utilities.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    add_export_arguments(subparsers.add_parser("export", help="Export a checkpoint to ONNX for the onnx backend."))
+    args = parser.parse_args(argv)
+
+    if args.command == "export":
+        export_onnx(args.checkpoint, args.output, args.opset)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+import contextlib
+import functools
+import json
+import sys
+import threading
+import time
+from datetime import datetime
+
+# Upper bounds (seconds) of the latency histogram buckets
+DEFAULT_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+_local = threading.local()
+_json_log_stream = None
+
+
+def enable_json_logs(stream=sys.stderr):
+    """Emit one JSON line per timing and event to `stream` (None turns it off)."""
+    global _json_log_stream
+    _json_log_stream = stream
+
+
+def log_event(event, **fields):
+    """Write a structured log line if JSON logs are enabled."""
+    if _json_log_stream is not None:
+        record = {"time": datetime.now().isoformat(), "event": event, **fields}
+        print(json.dumps(record, default=str), file=_json_log_stream, flush=True)
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def increment(name, value=1, **labels):
+    """Add `value` to a counter."""
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name, value, **labels):
+    """Record one sample in a histogram, and add it to the timing breakdowns being collected on this thread."""
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = {"buckets": [0] * len(DEFAULT_BUCKETS), "sum": 0.0, "count": 0}
+        for index, bound in enumerate(DEFAULT_BUCKETS):
+            if value <= bound:
+                histogram["buckets"][index] += 1
+        histogram["sum"] += value
+        histogram["count"] += 1
+
+        breakdown_key = ":".join([name] + [str(labels[label]) for label in sorted(labels)])
+        for breakdown in getattr(_local, "collectors", []):
+            breakdown[breakdown_key] = breakdown.get(breakdown_key, 0.0) + value
+
+
+@contextlib.contextmanager
+def timer(name, **labels):
+    """Time the enclosed block into the `name` histogram (in seconds)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        observe(name, seconds, **labels)
+        log_event("timing", metric=name, seconds=round(seconds, 6), **labels)
+
+
+def timed(name, **labels):
+    """Decorator form of `timer`."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timer(name, **labels):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextlib.contextmanager
+def collect(breakdown=None):
+    """
+    Accumulate the seconds of every timer that finishes on this thread inside the block into
+    `breakdown` (a new dict if not given), keyed "<metric>:<label values>".
+    """
+    breakdown = {} if breakdown is None else breakdown
+    collectors = getattr(_local, "collectors", None)
+    if collectors is None:
+        collectors = _local.collectors = []
+    collectors.append(breakdown)
+    try:
+        yield breakdown
+    finally:
+        collectors.remove(breakdown)
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def render_prometheus():
+    """All counters and histograms in the Prometheus text exposition format."""
+    with _lock:
+        counters = sorted(_counters.items())
+        histograms = sorted((key, {"buckets": list(value["buckets"]), "sum": value["sum"], "count": value["count"]})
+                            for key, value in _histograms.items())
+
+    lines = []
+    declared = set()
+    for (name, labels), value in counters:
+        if name not in declared:
+            lines.append(f"# TYPE {name} counter")
+            declared.add(name)
+        lines.append(f"{name}{_format_labels(labels)} {value}")
+    for (name, labels), histogram in histograms:
+        if name not in declared:
+            lines.append(f"# TYPE {name} histogram")
+            declared.add(name)
+        for bound, count in zip(DEFAULT_BUCKETS, histogram["buckets"]):
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {count}")
+        lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {histogram['count']}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {histogram['sum']:.6f}")
+        lines.append(f"{name}_count{_format_labels(labels)} {histogram['count']}")
+    return "\n".join(lines) + "\n"
+
+
+def snapshot():
+    """Counters and histogram sums/counts as plain data, for a JSON summary at the end of a run."""
+    with _lock:
+        return {
+            "counters": [{"name": name, **dict(labels), "value": value}
+                         for (name, labels), value in sorted(_counters.items())],
+            "timings": [{"name": name, **dict(labels), "count": value["count"], "seconds": round(value["sum"], 6)}
+                        for (name, labels), value in sorted(_histograms.items())]
+        }
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
@@ -0,0 +1,6 @@
+from transformers import RobertaForSequenceClassification
+
+
+class RobertaWithoutAuxiliaryFeatures(RobertaForSequenceClassification):
+    def __init__(self, config):
+        super().__init__(config)
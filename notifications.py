@@ -0,0 +1,267 @@
+import json
+import os
+import smtplib
+import threading
+import time
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+import metrics
+import pr_comment
+import storage
+
+MAX_BACKOFF = 300
+
+
+class Outbox:
+    """
+    Durable queue of outgoing PR comments, status checks and emails in code_analysis.db.
+    Messages survive crashes and failed deliveries and are retried by a `NotificationDispatcher`.
+    """
+
+    def __init__(self, db_path=storage.DB_PATH):
+        self.db_path = db_path
+
+    def enqueue(self, kind, payload, dedupe_key=None):
+        """
+        Queue one message. A pending message with the same `dedupe_key` is replaced instead of
+        queued twice, so only the latest status per SHA and context is ever sent.
+        """
+        conn = storage.get_connection(self.db_path)
+        now = time.time()
+        with conn:
+            conn.execute("""
+                INSERT INTO notification_outbox (kind, dedupe_key, payload, status, attempts, next_attempt, created)
+                VALUES (?, ?, ?, 'pending', 0, ?, ?)
+                ON CONFLICT (dedupe_key) WHERE status = 'pending' DO UPDATE SET
+                    payload = excluded.payload, attempts = 0, next_attempt = excluded.next_attempt
+            """, (kind, dedupe_key, json.dumps(payload), now, now))
+        metrics.increment("notifications_enqueued_total", kind=kind)
+
+    def enqueue_comment(self, pr_number, body):
+        # Only the newest body matters: the comment is edited in place
+        self.enqueue("comment", {"pr_number": pr_number, "body": body}, dedupe_key=f"comment:{pr_number}")
+
+    def enqueue_status(self, sha, state, description, context="Code Quality Check"):
+        self.enqueue("status", {"sha": sha, "state": state, "description": description, "context": context},
+                     dedupe_key=f"status:{sha}:{context}")
+
+    def enqueue_email(self, recipient, subject, body):
+        self.enqueue("email", {"recipient": recipient, "subject": subject, "body": body})
+
+    def claim_due(self, limit=20):
+        """Mark up to `limit` due messages as being sent and return them as (id, kind, payload, attempts), oldest first."""
+        conn = storage.get_connection(self.db_path)
+        with conn:
+            rows = conn.execute("""
+                UPDATE notification_outbox SET status = 'sending'
+                WHERE id IN (
+                    SELECT id FROM notification_outbox
+                    WHERE status = 'pending' AND next_attempt <= ? ORDER BY id LIMIT ?
+                )
+                RETURNING id, kind, payload, attempts
+            """, (time.time(), limit)).fetchall()
+        return sorted((row_id, kind, json.loads(payload), attempts) for row_id, kind, payload, attempts in rows)
+
+    def mark_sent(self, message_ids):
+        conn = storage.get_connection(self.db_path)
+        with conn:
+            conn.executemany("UPDATE notification_outbox SET status = 'sent', sent = ? WHERE id = ?",
+                             [(time.time(), message_id) for message_id in message_ids])
+
+    def mark_failed(self, message_id, attempts, error, max_attempts=5, backoff=2.0):
+        """Schedule a retry with exponential backoff, or give up after `max_attempts`."""
+        attempts += 1
+        status = "failed" if attempts >= max_attempts else "pending"
+        delay = min(backoff * 2 ** (attempts - 1), MAX_BACKOFF)
+        conn = storage.get_connection(self.db_path)
+        with conn:
+            # A newer pending message for the same key supersedes this one
+            conn.execute("""
+                UPDATE notification_outbox SET status = CASE
+                    WHEN ? = 'pending' AND dedupe_key IS NOT NULL AND EXISTS (
+                        SELECT 1 FROM notification_outbox AS newer
+                        WHERE newer.dedupe_key = notification_outbox.dedupe_key AND newer.status = 'pending'
+                    ) THEN 'superseded' ELSE ? END,
+                    attempts = ?, next_attempt = ?, last_error = ?
+                WHERE id = ?
+            """, (status, status, attempts, time.time() + delay, str(error), message_id))
+        metrics.increment("notification_failures_total")
+
+    def requeue_interrupted(self):
+        """Return messages left 'sending' by a run that died mid-delivery to the queue."""
+        conn = storage.get_connection(self.db_path)
+        with conn:
+            conn.execute("""
+                UPDATE notification_outbox SET status = 'pending'
+                WHERE status = 'sending' AND NOT EXISTS (
+                    SELECT 1 FROM notification_outbox AS newer
+                    WHERE newer.dedupe_key = notification_outbox.dedupe_key AND newer.status = 'pending'
+                )
+            """)
+
+    def due_count(self):
+        """Messages being sent or due now; retries scheduled for later are not counted."""
+        return storage.get_connection(self.db_path).execute(
+            "SELECT COUNT(*) FROM notification_outbox "
+            "WHERE status = 'sending' OR (status = 'pending' AND next_attempt <= ?)", (time.time(),)
+        ).fetchone()[0]
+
+
+class SmtpSession:
+    """One authenticated SMTP connection reused across messages, reopened only after it drops."""
+
+    def __init__(self, host="smtp.gmail.com", port=587, username=None, password=None, sender=None,
+                 starttls=True, timeout=30):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.sender = sender or username
+        self.starttls = starttls
+        self.timeout = timeout
+        self.connection = None
+
+    @classmethod
+    def from_env(cls):
+        """Configure from SMTP_HOST, SMTP_PORT, SMTP_USERNAME, SMTP_PASSWORD, SMTP_SENDER and SMTP_STARTTLS."""
+        return cls(
+            host=os.getenv("SMTP_HOST", "smtp.gmail.com"),
+            port=int(os.getenv("SMTP_PORT", "587")),
+            username=os.getenv("SMTP_USERNAME"),
+            password=os.getenv("SMTP_PASSWORD"),
+            sender=os.getenv("SMTP_SENDER"),
+            starttls=os.getenv("SMTP_STARTTLS", "1") != "0"
+        )
+
+    def _connect(self):
+        connection = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.starttls:
+            connection.starttls()
+        if self.username:
+            connection.login(self.username, self.password)
+        self.connection = connection
+        metrics.increment("smtp_connections_total")
+
+    def send(self, recipient, subject, body):
+        msg = MIMEMultipart()
+        msg["From"] = self.sender
+        msg["To"] = recipient
+        msg["Subject"] = subject
+        msg.attach(MIMEText(body, "plain"))
+        if self.connection is None:
+            self._connect()
+        try:
+            self.connection.sendmail(self.sender, recipient, msg.as_string())
+        except smtplib.SMTPServerDisconnected:
+            # The server closed an idle session; reconnect once
+            self._connect()
+            self.connection.sendmail(self.sender, recipient, msg.as_string())
+
+    def close(self):
+        if self.connection is not None:
+            try:
+                self.connection.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self.connection = None
+
+
+class NotificationDispatcher:
+    """
+    Background thread that delivers outbox messages in batches: comments and statuses through the
+    GitHub `repo`, emails through one long-lived `SmtpSession`. Failed messages are retried with
+    exponential backoff, so analysis never waits on GitHub or mail latency.
+    """
+
+    def __init__(self, outbox, repo, smtp=None, batch_size=20, poll_interval=0.5, max_attempts=5, backoff=2.0):
+        self.outbox = outbox
+        self.repo = repo
+        self.smtp = smtp
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.pulls = {}
+        self.sent = 0
+        self.wakeup = threading.Event()
+        self.stopping = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.outbox.requeue_interrupted()
+        self.thread = threading.Thread(target=self._loop, name="notification-dispatcher", daemon=True)
+        self.thread.start()
+        return self
+
+    def notify(self):
+        """Wake the dispatcher after enqueueing instead of waiting for the next poll."""
+        self.wakeup.set()
+
+    def _deliver(self, kind, payload):
+        if kind == "comment":
+            pr = self.pulls.get(payload["pr_number"])
+            if pr is None:
+                with metrics.timer("github_api_seconds", call="get_pull"):
+                    pr = self.pulls[payload["pr_number"]] = self.repo.get_pull(payload["pr_number"])
+            pr_comment.publish_comment(pr, payload["body"], self.outbox.db_path)
+        elif kind == "status":
+            with metrics.timer("github_api_seconds", call="create_status"):
+                self.repo.get_commit(payload["sha"]).create_status(
+                    state=payload["state"], description=payload["description"], context=payload["context"]
+                )
+        elif kind == "email":
+            if self.smtp is None:
+                raise RuntimeError("No SMTP session configured for email notifications")
+            with metrics.timer("smtp_send_seconds"):
+                self.smtp.send(payload["recipient"], payload["subject"], payload["body"])
+        else:
+            raise ValueError(f"Unknown notification kind '{kind}'")
+
+    def dispatch_once(self):
+        """Deliver one batch of due messages; returns how many were claimed."""
+        batch = self.outbox.claim_due(self.batch_size)
+        delivered = []
+        for message_id, kind, payload, attempts in batch:
+            try:
+                self._deliver(kind, payload)
+                delivered.append(message_id)
+            except Exception as e:
+                print(f"Error delivering {kind} notification {message_id}: {e}")
+                if kind == "email" and self.smtp is not None:
+                    self.smtp.close()
+                self.outbox.mark_failed(message_id, attempts, e, self.max_attempts, self.backoff)
+        if delivered:
+            self.outbox.mark_sent(delivered)
+            self.sent += len(delivered)
+            metrics.increment("notifications_sent_total", len(delivered))
+        return len(batch)
+
+    def _loop(self):
+        while not self.stopping.is_set():
+            try:
+                claimed = self.dispatch_once()
+            except Exception as e:
+                print(f"Notification dispatcher error: {e}")
+                claimed = 0
+            if not claimed:
+                self.wakeup.wait(self.poll_interval)
+                self.wakeup.clear()
+        storage.close_connections()
+
+    def stop(self, drain=True, timeout=60):
+        """
+        Stop the background thread. With `drain`, first keep delivering until nothing is due or
+        `timeout` seconds pass; messages still waiting for a retry stay in the outbox for the next run.
+        """
+        deadline = time.monotonic() + timeout
+        while drain and time.monotonic() < deadline:
+            if not self.outbox.due_count():
+                break
+            self.notify()
+            time.sleep(0.05)
+        self.stopping.set()
+        self.wakeup.set()
+        if self.thread is not None:
+            self.thread.join()
+        if self.smtp is not None:
+            self.smtp.close()
@@ -0,0 +1,135 @@
+import queue
+import threading
+import time
+
+# Marks the end of the input stream on a stage queue
+_DONE = object()
+
+
+class Stage:
+    """
+    One step of a pipeline: `workers` threads take items from the stage's bounded input queue,
+    call `func` and pass the results on to the next stage.
+    With `batch_size` > 1 a worker drains up to that many waiting items and hands `func` the
+    whole list; `func` must then return a list of results.
+    """
+
+    def __init__(self, name, func, workers=1, queue_size=8, batch_size=1):
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.batch_size = batch_size
+        self.input = queue.Queue(maxsize=queue_size)
+        self.busy_time = 0.0
+        self.first_start = None
+        self.last_end = None
+        self.items = 0
+        self.errors = 0
+        self.depth_samples = []
+        self._lock = threading.Lock()
+        self._finished_workers = 0
+
+    def put(self, item):
+        self.input.put(item)
+        with self._lock:
+            self.depth_samples.append(self.input.qsize())
+
+    def _take_batch(self):
+        """Block for one item, then grab whatever else is already waiting, up to batch_size."""
+        items = [self.input.get()]
+        while len(items) < self.batch_size and items[-1] is not _DONE:
+            try:
+                items.append(self.input.get_nowait())
+            except queue.Empty:
+                break
+        return items
+
+    def run_worker(self, next_stage):
+        done = False
+        while not done:
+            items = self._take_batch()
+            if items[-1] is _DONE:
+                items.pop()
+                done = True
+            if not items:
+                continue
+
+            start = time.perf_counter()
+            try:
+                results = self.func(items) if self.batch_size > 1 else [self.func(items[0])]
+            except Exception as e:
+                print(f"Error in pipeline stage '{self.name}': {e}")
+                results = []
+                with self._lock:
+                    self.errors += len(items)
+            elapsed = time.perf_counter() - start
+
+            with self._lock:
+                self.busy_time += elapsed
+                self.items += len(items)
+                if self.first_start is None:
+                    self.first_start = start
+                self.last_end = start + elapsed
+            if next_stage is not None:
+                for result in results:
+                    if result is not None:
+                        next_stage.put(result)
+
+        # The last worker to finish closes the next stage once for each of its workers
+        with self._lock:
+            self._finished_workers += 1
+            last = self._finished_workers == self.workers
+        if last and next_stage is not None:
+            for _ in range(next_stage.workers):
+                next_stage.input.put(_DONE)
+
+    def stats(self):
+        depths = self.depth_samples or [0]
+        return {
+            "stage": self.name,
+            "workers": self.workers,
+            "items": self.items,
+            "errors": self.errors,
+            "busy_seconds": round(self.busy_time, 3),
+            "wall_seconds": round((self.last_end or 0) - (self.first_start or 0), 3),
+            "max_queue_depth": max(depths),
+            "mean_queue_depth": round(sum(depths) / len(depths), 2)
+        }
+
+
+class Pipeline:
+    """Chain of stages connected by bounded queues, each stage running in its own thread pool."""
+
+    def __init__(self, stages):
+        self.stages = stages
+        self.wall_time = 0.0
+
+    def run(self, items):
+        """Feed `items` into the first stage and block until every stage has drained."""
+        start = time.perf_counter()
+        threads = []
+        for index, stage in enumerate(self.stages):
+            next_stage = self.stages[index + 1] if index + 1 < len(self.stages) else None
+            for worker in range(stage.workers):
+                thread = threading.Thread(target=stage.run_worker, args=(next_stage,),
+                                          name=f"{stage.name}-{worker}", daemon=True)
+                thread.start()
+                threads.append(thread)
+
+        first = self.stages[0]
+        for item in items:
+            first.put(item)
+        for _ in range(first.workers):
+            first.input.put(_DONE)
+
+        for thread in threads:
+            thread.join()
+        self.wall_time = time.perf_counter() - start
+
+    def report(self):
+        """Print per-stage busy time and queue depth so the worker pools can be sized."""
+        print(f"Pipeline finished in {self.wall_time:.2f}s")
+        for stats in (stage.stats() for stage in self.stages):
+            print(f"- {stats['stage']}: {stats['items']} items ({stats['errors']} failed) on "
+                  f"{stats['workers']} workers, wall {stats['wall_seconds']:.2f}s, busy {stats['busy_seconds']:.2f}s, "
+                  f"queue depth max {stats['max_queue_depth']} / mean {stats['mean_queue_depth']}")
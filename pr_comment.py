@@ -0,0 +1,173 @@
+import hashlib
+import re
+import metrics
+import storage
+from inference import ISSUE_VERDICT
+
+# Hidden tag that identifies the analyzer's comment among all comments of a PR
+COMMENT_MARKER = "<!-- code-quality-report -->"
+# GitHub rejects comment bodies over 65536 characters
+MAX_COMMENT_CHARS = 65536
+# Pylint messages shown per file in the comment; the dashboard report keeps all of them
+MAX_FILE_MESSAGES = 25
+
+_MESSAGE_PATTERN = re.compile(r":\d+:\d+: ([A-Z])\d{4}: ")
+# Fatal and error messages first, informational last
+_SEVERITY = {"F": 0, "E": 1, "W": 2, "R": 3, "C": 4, "I": 5}
+
+
+class BoundedBuffer:
+    """Collects text parts up to a character limit; joined once at the end instead of concatenated repeatedly."""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.parts = []
+        self.size = 0
+
+    def append(self, text):
+        """Add `text` if it fits in what is left of the limit; returns whether it was added."""
+        if self.size + len(text) > self.limit:
+            return False
+        self.parts.append(text)
+        self.size += len(text)
+        return True
+
+    def getvalue(self):
+        return "".join(self.parts)
+
+
+def ranked_messages(pylint_output):
+    """The message lines of a Pylint report, most severe first (stable within a severity)."""
+    messages = []
+    for line in (pylint_output or "").splitlines():
+        match = _MESSAGE_PATTERN.search(line)
+        if match:
+            messages.append((_SEVERITY.get(match.group(1), len(_SEVERITY)), line))
+    return [line for _, line in sorted(messages, key=lambda item: item[0])]
+
+
+def rank_rows(rows):
+    """Files with a model-flagged issue first, then by Pylint score from worst, then by message count."""
+    return sorted(rows, key=lambda row: (
+        row["ai_analysis"] != ISSUE_VERDICT,
+        row["pylint_score"] if row["pylint_score"] is not None else 10.0,
+        -len(ranked_messages(row["pylint_output"]))
+    ))
+
+
+def file_section(row, max_messages=None):
+    """Markdown section of one file: score, model verdict and (up to `max_messages`) Pylint messages."""
+    messages = ranked_messages(row["pylint_output"])
+    score = f"{row['pylint_score']:.2f}/10" if row["pylint_score"] is not None else "n/a"
+    lines = [f"\n### {row['file_name']} (Pylint {score})", f"**AI Analysis**: {row['ai_analysis']}"]
+    similar = row.get("similar_to")
+    if similar:
+        lines[-1] += (f" _(same verdict as `{similar['file_name']}` in PR #{similar['pull_request_id']}, "
+                      f"{similar['similarity']:.1%} similar)_")
+    shown = messages if max_messages is None else messages[:max_messages]
+    if shown:
+        lines += ["```"] + shown + ["```"]
+    if len(shown) < len(messages):
+        lines.append(f"_{len(messages) - len(shown)} Pylint messages are only in the full report._")
+    if not messages and row["pylint_score"] is None and row["pylint_output"]:
+        # Not a Pylint report, e.g. a fetch or lint error message
+        lines += ["```", row["pylint_output"].strip(), "```"]
+    return "\n".join(lines) + "\n"
+
+
+def overall_pylint_score(rows):
+    scores = [row["pylint_score"] for row in rows if row["pylint_score"] is not None]
+    return sum(scores) / len(scores) if scores else 0
+
+
+def _header(rows, overall_score, cache=None):
+    status_state = "success" if overall_score >= 5.0 else "failure"
+    cache_line = ""
+    if cache is not None and cache.enabled:
+        hits = sum(1 for row in rows if row["cached"])
+        cache_line = f"\n- **Result Cache**: {hits} hits / {len(rows) - hits} misses"
+    return f"""{COMMENT_MARKER}
+### Static Code Analysis Results
+- **Overall Pylint Score**: {overall_score:.2f}/10
+- **Status**: {"✅ Passed" if status_state == "success" else "❌ Failed"}{cache_line}
+
+### Detailed Results:
+"""
+
+
+def render_comment(rows, cache=None, report_url=None, limit=MAX_COMMENT_CHARS):
+    """
+    Build the PR comment within `limit` characters: files are ranked worst first and each shows its most
+    severe messages; files that no longer fit are summarized in one line pointing to the full report.
+    Returns (comment, overall_score).
+    """
+    overall_score = overall_pylint_score(rows)
+    link = f"[full report]({report_url})" if report_url else "full report on the dashboard"
+    footer = "\nIf you have questions or need help resolving the issues, please reach out!\n"
+    omitted_template = "\n_{count} more files are not shown here; see the " + link + "._\n"
+
+    # Room is kept for the footer and the longest possible omission note
+    buffer = BoundedBuffer(limit - len(footer) - len(omitted_template) - 10)
+    buffer.append(_header(rows, overall_score, cache))
+    ranked = rank_rows(rows)
+    shown = 0
+    for row in ranked:
+        if not buffer.append(file_section(row, MAX_FILE_MESSAGES)) and not buffer.append(file_section(row, 0)):
+            break
+        shown += 1
+    if shown < len(ranked):
+        note = omitted_template.format(count=len(ranked) - shown)
+    else:
+        note = f"\nEvery message is listed in the {link}.\n" if report_url else ""
+    return buffer.getvalue() + note + footer, overall_score
+
+
+def render_full_report(rows, cache=None):
+    """The untruncated report with every Pylint message of every file, for the dashboard."""
+    return _header(rows, overall_pylint_score(rows), cache) + "".join(file_section(row) for row in rank_rows(rows))
+
+
+def body_digest(body):
+    return hashlib.sha256(body.encode()).hexdigest()
+
+
+def comment_unchanged(pr_number, body, db_path=storage.DB_PATH):
+    """True if exactly this body is already posted as the PR's comment."""
+    state = storage.get_pr_comment(pr_number, db_path)
+    return state is not None and state[1] == body_digest(body)
+
+
+def publish_comment(pr, body, db_path=storage.DB_PATH):
+    """
+    Keep one comment per pull request: edit the known comment (or the one carrying the marker) instead
+    of posting a new one each run, and make no API call at all when the body has not changed.
+    Returns False if the comment was already up to date.
+    """
+    digest = body_digest(body)
+    state = storage.get_pr_comment(pr.number, db_path)
+    if state is not None and state[1] == digest:
+        metrics.increment("pr_comment_unchanged_total")
+        return False
+
+    comment = None
+    if state is not None and state[0]:
+        try:
+            comment = pr.get_issue_comment(state[0])
+            with metrics.timer("github_api_seconds", call="edit_issue_comment"):
+                comment.edit(body)
+        except Exception as e:
+            # Deleted or inaccessible; look for the marker instead
+            print(f"Could not update comment {state[0]} on PR #{pr.number}: {e}")
+            comment = None
+    if comment is None:
+        with metrics.timer("github_api_seconds", call="get_issue_comments"):
+            comment = next((existing for existing in pr.get_issue_comments()
+                            if existing.body and existing.body.startswith(COMMENT_MARKER)), None)
+        if comment is not None:
+            with metrics.timer("github_api_seconds", call="edit_issue_comment"):
+                comment.edit(body)
+        else:
+            with metrics.timer("github_api_seconds", call="create_issue_comment"):
+                comment = pr.create_issue_comment(body)
+    storage.save_pr_comment(pr.number, comment.id, digest, db_path)
+    return True
@@ -1,18 +1,23 @@
 from datasets import load_dataset
+import argparse
 import json
+import os
 from collections import Counter
 import random  # For balancing the dataset
 import re
+from complexity_features import extract_feature_columns
+from dataset_shards import ShardWriter
 
 def compute_complexity_tags(code):
     """
     Extract complexity tags for a given code snippet.
+    The original regex version; `complexity_features` computes these and more in one pass.
     """
     # Count the number of lines
     num_lines = len(code.split("\n"))
 
-    # Count the number of nested 'if' statements
-    nested_if_count = len(re.findall(r"\bif\b", code))
+    # Count the number of 'if' statements (stored as nested_if_count before the depth feature existed)
+    if_count = len(re.findall(r"\bif\b", code))
 
     # Count the number of loops (for, while)
     loop_count = len(re.findall(r"\b(for|while)\b", code))
@@ -20,7 +25,7 @@ def compute_complexity_tags(code):
     # Return tags as a dictionary
     return {
         "num_lines": num_lines,
-        "nested_if_count": nested_if_count,
+        "if_count": if_count,
         "loop_count": loop_count
     }
 
@@ -67,77 +72,108 @@ def augment_dataset(dataset):
         augmented_dataset.append(augmented_sample)
     return augmented_dataset
 
-def load_defect_detection_dataset():
+def to_samples(batch):
+    """
+    Batched `datasets.map` function converting CodeXGLUE columns to training samples with complexity tags.
+    """
+    codes = [code or "" for code in batch["func"]]  # Use a default value if "func" is missing
+    return {"code": codes, "label": batch["target"], **extract_feature_columns(codes)}
+
+def augment_batch(batch):
+    """
+    Batched `datasets.map` version of `augment_dataset`.
+    """
+    return {"code": [augment_code(code) for code in batch["code"]]}
+
+def balanced_indices(labels, seed=None):
+    """
+    Row indices that undersample the majority class (False) to the size of the minority class, shuffled.
+    """
+    rng = random.Random(seed)
+    false_indices = [i for i, label in enumerate(labels) if label == False]
+    true_indices = [i for i, label in enumerate(labels) if label == True]
+    indices = rng.sample(false_indices, len(true_indices)) + true_indices
+    rng.shuffle(indices)
+    return indices
+
+def prepare_defect_detection_splits(num_proc=None, seed=None):
     """
-    Load and preprocess the CodeXGLUE Defect Detection dataset.
+    Load the CodeXGLUE Defect Detection dataset as Arrow-backed splits.
+    Tagging and augmentation run as batched `map` calls that are cached on disk, and balancing
+    selects row indices, so no split is ever materialized as Python objects.
     """
-    # Load the dataset from the CodeXGLUE benchmark
     dataset = load_dataset("code_x_glue_cc_defect_detection")
-    train_data = dataset["train"]
-    valid_data = dataset["validation"]
-    test_data = dataset["test"]  # Add the test dataset
-
-    # Convert datasets to a format suitable for the Hugging Face Trainer
-    train_dataset = [
-        {
-            "code": sample.get("func", ""),  # Use a default value if "func" is missing
-            "label": sample["target"],
-            **compute_complexity_tags(sample.get("func", ""))
-        }
-        for sample in train_data
-    ]
-    valid_dataset = [
-        {
-            "code": sample.get("func", ""),  # Use a default value if "func" is missing
-            "label": sample["target"],
-            **compute_complexity_tags(sample.get("func", ""))
-        }
-        for sample in valid_data
-    ]
-    test_dataset = [
-        {
-            "code": sample.get("func", ""),  # Use a default value if "func" is missing
-            "label": sample["target"],
-            **compute_complexity_tags(sample.get("func", ""))
-        }
-        for sample in test_data
-    ]
+    splits = {}
+    for name in ["train", "validation", "test"]:
+        split = dataset[name]
+        splits[name] = split.map(to_samples, batched=True, num_proc=num_proc, remove_columns=split.column_names)
 
-    # Debugging: Print a sample from the dataset
-    print("Sample from train_dataset before augmentation:", train_dataset[0])
+    # Augment and balance the training split
+    train_split = splits["train"].map(augment_batch, batched=True, num_proc=num_proc)
+    splits["train"] = train_split.select(balanced_indices(train_split["label"], seed))
+    return splits
 
-    # Augment the training dataset
-    train_dataset = augment_dataset(train_dataset)
+def print_split_distribution(split, split_name):
+    print(f"Label distribution in {split_name}: {Counter(split['label'])}")
 
-    # Balance the training dataset
-    train_dataset = balance_dataset(train_dataset)
+def load_defect_detection_dataset():
+    """
+    Load and preprocess the CodeXGLUE Defect Detection dataset as Arrow-backed (train, validation, test)
+    splits, which index like lists without materializing the samples.
+    """
+    splits = prepare_defect_detection_splits()
+
+    # Debugging: Print a sample from the dataset
+    print("Sample from train_dataset after augmentation:", splits["train"][0])
 
     # Print label distribution for debugging
-    print_label_distribution(train_dataset, "Balanced Training Dataset")
-    print_label_distribution(valid_dataset, "Validation Dataset")
-    print_label_distribution(test_dataset, "Test Dataset")
+    print_split_distribution(splits["train"], "Balanced Training Dataset")
+    print_split_distribution(splits["validation"], "Validation Dataset")
+    print_split_distribution(splits["test"], "Test Dataset")
+
+    return splits["train"], splits["validation"], splits["test"]
 
-    return train_dataset, valid_dataset, test_dataset
+def save_splits(splits, output_dir=".", format="json", shard_size=10000):
+    """
+    Save every split as `<output_dir>/<name>_dataset_augmented.json` (legacy single file) or as a
+    directory of JSON Lines/Parquet shards. Either way samples are written incrementally, one at a time.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    for name, split in splits.items():
+        # "validation" keeps the historical "valid" file name
+        base_name = os.path.join(output_dir, f"{'valid' if name == 'validation' else name}_dataset_augmented")
+        if format == "json":
+            # A JSON list written element by element, so the split is never held as Python objects
+            with open(f"{base_name}.json", "w") as f:
+                f.write("[")
+                for index, sample in enumerate(split):
+                    f.write(("," if index else "") + "\n    " + json.dumps(sample))
+                f.write("\n]\n")
+            print(f"Saved {len(split)} samples to {base_name}.json")
+        else:
+            with ShardWriter(base_name, shard_size=shard_size, format=format) as writer:
+                writer.write_many(split)
+            print(f"Saved {writer.samples} samples to {writer.shards} {format} shards in {base_name}/")
 
 def save_test_dataset_to_json():
     """
     Save the test dataset to a JSON file for evaluation purposes.
     """
-    _, _, test_dataset = load_defect_detection_dataset()
-    with open("test_dataset_augmented.json", "w") as f:
-        json.dump(test_dataset, f, indent=4)
-    print(f"Test dataset saved to test_dataset_augmented.json with {len(test_dataset)} samples.")
+    splits = prepare_defect_detection_splits()
+    save_splits({"test": splits["test"]})
 
 if __name__ == "__main__":
-    # Load datasets
-    train_dataset, valid_dataset, test_dataset = load_defect_detection_dataset()
-
-    # Save the updated datasets
-    with open("train_dataset_augmented.json", "w") as f:
-        json.dump(train_dataset, f, indent=4)
-    with open("valid_dataset_augmented.json", "w") as f:
-        json.dump(valid_dataset, f, indent=4)
-    with open("test_dataset_augmented.json", "w") as f:
-        json.dump(test_dataset, f, indent=4)
-
-    print("Augmented datasets saved with additional complexity tags.")
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Prepare the augmented CodeXGLUE Defect Detection splits.")
+    parser.add_argument("--format", choices=["json", "jsonl", "parquet"], default="json",
+                        help="json writes one file per split; jsonl and parquet stream each split into shards.")
+    parser.add_argument("--output-dir", default=".")
+    parser.add_argument("--shard-size", type=int, default=10000, help="Samples per shard.")
+    parser.add_argument("--num-proc", type=int, default=None, help="Processes for the batched map steps.")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for balancing the training split.")
+    args = parser.parse_args()
+
+    splits = prepare_defect_detection_splits(args.num_proc, args.seed)
+    print_split_distribution(splits["train"], "Balanced Training Dataset")
+    save_splits(splits, args.output_dir, args.format, args.shard_size)
+
+    print("Augmented datasets saved with additional complexity tags.")
@@ -0,0 +1,60 @@
+from collections import Counter, defaultdict
+
+
+def compute_score(counts, statements):
+    """Pylint's default evaluation formula, applied to a single file."""
+    if counts["fatal"]:
+        return 0.0
+    if statements <= 0:
+        return None
+    penalty = 5 * counts["error"] + counts["warning"] + counts["refactor"] + counts["convention"]
+    return max(0.0, 10.0 - penalty / statements * 10)
+
+
+def render_report(module, messages, score, path=None):
+    """Render one file's messages in the layout of Pylint's text reporter, optionally under another `path`."""
+    lines = [f"************* Module {module}"] if messages else []
+    for message in sorted(messages, key=lambda m: (m.line or 0, m.column or 0)):
+        lines.append(f"{path or message.path}:{message.line}:{message.column}: {message.msg_id}: "
+                     f"{message.msg} ({message.symbol})")
+    if score is not None:
+        lines.append("")
+        lines.append("-" * 68)
+        lines.append(f"Your code has been rated at {score:.2f}/10")
+    return "\n".join(lines) + "\n"
+
+
+def lint_files(file_names, jobs=0, rcfile=".pylintrc", display_names=None):
+    """
+    Lint all files of a pull request in a single in-process Pylint run and split the results per file.
+    `jobs` is passed to Pylint's own --jobs option (0 uses every CPU). `display_names` maps the paths
+    linted to the names shown in the reports (e.g. staged copies back to their repository paths).
+    Returns {file_name: (report_text, score)}.
+    """
+    if not file_names:
+        return {}
+
+    # Pylint takes a noticeable moment to import, so only runs that lint pay for it
+    from pylint.lint import Run
+    from pylint.reporters import CollectingReporter
+
+    reporter = CollectingReporter()
+    run = Run([f"--rcfile={rcfile}", f"--jobs={jobs}", "--score=n", *file_names], reporter=reporter, exit=False)
+    by_module = run.linter.stats.by_module
+
+    messages_by_path = defaultdict(list)
+    for message in reporter.messages:
+        messages_by_path[message.path].append(message)
+
+    results = {}
+    for file_name in file_names:
+        messages = messages_by_path.get(file_name, [])
+        module = messages[0].module if messages else file_name.removesuffix(".py").replace("/", ".")
+        counts = Counter(message.category for message in messages)
+        statements = by_module.get(module, {}).get("statement", 0)
+        score = compute_score(counts, statements)
+        if score is None and not messages:
+            score = 10.0
+        display_name = (display_names or {}).get(file_name)
+        results[file_name] = (render_report(module, messages, score, display_name), score)
+    return results
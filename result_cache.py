@@ -0,0 +1,114 @@
+import hashlib
+import os
+import threading
+import time
+from storage import DB_PATH, get_connection
+
+
+def hash_file(path):
+    """SHA-256 of a file's content, or of nothing if it does not exist."""
+    digest = hashlib.sha256()
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def pylint_fingerprint(rcfile=".pylintrc"):
+    """Identify the linter configuration: Pylint version plus the rcfile content."""
+    try:
+        from pylint import __version__ as pylint_version
+    except ImportError:
+        pylint_version = "unknown"
+    return f"pylint-{pylint_version}:{hash_file(rcfile)}"
+
+
+def model_fingerprint(model):
+    """
+    Identify the checkpoint behind a loaded model without hashing hundreds of MB of weights:
+    hub revision for downloaded models, file names/sizes/mtimes for local checkpoint directories.
+    """
+    name_or_path = getattr(model, "name_or_path", "") or ""
+    digest = hashlib.sha256(name_or_path.encode())
+    digest.update(str(getattr(model.config, "_commit_hash", None)).encode())
+    if os.path.isdir(name_or_path):
+        for name in sorted(os.listdir(name_or_path)):
+            stat = os.stat(os.path.join(name_or_path, name))
+            digest.update(f"{name}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    Persistent, content-addressed cache of per-file analysis results stored in code_analysis.db.
+    Entries are keyed by the git blob SHA of the file plus the linter and model fingerprints, and
+    evicted least-recently-used first once their total size exceeds `max_bytes`.
+    """
+
+    def __init__(self, db_path=DB_PATH, max_bytes=64 * 1024 * 1024, enabled=True):
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        # Pipeline fetch threads share one cache
+        self._counter_lock = threading.Lock()
+
+    @staticmethod
+    def make_key(blob_sha, *context):
+        """Combine the blob SHA with everything else that influences the result (linter, model, settings)."""
+        return hashlib.sha256("|".join(str(part) for part in (blob_sha,) + context).encode()).hexdigest()
+
+    def get(self, key):
+        """Return the cached (pylint_output, pylint_score, ai_analysis) for `key`, or None."""
+        if not self.enabled:
+            return None
+        conn = get_connection(self.db_path)
+        row = conn.execute(
+            "SELECT pylint_output, pylint_score, ai_analysis FROM analysis_cache WHERE cache_key = ?",
+            (key,)
+        ).fetchone()
+        if row:
+            with conn:
+                conn.execute("UPDATE analysis_cache SET last_used = ? WHERE cache_key = ?", (time.time(), key))
+        with self._counter_lock:
+            if row:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return row
+
+    def put_many(self, entries):
+        """Store (key, pylint_output, pylint_score, ai_analysis) tuples, then evict down to the size limit."""
+        if not self.enabled or not entries:
+            return
+        now = time.time()
+        rows = [
+            (key, output, score, verdict, len(output or "") + len(verdict or ""), now)
+            for key, output, score, verdict in entries
+        ]
+        conn = get_connection(self.db_path)
+        with conn:
+            conn.executemany("""
+                INSERT OR REPLACE INTO analysis_cache (
+                    cache_key, pylint_output, pylint_score, ai_analysis, size, last_used
+                ) VALUES (?, ?, ?, ?, ?, ?)
+            """, rows)
+            self._evict(conn)
+
+    def _evict(self, conn):
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM analysis_cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        stale = []
+        for key, size in conn.execute("SELECT cache_key, size FROM analysis_cache ORDER BY last_used ASC"):
+            if total <= self.max_bytes:
+                break
+            stale.append((key,))
+            total -= size
+        conn.executemany("DELETE FROM analysis_cache WHERE cache_key = ?", stale)
+
+    def summary(self):
+        """One-line hit/miss summary for logs and PR comments."""
+        return f"{self.hits} hits / {self.misses} misses"
@@ -0,0 +1,220 @@
+import argparse
+import json
+import queue
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from inference import verdict_from_probability
+
+DEFAULT_URL = "http://127.0.0.1:8765"
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list of numbers."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+
+class _PendingRequest:
+    def __init__(self, snippets, reducer):
+        self.snippets = snippets
+        self.reducer = reducer
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class BatchingScorer:
+    """
+    Scores snippets on one worker thread, coalescing requests from concurrent callers that arrive
+    within `max_wait` seconds of each other into shared forward passes.
+    """
+
+    def __init__(self, backend, max_wait=0.01, max_snippets=256):
+        self.backend = backend
+        self.max_wait = max_wait
+        self.max_snippets = max_snippets
+        self.requests = queue.Queue()
+        self.batches = 0
+        threading.Thread(target=self._loop, name="batching-scorer", daemon=True).start()
+
+    def submit(self, snippets, reducer=None):
+        """Block until the issue probabilities of `snippets` are available."""
+        pending = _PendingRequest(list(snippets), reducer)
+        self.requests.put(pending)
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def _collect(self):
+        batch = [self.requests.get()]
+        total = len(batch[0].snippets)
+        deadline = time.monotonic() + self.max_wait
+        while total < self.max_snippets:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                pending = self.requests.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(pending)
+            total += len(pending.snippets)
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            self.batches += 1
+            # Requests asking for the same reducer share one pass
+            groups = {}
+            for pending in batch:
+                groups.setdefault(pending.reducer, []).append(pending)
+            for reducer, members in groups.items():
+                snippets = [snippet for pending in members for snippet in pending.snippets]
+                try:
+                    scores = self.backend.score(snippets, reducer=reducer)
+                except Exception as e:
+                    for pending in members:
+                        pending.error = e
+                        pending.done.set()
+                    continue
+                offset = 0
+                for pending in members:
+                    pending.result = scores[offset:offset + len(pending.snippets)]
+                    offset += len(pending.snippets)
+                    pending.done.set()
+
+
+def make_handler(scorer, model_id, latencies):
+    """Build the request handler class bound to a loaded scorer."""
+
+    class ScoringHandler(BaseHTTPRequestHandler):
+        def _send_json(self, status, payload):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._send_json(200, {"status": "ok", "model_fingerprint": model_id})
+            elif self.path == "/stats":
+                samples = list(latencies)
+                self._send_json(200, {
+                    "model_fingerprint": model_id,
+                    "requests": len(samples),
+                    "batches": scorer.batches,
+                    "latency_ms": {
+                        name: (round(value * 1000, 2) if value is not None else None)
+                        for name, value in (("p50", percentile(samples, 0.5)),
+                                            ("p90", percentile(samples, 0.9)),
+                                            ("p99", percentile(samples, 0.99)))
+                    }
+                })
+            else:
+                self._send_json(404, {"error": "not found"})
+
+        def do_POST(self):
+            if self.path != "/score":
+                self._send_json(404, {"error": "not found"})
+                return
+            start = time.perf_counter()
+            try:
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                probabilities = scorer.submit(request["snippets"], request.get("reducer"))
+            except Exception as e:
+                self._send_json(500, {"error": str(e)})
+                return
+            latencies.append(time.perf_counter() - start)
+            self._send_json(200, {"probabilities": probabilities})
+
+        def log_message(self, format, *args):
+            pass
+
+    return ScoringHandler
+
+
+def serve(model_path="microsoft/codebert-base", host="127.0.0.1", port=8765, batch_size=16, max_wait=0.01,
+          backend="torch", cascade_teacher=None, cascade_confidence=0.9):
+    """Load the model once and serve scoring requests until interrupted."""
+    from inference_backends import load_backend
+
+    loaded = load_backend(backend, model_path, batch_size=batch_size, cascade_teacher=cascade_teacher,
+                          cascade_confidence=cascade_confidence)
+    scorer = BatchingScorer(loaded, max_wait=max_wait)
+    handler = make_handler(scorer, loaded.fingerprint(), deque(maxlen=10000))
+    server = ThreadingHTTPServer((host, port), handler)
+    print(f"Scoring server for {model_path} listening on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+class ScoringClient:
+    """Thin client for the scoring server; callers fall back to in-process scoring when it is absent."""
+
+    def __init__(self, url=DEFAULT_URL, timeout=300):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+
+    def _get(self, path, timeout=None):
+        with urllib.request.urlopen(self.url + path, timeout=timeout or self.timeout) as response:
+            return json.loads(response.read())
+
+    def available(self):
+        """True if a server answers the health check."""
+        try:
+            return self._get("/health", timeout=1).get("status") == "ok"
+        except (urllib.error.URLError, OSError, ValueError):
+            return False
+
+    def fingerprint(self):
+        """Fingerprint of the model the server has loaded, for cache keys."""
+        return self._get("/health")["model_fingerprint"]
+
+    def stats(self):
+        return self._get("/stats")
+
+    def score(self, snippets, reducer=None):
+        """Issue probability of every snippet, scored by the server."""
+        request = urllib.request.Request(
+            self.url + "/score",
+            data=json.dumps({"snippets": list(snippets), "reducer": reducer}).encode(),
+            headers={"Content-Type": "application/json"}
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return json.loads(response.read())["probabilities"]
+
+    def analyze(self, snippets, reducer=None):
+        """One verdict per snippet, like inference.analyze_code_batch."""
+        return [verdict_from_probability(probability) for probability in self.score(snippets, reducer)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve CodeBERT scoring requests from a model loaded once.")
+    parser.add_argument("--model", default="microsoft/codebert-base", help="Model name or checkpoint directory.")
+    parser.add_argument("--backend", choices=["torch", "int8", "onnx"], default="torch")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--max-wait-ms", type=float, default=10,
+                        help="How long to wait for concurrent requests to join a batch.")
+    parser.add_argument("--cascade-teacher", default=None,
+                        help="Full checkpoint that rescores the snippets the distilled --model is unsure about.")
+    parser.add_argument("--cascade-confidence", type=float, default=0.9,
+                        help="Student confidence below which a snippet goes to the --cascade-teacher.")
+    args = parser.parse_args()
+    serve(args.model, args.host, args.port, args.batch_size, args.max_wait_ms / 1000, args.backend,
+          args.cascade_teacher, args.cascade_confidence)
@@ -0,0 +1,449 @@
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from inference import ISSUE_VERDICT
+
+DB_PATH = "code_analysis.db"
+
+
+def _create_analysis_table(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS pull_request_analysis (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            pull_request_id INTEGER,
+            title TEXT,
+            author TEXT,
+            file_name TEXT,
+            pylint_score REAL,
+            ai_analysis TEXT,
+            timestamp TEXT
+        )
+    """)
+
+
+def _add_analysis_mode(conn):
+    # Databases touched by the first hunk-mode release may already have the column
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(pull_request_analysis)")]
+    if "analysis_mode" not in columns:
+        conn.execute("ALTER TABLE pull_request_analysis ADD COLUMN analysis_mode TEXT DEFAULT 'full'")
+
+
+def _create_analysis_cache(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS analysis_cache (
+            cache_key TEXT PRIMARY KEY,
+            pylint_output TEXT,
+            pylint_score REAL,
+            ai_analysis TEXT,
+            size INTEGER,
+            last_used REAL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_analysis_cache_last_used ON analysis_cache (last_used)")
+
+
+def _create_dashboard_indexes(conn):
+    # Match the dashboard's filters and keyset sort orders; id breaks ties between equal sort values
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_analysis_pr ON pull_request_analysis (pull_request_id, timestamp, id)")
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_analysis_author
+        ON pull_request_analysis (author COLLATE NOCASE, timestamp, id)
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_analysis_timestamp ON pull_request_analysis (timestamp, id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_analysis_score ON pull_request_analysis (pylint_score, id)")
+
+
+def _create_rollups(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS pr_summary (
+            pull_request_id INTEGER PRIMARY KEY,
+            title TEXT,
+            author TEXT,
+            files INTEGER,
+            scored_files INTEGER,
+            overall_score REAL,
+            issue_files INTEGER,
+            runs INTEGER,
+            last_analyzed TEXT
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS author_stats (
+            author TEXT PRIMARY KEY,
+            runs INTEGER,
+            files INTEGER,
+            scored_files INTEGER,
+            score_sum REAL,
+            average_score REAL,
+            rolling_score REAL,
+            issue_files INTEGER,
+            last_analyzed TEXT
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_author_stats_average ON author_stats (average_score)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_author_stats_rolling ON author_stats (rolling_score)")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS daily_score_histogram (
+            day TEXT,
+            bucket INTEGER,
+            files INTEGER,
+            score_sum REAL,
+            PRIMARY KEY (day, bucket)
+        )
+    """)
+
+    # Backfill from the history: each PR's rows are treated as one run
+    runs = {}
+    for pr_id, title, author, score, ai_analysis, timestamp in conn.execute("""
+        SELECT pull_request_id, title, author, pylint_score, ai_analysis, timestamp
+        FROM pull_request_analysis ORDER BY id
+    """):
+        runs.setdefault(pr_id, []).append((pr_id, title, author, None, score, ai_analysis, timestamp, None))
+    for rows in runs.values():
+        _update_rollups(conn, rows)
+
+
+def _create_pr_timings(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS pr_timings (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            pull_request_id INTEGER,
+            timestamp TEXT,
+            total_seconds REAL,
+            breakdown TEXT
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_pr_timings_pr ON pr_timings (pull_request_id, timestamp)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_pr_timings_total ON pr_timings (total_seconds)")
+
+
+def _create_notification_outbox(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS notification_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT,
+            dedupe_key TEXT,
+            payload TEXT,
+            status TEXT DEFAULT 'pending',
+            attempts INTEGER DEFAULT 0,
+            next_attempt REAL,
+            last_error TEXT,
+            created REAL,
+            sent REAL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_outbox_due ON notification_outbox (status, next_attempt, id)")
+    # At most one undelivered message per key, so repeated status updates for a SHA collapse into the latest
+    conn.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_outbox_pending_key
+        ON notification_outbox (dedupe_key) WHERE status = 'pending'
+    """)
+
+
+def _create_github_state(conn):
+    # Conditional-request cache: the last ETag and body of every GitHub API URL read
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS github_responses (
+            url TEXT PRIMARY KEY,
+            etag TEXT,
+            link TEXT,
+            body TEXT,
+            fetched REAL,
+            size INTEGER,
+            last_used REAL
+        )
+    """)
+    # Size and last use of each response, for LRU eviction like analysis_cache
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_github_responses_last_used ON github_responses (last_used)")
+    # Head commit of each pull request at its last analysis, so unchanged PRs are skipped
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS analyzed_heads (
+            pull_request_id INTEGER PRIMARY KEY,
+            head_sha TEXT,
+            analyzed TEXT
+        )
+    """)
+
+
+def _create_pr_comments(conn):
+    # The sticky review comment of each pull request and the hash of the body last posted to it
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS pr_comments (
+            pull_request_id INTEGER PRIMARY KEY,
+            comment_id INTEGER,
+            body_sha TEXT,
+            updated TEXT
+        )
+    """)
+    # The untruncated report behind each comment, served by the dashboard
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS pr_reports (
+            pull_request_id INTEGER PRIMARY KEY,
+            head_sha TEXT,
+            report TEXT,
+            updated TEXT
+        )
+    """)
+
+
+def _create_snippet_embeddings(conn):
+    # One record per vector of the float16 embedding file (see embedding_store.py), by position in the file
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS snippet_embeddings (
+            vector_row INTEGER PRIMARY KEY,
+            pull_request_id INTEGER,
+            file_name TEXT,
+            model TEXT,
+            issue_probability REAL,
+            ai_analysis TEXT,
+            reused_from INTEGER,
+            similarity REAL,
+            created TEXT
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_snippet_embeddings_pr ON snippet_embeddings (pull_request_id)")
+    # Per model: the mean embedding subtracted from every vector (float32 bytes) and the highest similarity
+    # a one-token edit kept, NULL when no reuse threshold is safe
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS embedding_calibration (
+            model TEXT PRIMARY KEY,
+            center BLOB,
+            threshold REAL,
+            functions INTEGER,
+            created TEXT
+        )
+    """)
+
+
+# Ordered schema migrations; PRAGMA user_version records how many have been applied.
+# Each step takes an open connection so it can inspect the existing schema.
+MIGRATIONS = [
+    _create_analysis_table,
+    _add_analysis_mode,
+    _create_analysis_cache,
+    _create_dashboard_indexes,
+    _create_rollups,
+    _create_pr_timings,
+    _create_notification_outbox,
+    _create_github_state,
+    _create_pr_comments,
+    _create_snippet_embeddings
+]
+
+# Weight of the newest PR in an author's exponentially weighted rolling score
+ROLLING_ALPHA = 0.3
+
+_local = threading.local()
+_migrated = set()
+_migrate_lock = threading.Lock()
+
+
+def _open(db_path):
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")  # readers never block the writer
+    conn.execute("PRAGMA synchronous=NORMAL")  # fsync at checkpoints instead of every commit
+    conn.execute("PRAGMA busy_timeout=30000")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+
+def get_connection(db_path=DB_PATH):
+    """
+    Return this thread's reusable connection to `db_path`, opening and migrating it on first use.
+    Connections are never shared between threads or carried across a fork.
+    """
+    connections = getattr(_local, "connections", None)
+    if connections is None or getattr(_local, "pid", None) != os.getpid():
+        connections = _local.connections = {}
+        _local.pid = os.getpid()
+
+    conn = connections.get(db_path)
+    if conn is None:
+        conn = connections[db_path] = _open(db_path)
+        migrate(conn, db_path)
+    return conn
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn, db_path=DB_PATH):
+    """Apply every migration newer than the database's user_version, each in its own transaction."""
+    with _migrate_lock:
+        if (os.getpid(), db_path) in _migrated:
+            return
+        version = schema_version(conn)
+        for number, step in enumerate(MIGRATIONS[version:], start=version + 1):
+            with conn:
+                step(conn)
+                conn.execute(f"PRAGMA user_version = {number}")
+        _migrated.add((os.getpid(), db_path))
+
+
+def close_connections(checkpoint=False):
+    """
+    Close the current thread's connections (e.g. at the end of a run). With `checkpoint`, the WAL is first
+    copied into the database file and truncated, so the .db file alone holds every committed write.
+    """
+    for conn in getattr(_local, "connections", {}).values():
+        if checkpoint:
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        conn.close()
+    _local.connections = {}
+
+
+def _update_rollups(conn, rows):
+    """
+    Fold one run's pull_request_analysis rows into the per-PR, per-author and daily rollup tables.
+    Runs inside the caller's transaction so the rollups never disagree with the raw rows.
+    """
+    by_pr = {}
+    for row in rows:
+        by_pr.setdefault(row[0], []).append(row)
+
+    for pr_id, pr_rows in by_pr.items():
+        _, title, author = pr_rows[-1][:3]
+        timestamp = pr_rows[-1][6]
+        scores = [row[4] for row in pr_rows if row[4] is not None]
+        overall = sum(scores) / len(scores) if scores else None
+        issues = sum(1 for row in pr_rows if row[5] == ISSUE_VERDICT)
+
+        # The PR summary always reflects the latest run
+        conn.execute("""
+            INSERT INTO pr_summary (
+                pull_request_id, title, author, files, scored_files, overall_score, issue_files, runs, last_analyzed
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, 1, ?)
+            ON CONFLICT (pull_request_id) DO UPDATE SET
+                title = excluded.title, author = excluded.author, files = excluded.files,
+                scored_files = excluded.scored_files, overall_score = excluded.overall_score,
+                issue_files = excluded.issue_files, runs = pr_summary.runs + 1,
+                last_analyzed = excluded.last_analyzed
+        """, (pr_id, title, author, len(pr_rows), len(scores), overall, issues, timestamp))
+
+        # Author stats accumulate over every run
+        conn.execute("""
+            INSERT INTO author_stats (
+                author, runs, files, scored_files, score_sum, average_score, rolling_score, issue_files, last_analyzed
+            ) VALUES (?, 1, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (author) DO UPDATE SET
+                runs = author_stats.runs + 1,
+                files = author_stats.files + excluded.files,
+                scored_files = author_stats.scored_files + excluded.scored_files,
+                score_sum = author_stats.score_sum + excluded.score_sum,
+                average_score = (author_stats.score_sum + excluded.score_sum)
+                    / NULLIF(author_stats.scored_files + excluded.scored_files, 0),
+                rolling_score = CASE
+                    WHEN excluded.rolling_score IS NULL THEN author_stats.rolling_score
+                    WHEN author_stats.rolling_score IS NULL THEN excluded.rolling_score
+                    ELSE ? * excluded.rolling_score + (1 - ?) * author_stats.rolling_score
+                END,
+                issue_files = author_stats.issue_files + excluded.issue_files,
+                last_analyzed = excluded.last_analyzed
+        """, (author, len(pr_rows), len(scores), sum(scores), overall, overall, issues, timestamp,
+              ROLLING_ALPHA, ROLLING_ALPHA))
+
+    histogram = {}
+    for row in rows:
+        if row[4] is None:
+            continue
+        key = ((row[6] or "")[:10], min(max(int(row[4]), 0), 10))
+        files, score_sum = histogram.get(key, (0, 0.0))
+        histogram[key] = (files + 1, score_sum + row[4])
+    conn.executemany("""
+        INSERT INTO daily_score_histogram (day, bucket, files, score_sum) VALUES (?, ?, ?, ?)
+        ON CONFLICT (day, bucket) DO UPDATE SET
+            files = daily_score_histogram.files + excluded.files,
+            score_sum = daily_score_histogram.score_sum + excluded.score_sum
+    """, [(day, bucket, files, score_sum) for (day, bucket), (files, score_sum) in histogram.items()])
+
+
+def save_pr_timings(pr_id, total_seconds, breakdown, db_path=DB_PATH):
+    """Record how long one run of a pull request took and where the time went (seconds per timer)."""
+    conn = get_connection(db_path)
+    with conn:
+        conn.execute(
+            "INSERT INTO pr_timings (pull_request_id, timestamp, total_seconds, breakdown) VALUES (?, ?, ?, ?)",
+            (pr_id, datetime.now().isoformat(), total_seconds,
+             json.dumps({key: round(value, 6) for key, value in sorted(breakdown.items())}))
+        )
+
+
+def analyzed_heads(db_path=DB_PATH):
+    """Head SHA of every pull request at its last recorded analysis, by PR number."""
+    return dict(get_connection(db_path).execute("SELECT pull_request_id, head_sha FROM analyzed_heads"))
+
+
+def record_analyzed_head(pr_id, head_sha, db_path=DB_PATH):
+    conn = get_connection(db_path)
+    with conn:
+        conn.execute("""
+            INSERT INTO analyzed_heads (pull_request_id, head_sha, analyzed) VALUES (?, ?, ?)
+            ON CONFLICT (pull_request_id) DO UPDATE SET head_sha = excluded.head_sha, analyzed = excluded.analyzed
+        """, (pr_id, head_sha, datetime.now().isoformat()))
+
+
+def get_pr_comment(pr_id, db_path=DB_PATH):
+    """(comment_id, body_sha) of the sticky comment of a pull request, or None before the first post."""
+    return get_connection(db_path).execute(
+        "SELECT comment_id, body_sha FROM pr_comments WHERE pull_request_id = ?", (pr_id,)
+    ).fetchone()
+
+
+def save_pr_comment(pr_id, comment_id, body_sha, db_path=DB_PATH):
+    conn = get_connection(db_path)
+    with conn:
+        conn.execute("""
+            INSERT INTO pr_comments (pull_request_id, comment_id, body_sha, updated) VALUES (?, ?, ?, ?)
+            ON CONFLICT (pull_request_id) DO UPDATE SET
+                comment_id = excluded.comment_id, body_sha = excluded.body_sha, updated = excluded.updated
+        """, (pr_id, comment_id, body_sha, datetime.now().isoformat()))
+
+
+def save_pr_report(pr_id, head_sha, report, db_path=DB_PATH):
+    conn = get_connection(db_path)
+    with conn:
+        conn.execute("""
+            INSERT INTO pr_reports (pull_request_id, head_sha, report, updated) VALUES (?, ?, ?, ?)
+            ON CONFLICT (pull_request_id) DO UPDATE SET
+                head_sha = excluded.head_sha, report = excluded.report, updated = excluded.updated
+        """, (pr_id, head_sha, report, datetime.now().isoformat()))
+
+
+class AnalysisWriter:
+    """
+    Buffers pull_request_analysis rows and writes them with one executemany in a single transaction,
+    together with the matching rollup updates. Used as a context manager around all the files of a
+    pull request, so each flush is one run of that PR.
+    """
+
+    def __init__(self, db_path=DB_PATH):
+        self.db_path = db_path
+        self.rows = []
+
+    def add(self, pr_id, title, author, file_name, pylint_score, ai_analysis, analysis_mode="full"):
+        self.rows.append((pr_id, title, author, file_name, pylint_score, ai_analysis,
+                          datetime.now().isoformat(), analysis_mode))
+
+    def flush(self):
+        if not self.rows:
+            return
+        conn = get_connection(self.db_path)
+        with conn:
+            conn.executemany("""
+                INSERT INTO pull_request_analysis (
+                    pull_request_id, title, author, file_name, pylint_score, ai_analysis, timestamp, analysis_mode
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, self.rows)
+            _update_rollups(conn, self.rows)
+        self.rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            self.flush()
+        return False
@@ -1,16 +1,23 @@
+import argparse
 import json
+import os
+import shutil
+import time
 import torch
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
 from transformers import RobertaTokenizer
-from fine_tune_codebert import RobertaWithoutAuxiliaryFeatures
+from models import RobertaWithoutAuxiliaryFeatures
+from checkpoints import load_pretrained
 from torch.utils.data import DataLoader, Dataset
+from dataset_shards import load_shards
+from token_cache import TokenizedDataset, get_token_cache
+from dynamic_batching import DynamicPaddingCollator, PaddingStats, dataset_lengths
+from inference import bucket_by_length
 
 # model_path = "./fine_tuned_codebert_with_auxnew/checkpoint-250"
 model_path = "./fine_tuned_codebert/checkpoint-2504"
 
-tokenizer = RobertaTokenizer.from_pretrained(model_path)
-model = RobertaWithoutAuxiliaryFeatures.from_pretrained(model_path)
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-model.to(device)
 
 class TestCodeDataset(Dataset):
     def __init__(self, data, tokenizer, max_length=512):
@@ -34,38 +41,164 @@ class TestCodeDataset(Dataset):
         inputs["labels"] = torch.tensor(item["label"], dtype=torch.long)
         return inputs
 
-with open("test_dataset_augmented_filtered.json", "r") as f:
-    test_data = json.load(f)
-
-test_data = test_data[:500]
-test_dataset = TestCodeDataset(test_data, tokenizer)
-test_loader = DataLoader(test_dataset, batch_size=16, shuffle=False)
-
-model.eval()
-correct = 0
-total = 0
-wrong_predictions = []
-
-with torch.no_grad():
-    for batch in test_loader:
-        inputs = {key: val.to(device) for key, val in batch.items() if key != "labels"}
-        labels = batch["labels"].to(device)
-        outputs = model(**inputs)  # No 'auxiliary_features'
-        predicted_labels = torch.argmax(outputs["logits"], dim=1)
-        correct += (predicted_labels == labels).sum().item()
-        total += labels.size(0)
-
-        for i in range(len(labels)):
-            if predicted_labels[i] != labels[i]:
-                wrong_predictions.append({
-                    "code": test_data[total - len(labels) + i]["code"],
-                    "true_label": labels[i].item(),
-                    "predicted_label": predicted_labels[i].item()
-                })
-
-accuracy = correct / total
-print(f"Test Accuracy: {accuracy * 100:.2f}%")
-
-with open("wrong_predictions.json", "w") as f:
-    json.dump(wrong_predictions, f, indent=4)
-    print(f"Misclassified examples saved to wrong_predictions.json")
\ No newline at end of file
+
+def add_arguments(parser):
+    parser.add_argument("data", nargs="?", default="test_dataset_augmented_filtered.json",
+                        help="A legacy JSON file or a directory of shards written by prepare_dataset.py / filter_outliers.py.")
+    parser.add_argument("--model", default=model_path, help="Checkpoint directory to evaluate.")
+    parser.add_argument("--limit", type=int, default=None, help="Evaluate only the first N samples (default: all).")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Processes evaluating contiguous shards of the test set in parallel on the CPU.")
+    parser.add_argument("--threads-per-worker", type=int, default=None,
+                        help="torch intra-op threads per worker (default: CPU count divided by --workers).")
+    parser.add_argument("--output", default="wrong_predictions.jsonl",
+                        help="JSON Lines file the misclassified examples are streamed to.")
+    parser.add_argument("--no-token-cache", action="store_true", help="Tokenize every sample on every access.")
+    parser.add_argument("--padding", choices=["dynamic", "max_length"], default="dynamic",
+                        help="Trim each batch to its longest sample, or pad every sample to the full 512 tokens.")
+    parser.add_argument("--no-group-by-length", action="store_true", help="Evaluate in dataset order.")
+    parser.add_argument("--batch-size", type=int, default=16)
+
+
+def evaluate_shard(job):
+    """
+    Evaluate one contiguous shard of the test set, appending each misclassified example to the shard's
+    JSON Lines file as soon as its batch is scored. Runs in a worker process when --workers > 1; the
+    job carries only the shard's offset and size, and the worker memory-maps the dataset itself. Returns the shard's 2x2 confusion matrix (rows: true label, columns: prediction) and padding stats.
+    """
+    torch.set_num_threads(job["threads"])
+    samples = load_shards(job["data"])
+    offset, count = job["offset"], job["count"]
+    model = load_pretrained(RobertaWithoutAuxiliaryFeatures, job["model"])
+    device = torch.device("cuda" if torch.cuda.is_available() and job["use_cuda"] else "cpu")
+    model.to(device)
+    model.eval()
+
+    if job["cache_dir"] is None:
+        test_dataset = TestCodeDataset(samples.select(range(offset, offset + count)),
+                                       RobertaTokenizer.from_pretrained(job["model"]))
+    else:
+        test_dataset = TokenizedDataset(job["cache_dir"], auxiliary_features=False, start=offset, stop=offset + count)
+
+    # Batches of sample indices: similar lengths together, or dataset order
+    if job["group_by_length"]:
+        batches = bucket_by_length(dataset_lengths(test_dataset), job["batch_size"])
+    else:
+        batches = [list(range(start, min(start + job["batch_size"], len(test_dataset))))
+                   for start in range(0, len(test_dataset), job["batch_size"])]
+    collate_fn = DynamicPaddingCollator() if job["dynamic_padding"] else None
+    test_loader = DataLoader(test_dataset, batch_sampler=batches, collate_fn=collate_fn)
+
+    confusion = [[0, 0], [0, 0]]
+    padding_stats = PaddingStats()
+    start = time.perf_counter()
+    with open(job["output"], "w") as out, torch.inference_mode():
+        for batch_indices, batch in zip(batches, test_loader):
+            inputs = {key: val.to(device) for key, val in batch.items() if key != "labels"}
+            outputs = model(**inputs)  # No 'auxiliary_features'
+            predicted_labels = torch.argmax(outputs["logits"], dim=1).tolist()
+            padding_stats.update(batch["attention_mask"])
+
+            for index, true_label, predicted_label in zip(batch_indices, batch["labels"].tolist(), predicted_labels):
+                confusion[true_label][predicted_label] += 1
+                if predicted_label != true_label:
+                    out.write(json.dumps({
+                        "index": offset + index,
+                        "code": samples[offset + index]["code"],
+                        "true_label": true_label,
+                        "predicted_label": predicted_label
+                    }) + "\n")
+            out.flush()
+    padding_stats.seconds = time.perf_counter() - start
+    return {"confusion": confusion, "real_tokens": padding_stats.real_tokens,
+            "padded_tokens": padding_stats.padded_tokens, "seconds": padding_stats.seconds}
+
+
+def classification_report(confusion):
+    """Accuracy plus precision, recall and F1 of each class from a confusion matrix."""
+    total = sum(map(sum, confusion))
+    report = {"samples": total, "accuracy": sum(confusion[i][i] for i in range(len(confusion))) / total if total else 0.0}
+    for label in range(len(confusion)):
+        true_positives = confusion[label][label]
+        predicted = sum(row[label] for row in confusion)
+        actual = sum(confusion[label])
+        precision = true_positives / predicted if predicted else 0.0
+        recall = true_positives / actual if actual else 0.0
+        f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+        report[label] = {"precision": precision, "recall": recall, "f1": f1, "support": actual}
+    report["macro_f1"] = sum(report[label]["f1"] for label in range(len(confusion))) / len(confusion)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Evaluate the fine-tuned model on the test set.")
+    add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    # Memory-mapped, so neither this process nor the workers hold the test set as Python objects
+    test_data = load_shards(args.data)
+    if args.limit is not None:
+        test_data = test_data.select(range(min(args.limit, len(test_data))))
+    if not len(test_data):
+        print(f"No samples to evaluate in {args.data}")
+        return classification_report([[0, 0], [0, 0]])
+
+    cache_dir = None
+    if not args.no_token_cache:
+        # Built once here; every worker memory-maps its own slice of it
+        cache_dir = get_token_cache(test_data, RobertaTokenizer.from_pretrained(args.model), 512)
+
+    workers = max(1, min(args.workers, len(test_data)))
+    threads = args.threads_per_worker or max(1, (os.cpu_count() or 1) // workers)
+    shard_size = -(-len(test_data) // workers)
+    jobs = [{
+        "model": args.model,
+        "data": args.data,
+        "offset": offset,
+        "count": min(shard_size, len(test_data) - offset),
+        "cache_dir": cache_dir,
+        "threads": threads,
+        "use_cuda": workers == 1,
+        "batch_size": args.batch_size,
+        "group_by_length": not args.no_group_by_length,
+        "dynamic_padding": args.padding == "dynamic",
+        "output": f"{args.output}.part-{shard:05d}"
+    } for shard, offset in enumerate(range(0, len(test_data), shard_size))]
+
+    print(f"Evaluating {len(test_data)} samples in {len(jobs)} shards with {threads} threads each")
+    start = time.perf_counter()
+    if len(jobs) == 1:
+        results = [evaluate_shard(jobs[0])]
+    else:
+        # Weights are memory-mapped, so the processes share one copy of the checkpoint in the page cache
+        with ProcessPoolExecutor(max_workers=len(jobs), mp_context=get_context("spawn")) as executor:
+            results = list(executor.map(evaluate_shard, jobs))
+    seconds = time.perf_counter() - start
+
+    # Merge the per-shard outputs in shard order; each record carries its dataset index
+    with open(args.output, "w") as out:
+        for job in jobs:
+            with open(job["output"], "r") as part:
+                shutil.copyfileobj(part, out)
+            os.remove(job["output"])
+
+    confusion = [[sum(result["confusion"][i][j] for result in results) for j in range(2)] for i in range(2)]
+    report = classification_report(confusion)
+    padding_stats = PaddingStats()
+    padding_stats.real_tokens = sum(result["real_tokens"] for result in results)
+    padding_stats.padded_tokens = sum(result["padded_tokens"] for result in results)
+    padding_stats.seconds = seconds
+
+    print(f"Test Accuracy: {report['accuracy'] * 100:.2f}%")
+    for label in range(2):
+        print(f"Label {label}: precision {report[label]['precision']:.4f}, recall {report[label]['recall']:.4f}, "
+              f"F1 {report[label]['f1']:.4f} (support {report[label]['support']})")
+    print(f"Macro F1: {report['macro_f1']:.4f}")
+    print(f"Confusion matrix (rows: true label, columns: predicted): {confusion}")
+    print(f"Evaluated {padding_stats.summary()}")
+    print(f"Misclassified examples saved to {args.output}")
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+import tempfile
+import torch
+from torch.utils.data import Dataset
+from transformers import RobertaConfig
+from models import RobertaWithoutAuxiliaryFeatures
+from dynamic_batching import DynamicPaddingCollator
+from fine_tune_codebert import DistillationTrainer, SoftTargetDataset, distillation_arguments, make_student, \
+    teacher_logits
+
+
+class RandomCode(Dataset):
+    """Fixed-length token sequences with random labels, shaped like TokenizedDataset items."""
+
+    def __init__(self, count=8, length=16, vocab_size=100):
+        generator = torch.Generator().manual_seed(0)
+        self.input_ids = torch.randint(3, vocab_size, (count, length), generator=generator)
+        self.labels = torch.randint(0, 2, (count,), generator=generator)
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __getitem__(self, idx):
+        return {"input_ids": self.input_ids[idx], "attention_mask": torch.ones_like(self.input_ids[idx]),
+                "labels": self.labels[idx]}
+
+
+def train_one_step(remove_unused_columns):
+    torch.manual_seed(0)
+    config = RobertaConfig(vocab_size=100, hidden_size=32, num_hidden_layers=4, num_attention_heads=2,
+                           intermediate_size=64, max_position_embeddings=40, num_labels=2)
+    teacher = RobertaWithoutAuxiliaryFeatures(config)
+    student = make_student(teacher, 2)
+    data = RandomCode()
+    train_data = SoftTargetDataset(data, teacher_logits(teacher, data))
+    with tempfile.TemporaryDirectory() as directory:
+        args = distillation_arguments(directory, max_steps=1, per_device_train_batch_size=4,
+                                      evaluation_strategy="no", save_strategy="no", load_best_model_at_end=False,
+                                      dataloader_num_workers=0, logging_dir=directory, fp16=False, use_cpu=True,
+                                      remove_unused_columns=remove_unused_columns)
+        trainer = DistillationTrainer(model=student, args=args, train_dataset=train_data,
+                                      data_collator=DynamicPaddingCollator())
+        trainer.train()
+    return trainer
+
+
+def test_training_step_includes_kl_term():
+    trainer = train_one_step(remove_unused_columns=False)
+    assert trainer.last_soft_loss is not None
+    assert trainer.last_soft_loss > 0
+
+
+def test_trainer_defaults_would_drop_teacher_logits():
+    # What distill_codebert trained on before remove_unused_columns was turned off: labels only
+    trainer = train_one_step(remove_unused_columns=True)
+    assert trainer.last_soft_loss is None
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"ok: {name}")
+    print("All distillation checks passed")
@@ -1,5 +1,5 @@
 import os
-from github import Github
+from github_client import GitHubClient
 
 # Fetch the GitHub token from environment variables
 GITHUB_TOKEN = os.getenv("GITHUB_TOKEN")
@@ -9,11 +9,11 @@ if not GITHUB_TOKEN:
     raise ValueError("GITHUB_TOKEN environment variable is not set! Please set it in your shell configuration.")
 
 # Authenticate using the GitHub token
-g = Github(GITHUB_TOKEN)
+client = GitHubClient(GITHUB_TOKEN)
 
 # Get repository details
 REPO_NAME = "ReetikaNEU/AI_Code_Review"
-repo = g.get_repo(REPO_NAME)
+repo, _ = client.get(f"/repos/{REPO_NAME}")
 
 # Print repository full name
-print(repo.full_name)
\ No newline at end of file
+print(repo["full_name"])
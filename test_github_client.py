@@ -0,0 +1,115 @@
+import json
+import os
+import sys
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from github_client import GitHubClient
+import storage
+
+# Recorded GitHub API responses by path: status, headers and JSON body
+PULLS = [{"number": number, "title": f"PR {number}", "user": {"login": "octocat"}, "head": {"sha": f"{number:040d}"}}
+         for number in (1, 2, 3)]
+RESPONSES = {
+    "/repos/owner/repo/pulls?state=open&sort=created&per_page=100": {
+        "headers": {"ETag": '"pulls-1"', "Link": '<{base}/repos/owner/repo/pulls?page=2>; rel="next"'},
+        "body": PULLS[:2]
+    },
+    "/repos/owner/repo/pulls?page=2": {"headers": {"ETag": '"pulls-2"'}, "body": PULLS[2:]},
+    "/repos/owner/repo/pulls/1/files?per_page=100": {
+        "headers": {"ETag": '"files-1"'},
+        "body": [{"filename": "app.py", "sha": "a" * 40, "status": "modified", "patch": "@@ -1 +1 @@"}]
+    },
+    # Answered with a secondary rate limit the first time it is requested
+    "/repos/owner/repo/pulls/2": {"headers": {"ETag": '"pull-2"'}, "body": PULLS[1], "limited_once": True},
+    "/repos/owner/repo/pulls/3": {"headers": {"ETag": '"pull-3"'}, "body": PULLS[2]},
+}
+
+
+class RecordedGitHub(BaseHTTPRequestHandler):
+    """Serves RESPONSES, honouring If-None-Match with 304s like the real API."""
+
+    requests = []
+    limited = set()
+
+    def do_GET(self):
+        self.requests.append(self.path)
+        recorded = RESPONSES.get(self.path)
+        if recorded is None:
+            self.send_response(404)
+            self.end_headers()
+            return
+        if recorded.get("limited_once") and self.path not in self.limited:
+            self.limited.add(self.path)
+            self.send_response(429)
+            self.send_header("Retry-After", "1")
+            self.end_headers()
+            return
+        headers = {name: value.format(base=self.server.base_url) for name, value in recorded["headers"].items()}
+        if self.headers.get("If-None-Match") == headers["ETag"]:
+            self.send_response(304)
+            self.send_header("ETag", headers["ETag"])
+            self.end_headers()
+            return
+        body = json.dumps(recorded["body"]).encode()
+        self.send_response(200)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("X-RateLimit-Remaining", "4999")
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def check(condition, message):
+    if not condition:
+        print(f"FAIL: {message}")
+        sys.exit(1)
+    print(f"ok: {message}")
+
+
+server = ThreadingHTTPServer(("127.0.0.1", 0), RecordedGitHub)
+server.base_url = f"http://127.0.0.1:{server.server_address[1]}"
+threading.Thread(target=server.serve_forever, daemon=True).start()
+
+with tempfile.TemporaryDirectory() as directory:
+    db_path = os.path.join(directory, "github.db")
+    client = GitHubClient(None, base_url=server.base_url, db_path=db_path)
+    repo = client.get_repo("owner/repo")
+
+    # Pagination follows the Link header
+    pulls = repo.get_pulls(state="open", sort="created")
+    check([pr.number for pr in pulls] == [1, 2, 3], "both pages of pull requests are listed")
+    check([f.filename for f in pulls[0].get_files()] == ["app.py"], "changed files are listed")
+
+    # A second run sends the stored ETags and is answered with 304s from the database
+    client = GitHubClient(None, base_url=server.base_url, db_path=db_path)
+    pulls = client.get_repo("owner/repo").get_pulls(state="open", sort="created")
+    check([pr.number for pr in pulls] == [1, 2, 3], "pull requests are served from the stored responses")
+    check(client.not_modified == 2, "unchanged pages come back as 304 Not Modified")
+
+    # A 429 is retried after Retry-After
+    pull = client.get_repo("owner/repo").get_pull(2)
+    check(pull.title == "PR 2", "rate-limited request succeeds on retry")
+    check(RecordedGitHub.requests.count("/repos/owner/repo/pulls/2") == 2, "rate-limited request is sent twice")
+
+    # Stored responses are evicted least-recently-used first once over the size limit
+    client = GitHubClient(None, base_url=server.base_url, db_path=db_path, cache_max_bytes=700)
+    client.get("/repos/owner/repo/pulls/1/files", {"per_page": 100})
+    client.get("/repos/owner/repo/pulls/2")
+    client.get("/repos/owner/repo/pulls/3")
+    conn = storage.get_connection(db_path)
+    urls = {url.replace(server.base_url, "") for url, in conn.execute("SELECT url FROM github_responses")}
+    total = conn.execute("SELECT SUM(size) FROM github_responses").fetchone()[0]
+    check(total <= 700, "stored responses stay within the size limit")
+    check({"/repos/owner/repo/pulls/2", "/repos/owner/repo/pulls/3"} <= urls, "recently used responses are kept")
+    check(len(urls) == 4 and "/repos/owner/repo/pulls?state=open&sort=created&per_page=100" not in urls,
+          "only the least recently used response is evicted")
+    storage.close_connections()
+
+server.shutdown()
+print("All GitHub client checks passed")
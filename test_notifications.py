@@ -0,0 +1,197 @@
+import os
+import socket
+import tempfile
+import threading
+from notifications import Outbox, NotificationDispatcher, SmtpSession
+
+
+class SmtpStub:
+    """
+    Minimal SMTP server on a local socket that records every message it accepts.
+    After `drop_after` messages on one connection it closes that connection, as a
+    server timing out an idle session would.
+    """
+
+    def __init__(self, drop_after=None):
+        self.drop_after = drop_after
+        self.messages = []
+        self.connections = 0
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind(("127.0.0.1", 0))
+        self.server.listen()
+        self.port = self.server.getsockname()[1]
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                client, _ = self.server.accept()
+            except OSError:
+                return
+            self.connections += 1
+            threading.Thread(target=self._session, args=(client,), daemon=True).start()
+
+    def _session(self, client):
+        stream = client.makefile("rb")
+        reply = lambda line: client.sendall(line.encode() + b"\r\n")
+        reply("220 localhost stub")
+        sender, recipients, accepted = None, [], 0
+        for raw in stream:
+            command = raw.decode().strip()
+            verb = command.split(" ", 1)[0].upper()
+            if verb in ("EHLO", "HELO"):
+                reply("250 localhost")
+            elif verb == "MAIL":
+                sender, recipients = command.split(":", 1)[1].strip("<> "), []
+                reply("250 OK")
+            elif verb == "RCPT":
+                recipients.append(command.split(":", 1)[1].strip("<> "))
+                reply("250 OK")
+            elif verb == "DATA":
+                reply("354 End data with <CR><LF>.<CR><LF>")
+                lines = []
+                for data in stream:
+                    if data in (b".\r\n", b".\n"):
+                        break
+                    lines.append(data.decode())
+                self.messages.append({"sender": sender, "recipients": recipients, "data": "".join(lines)})
+                reply("250 OK")
+                accepted += 1
+                if self.drop_after and accepted >= self.drop_after:
+                    break
+            elif verb == "RSET" or verb == "NOOP":
+                reply("250 OK")
+            elif verb == "QUIT":
+                reply("221 Bye")
+                break
+            else:
+                reply("502 Command not implemented")
+        client.close()
+
+    def close(self):
+        self.server.close()
+
+
+class FakeComment:
+    def __init__(self, comment_id, body):
+        self.id = comment_id
+        self.body = body
+
+    def edit(self, body):
+        self.body = body
+
+
+class FakePullRequest:
+    """Records the comment calls the dispatcher makes for one pull request."""
+
+    def __init__(self, repo, number):
+        self.repo = repo
+        self.number = number
+
+    def get_issue_comments(self):
+        return [comment for comment in self.repo.comments if comment.number == self.number]
+
+    def get_issue_comment(self, comment_id):
+        return next(comment for comment in self.repo.comments if comment.id == comment_id)
+
+    def create_issue_comment(self, body):
+        self.repo.calls.append(("create_issue_comment", self.number, body))
+        comment = FakeComment(len(self.repo.comments) + 1, body)
+        comment.number = self.number
+        self.repo.comments.append(comment)
+        return comment
+
+
+class FakeCommit:
+    def __init__(self, repo, sha):
+        self.repo = repo
+        self.sha = sha
+
+    def create_status(self, state, description, context):
+        self.repo.calls.append(("create_status", self.sha, state))
+
+
+class FakeRepository:
+    """Stand-in for the GitHub repository the dispatcher posts comments and statuses to."""
+
+    def __init__(self):
+        self.calls = []
+        self.comments = []
+
+    def get_pull(self, number):
+        return FakePullRequest(self, number)
+
+    def get_commit(self, sha):
+        return FakeCommit(self, sha)
+
+
+def smtp_session(stub):
+    return SmtpSession(host="127.0.0.1", port=stub.port, sender="reviews@example.com", starttls=False, timeout=5)
+
+
+def test_session_reuses_one_connection():
+    stub = SmtpStub()
+    session = smtp_session(stub)
+    for number in range(3):
+        session.send("author@example.com", f"PR #{number}", "Pylint score: 9.5/10")
+    session.close()
+    stub.close()
+    assert len(stub.messages) == 3
+    assert stub.connections == 1
+    assert stub.messages[0]["sender"] == "reviews@example.com"
+    assert "Subject: PR #2" in stub.messages[2]["data"]
+
+
+def test_session_reconnects_after_drop():
+    stub = SmtpStub(drop_after=1)
+    session = smtp_session(stub)
+    session.send("author@example.com", "first", "body")
+    session.send("author@example.com", "second", "body")
+    session.close()
+    stub.close()
+    assert len(stub.messages) == 2
+    assert stub.connections == 2
+
+
+def test_dispatcher_drains_queued_emails():
+    stub = SmtpStub()
+    with tempfile.TemporaryDirectory() as directory:
+        outbox = Outbox(os.path.join(directory, "outbox.db"))
+        dispatcher = NotificationDispatcher(outbox, repo=None, smtp=smtp_session(stub), poll_interval=0.05).start()
+        for number in range(5):
+            outbox.enqueue_email(f"author{number}@example.com", f"PR #{number}", "body")
+        dispatcher.notify()
+        dispatcher.stop(drain=True, timeout=10)
+        assert outbox.due_count() == 0
+    stub.close()
+    assert sorted(m["recipients"][0] for m in stub.messages) == [f"author{n}@example.com" for n in range(5)]
+
+
+def test_comments_and_statuses_merge_per_sha():
+    repo = FakeRepository()
+    with tempfile.TemporaryDirectory() as directory:
+        outbox = Outbox(os.path.join(directory, "outbox.db"))
+        # Several runs' worth of updates queue up before the dispatcher gets to them
+        for state in ["pending", "failure", "success"]:
+            outbox.enqueue_status("a" * 40, state, f"Pylint {state}")
+            outbox.enqueue_comment(1, f"Report: {state}")
+        outbox.enqueue_status("b" * 40, "pending", "Pylint pending")
+        outbox.enqueue_status("b" * 40, "success", "Pylint success")
+        dispatcher = NotificationDispatcher(outbox, repo, poll_interval=0.05).start()
+        dispatcher.notify()
+        dispatcher.stop(drain=True, timeout=10)
+        assert outbox.due_count() == 0
+    statuses = [call for call in repo.calls if call[0] == "create_status"]
+    comments = [call for call in repo.calls if call[0] == "create_issue_comment"]
+    # Only the newest status of each SHA and the newest comment body are sent
+    assert sorted(statuses) == [("create_status", "a" * 40, "success"), ("create_status", "b" * 40, "success")]
+    assert comments == [("create_issue_comment", 1, "Report: success")]
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"ok: {name}")
+    print("All notification checks passed")
@@ -1,25 +1,26 @@
-import json
+import sys
+from dataset_shards import iter_samples
 
-# Load the test dataset
-with open("test_dataset_augmented.json", "r") as f:
-    test_data = json.load(f)
+# Load the test dataset: a JSON file or a directory of shards
+test_data_path = sys.argv[1] if len(sys.argv) > 1 else "test_dataset_augmented.json"
 
-# Initialize counters for auxiliary features
-num_lines = []
-nested_if_count = []
-loop_count = []
+# Running count, sum, min and max of each auxiliary feature
+features = ["num_lines", "if_count", "nested_if_count", "loop_count"]
+stats = {name: {"sum": 0, "min": None, "max": None} for name in features}
+count = 0
 
-# Loop through the dataset to extract auxiliary features
-for item in test_data:
-    num_lines.append(item.get("num_lines", 0))
-    nested_if_count.append(item.get("nested_if_count", 0))
-    loop_count.append(item.get("loop_count", 0))
+# Stream through the dataset to extract auxiliary features
+for item in iter_samples(test_data_path):
+    count += 1
+    for name in features:
+        value = item.get(name, 0)
+        feature = stats[name]
+        feature["sum"] += value
+        feature["min"] = value if feature["min"] is None else min(feature["min"], value)
+        feature["max"] = value if feature["max"] is None else max(feature["max"], value)
 
 # Print distribution
-print(f"Number of samples: {len(test_data)}")
-print(f"Avg. num_lines: {sum(num_lines) / len(num_lines):.2f}, Min: {min(num_lines)}, Max: {max(num_lines)}")
-print(f"Avg. nested_if_count: {sum(nested_if_count) / len(nested_if_count):.2f}, Min: {min(nested_if_count)}, Max: {max(nested_if_count)}")
-print(f"Avg. loop_count: {sum(loop_count) / len(loop_count):.2f}, Min: {min(loop_count)}, Max: {max(loop_count)}")
-
-
-
+print(f"Number of samples: {count}")
+for name in features:
+    feature = stats[name]
+    print(f"Avg. {name}: {feature['sum'] / count:.2f}, Min: {feature['min']}, Max: {feature['max']}")
@@ -0,0 +1,138 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import numpy as np
+import torch
+from torch.utils.data import Dataset
+
+CACHE_ROOT = "token_cache"
+# `if_count` is the number of if statements the models were trained on; `nested_if_count` is now a nesting depth
+AUXILIARY_FEATURES = ["num_lines", "if_count", "loop_count"]
+
+
+def tokenizer_fingerprint(tokenizer):
+    """Identify a tokenizer by its class, name and vocabulary, so a retrained vocabulary never reuses a cache."""
+    digest = hashlib.sha256(f"{type(tokenizer).__name__}:{tokenizer.name_or_path}".encode())
+    digest.update(json.dumps(sorted(tokenizer.get_vocab().items())).encode())
+    return digest.hexdigest()
+
+
+def data_fingerprint(samples):
+    """SHA-256 over the code, label and auxiliary features of every sample, in order."""
+    digest = hashlib.sha256()
+    for sample in samples:
+        digest.update(json.dumps([sample["code"], sample["label"]] +
+                                 [sample.get(name, 0) for name in AUXILIARY_FEATURES]).encode())
+    return digest.hexdigest()
+
+
+def cache_dir_for(samples, tokenizer, max_length, root=CACHE_ROOT):
+    key = hashlib.sha256(
+        f"{tokenizer_fingerprint(tokenizer)}|{max_length}|{data_fingerprint(samples)}".encode()
+    ).hexdigest()
+    return os.path.join(root, key[:32])
+
+
+def build_token_cache(samples, tokenizer, max_length, cache_dir, batch_size=1000):
+    """
+    Tokenize `samples` once into memory-mapped .npy arrays in `cache_dir`:
+    input_ids (int32), attention_mask (int8), lengths, labels and auxiliary_features.
+    Rows are padded to `max_length`; `lengths` lets collators trim them per batch.
+    """
+    count = len(samples)
+    staging = cache_dir + ".partial"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+
+    def create(name, dtype, shape):
+        return np.lib.format.open_memmap(os.path.join(staging, f"{name}.npy"), mode="w+", dtype=dtype, shape=shape)
+
+    input_ids = create("input_ids", np.int32, (count, max_length))
+    attention_mask = create("attention_mask", np.int8, (count, max_length))
+    lengths = create("lengths", np.int32, (count,))
+    labels = create("labels", np.int64, (count,))
+    auxiliary = create("auxiliary_features", np.float32, (count, len(AUXILIARY_FEATURES)))
+
+    for start in range(0, count, batch_size):
+        batch = [samples[i] for i in range(start, min(start + batch_size, count))]
+        end = start + len(batch)
+        encoded = tokenizer([sample["code"] for sample in batch], max_length=max_length, truncation=True,
+                            padding="max_length", return_tensors="np")
+        input_ids[start:end] = encoded["input_ids"]
+        attention_mask[start:end] = encoded["attention_mask"]
+        lengths[start:end] = encoded["attention_mask"].sum(axis=1)
+        labels[start:end] = [int(sample["label"]) for sample in batch]
+        auxiliary[start:end] = [[sample.get(name, 0) for name in AUXILIARY_FEATURES] for sample in batch]
+
+    for array in (input_ids, attention_mask, lengths, labels, auxiliary):
+        array.flush()
+    with open(os.path.join(staging, "meta.json"), "w") as f:
+        json.dump({"samples": count, "max_length": max_length, "tokenizer": tokenizer.name_or_path,
+                   "auxiliary_features": AUXILIARY_FEATURES}, f, indent=4)
+
+    # Publish atomically so an interrupted run never leaves a half-written cache behind
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    os.replace(staging, cache_dir)
+    return cache_dir
+
+
+def get_token_cache(samples, tokenizer, max_length, root=CACHE_ROOT):
+    """Directory of the token cache for these samples, tokenizer and max_length, building it on first use."""
+    cache_dir = cache_dir_for(samples, tokenizer, max_length, root)
+    if os.path.exists(os.path.join(cache_dir, "meta.json")):
+        print(f"Using token cache {cache_dir}")
+    else:
+        print(f"Tokenizing {len(samples)} samples into {cache_dir}")
+        build_token_cache(samples, tokenizer, max_length, cache_dir)
+    return cache_dir
+
+
+class TokenizedDataset(Dataset):
+    """
+    Serves samples from a token cache without calling the tokenizer. The arrays are opened
+    copy-on-write memory maps, so items are zero-copy views and DataLoader workers share the
+    same page-cache pages instead of each holding a copy.
+    """
+
+    def __init__(self, cache_dir, auxiliary_features=True, start=0, stop=None):
+        # start/stop select a contiguous shard of the cache, e.g. for one evaluation worker
+        def load(name):
+            return np.load(os.path.join(cache_dir, f"{name}.npy"), mmap_mode="c")[start:stop]
+
+        self.cache_dir = cache_dir
+        self.input_ids = load("input_ids")
+        self.attention_mask = load("attention_mask")
+        self.lengths = load("lengths")
+        self.labels = load("labels")
+        self.auxiliary = load("auxiliary_features") if auxiliary_features else None
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __getitem__(self, idx):
+        item = {
+            "input_ids": torch.from_numpy(self.input_ids[idx]),
+            "attention_mask": torch.from_numpy(self.attention_mask[idx]),
+            "labels": torch.tensor(self.labels[idx])
+        }
+        if self.auxiliary is not None:
+            item["auxiliary_features"] = torch.from_numpy(self.auxiliary[idx])
+        return item
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pre-tokenize a prepared dataset into a memory-mapped token cache.")
+    parser.add_argument("--data", required=True, help="A JSON file or a directory of shards written by prepare_dataset.py.")
+    parser.add_argument("--tokenizer", default="microsoft/codebert-base")
+    parser.add_argument("--max-length", type=int, default=256)
+    parser.add_argument("--output", default=CACHE_ROOT, help="Root directory of the token caches.")
+    args = parser.parse_args()
+
+    from transformers import RobertaTokenizer
+    from dataset_shards import load_shards
+
+    cache_dir = get_token_cache(load_shards(args.data), RobertaTokenizer.from_pretrained(args.tokenizer),
+                                args.max_length, args.output)
+    print(f"Token cache ready in {cache_dir}")
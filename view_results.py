@@ -1,10 +1,9 @@
-import sqlite3
+import storage
 from tabulate import tabulate  # For pretty-printing tables (install with `pip install tabulate`)
 
 def fetch_results():
     """Fetch historical analysis results from the database."""
-    conn = sqlite3.connect("code_analysis.db")  # Connect to the database
-    cursor = conn.cursor()
+    cursor = storage.get_connection().cursor()
 
     # Query to fetch all records
     cursor.execute("""
@@ -24,9 +23,6 @@ def fetch_results():
     # Fetch all results
     rows = cursor.fetchall()
 
-    # Close the connection
-    conn.close()
-
     return rows
 
 
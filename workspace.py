@@ -0,0 +1,170 @@
+import base64
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import metrics
+
+
+class ApiBlobSource:
+    """Reads blobs through the GitHub API (`Repository.get_blobs`), several at a time."""
+
+    def __init__(self, repo):
+        self.repo = repo
+
+    def read_blobs(self, pr, shas):
+        return self.repo.get_blobs(shas)
+
+    def close(self):
+        pass
+
+
+class GitObjectStore:
+    """
+    Local bare git repository that fetches each pull request's head and serves blobs through one
+    long-running `git cat-file --batch` process. The store persists between runs, so only new
+    objects are downloaded.
+    """
+
+    def __init__(self, path, remote_url, token=None):
+        self.path = path
+        self.remote_url = remote_url
+        self.token = token
+        self.process = None
+        # One cat-file process and one fetch at a time; workspaces call in from several pipeline threads
+        self._cat_file_lock = threading.Lock()
+        self._fetch_lock = threading.Lock()
+        if not os.path.isdir(path):
+            subprocess.run(["git", "init", "--quiet", "--bare", path], check=True)
+
+    def _git(self, *args):
+        command = ["git", f"--git-dir={self.path}"]
+        if self.token:
+            # Sent as a header like actions/checkout does, so the token is never written to the store's config
+            credentials = base64.b64encode(f"x-access-token:{self.token}".encode()).decode()
+            command += ["-c", f"http.extraheader=AUTHORIZATION: basic {credentials}"]
+        return subprocess.run(command + list(args), check=True, capture_output=True)
+
+    def fetch(self, pr_number):
+        with self._fetch_lock, metrics.timer("github_api_seconds", call="git_fetch"):
+            self._git("fetch", "--quiet", "--no-tags", "--depth=1", self.remote_url,
+                      f"+refs/pull/{pr_number}/head:refs/pull/{pr_number}/head")
+
+    def _cat_file(self, shas):
+        with self._cat_file_lock:
+            return self._cat_file_locked(shas)
+
+    def _cat_file_locked(self, shas):
+        if self.process is None:
+            self.process = subprocess.Popen(["git", f"--git-dir={self.path}", "cat-file", "--batch"],
+                                            stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        self.process.stdin.write("".join(f"{sha}\n" for sha in shas).encode())
+        self.process.stdin.flush()
+        blobs = {}
+        for sha in shas:
+            header = self.process.stdout.readline().split()
+            if len(header) < 3 or header[1] == b"missing":
+                continue
+            blobs[sha] = self.process.stdout.read(int(header[2]))
+            self.process.stdout.read(1)  # trailing newline
+        return blobs
+
+    def read_blobs(self, pr, shas):
+        blobs = self._cat_file(shas)
+        missing = [sha for sha in shas if sha not in blobs]
+        if missing:
+            self.fetch(pr.number)
+            blobs.update(self._cat_file(missing))
+        return blobs
+
+    def close(self):
+        if self.process is not None:
+            self.process.stdin.close()
+            self.process.wait()
+            self.process = None
+
+
+def _default_root():
+    # Prefer RAM-backed storage: staged files are written once and read by Pylint and the model right away
+    return "/dev/shm" if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK) else None
+
+
+class Workspace:
+    """
+    Temporary directory (on tmpfs when available) holding the changed files of each pull request as
+    they are at its head commit, so Pylint and the model never read the local checkout. Blobs are
+    deduplicated by SHA: a file shared by several PRs is read from `source` and written only once,
+    then hard-linked into each PR's tree.
+    """
+
+    def __init__(self, source, root=None):
+        self.source = source
+        self.root = tempfile.mkdtemp(prefix="pr-workspace-", dir=root or _default_root())
+        self.blob_dir = os.path.join(self.root, "blobs")
+        os.makedirs(self.blob_dir)
+        self.blobs = set()
+        self.blobs_read = 0
+        # Blobs some thread is reading right now; others needing them wait on its event
+        self._reading = {}
+        self._lock = threading.Lock()
+
+    def stage(self, pr, files):
+        """
+        Materialize `files` (objects with `filename` and blob `sha`) of a pull request at its head.
+        Returns {filename: staged path}; files whose blob could not be read are left out.
+        """
+        # The lock only guards the bookkeeping, so several pull requests fetch their blobs concurrently
+        with self._lock:
+            needed = list(dict.fromkeys(file.sha for file in files if file.sha not in self.blobs))
+            waiting = [self._reading[sha] for sha in needed if sha in self._reading]
+            missing = [sha for sha in needed if sha not in self._reading]
+            done = threading.Event()
+            for sha in missing:
+                self._reading[sha] = done
+
+        if missing:
+            read = []
+            try:
+                with metrics.timer("analyzer_stage_seconds", stage="fetch_contents"):
+                    contents = self.source.read_blobs(pr, missing)
+                for sha, content in contents.items():
+                    with open(os.path.join(self.blob_dir, sha), "wb") as f:
+                        f.write(content)
+                    read.append(sha)
+            finally:
+                with self._lock:
+                    self.blobs.update(read)
+                    self.blobs_read += len(read)
+                    for sha in missing:
+                        del self._reading[sha]
+                done.set()
+            metrics.increment("blobs_read_total", len(read))
+        for event in waiting:
+            event.wait()
+
+        pr_dir = os.path.join(self.root, f"pr-{pr.number}-{pr.head.sha[:12]}")
+        paths = {}
+        for file in files:
+            if file.sha not in self.blobs:
+                print(f"Could not read {file.filename} at {pr.head.sha[:12]}")
+                continue
+            path = os.path.join(pr_dir, file.filename)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if not os.path.exists(path):
+                try:
+                    os.link(os.path.join(self.blob_dir, file.sha), path)
+                except OSError:
+                    shutil.copyfile(os.path.join(self.blob_dir, file.sha), path)
+            paths[file.filename] = path
+        return paths
+
+    def close(self):
+        self.source.close()
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()